@@ -0,0 +1,33 @@
+"""Delayed tasks: run_at column and pending run_at index
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "002"
+down_revision = "001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tasks", sa.Column("run_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_index(
+        "ix_tasks_pending_run_at",
+        "tasks",
+        ["run_at"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_pending_run_at", table_name="tasks")
+    op.drop_column("tasks", "run_at")
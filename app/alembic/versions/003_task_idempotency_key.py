@@ -0,0 +1,30 @@
+"""Idempotency keys on task creation
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "003"
+down_revision = "002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tasks", sa.Column("idempotency_key", sa.String(length=255), nullable=True)
+    )
+    op.create_index(
+        "ix_tasks_idempotency_key", "tasks", ["idempotency_key"], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_idempotency_key", table_name="tasks")
+    op.drop_column("tasks", "idempotency_key")
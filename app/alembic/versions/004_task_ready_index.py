@@ -0,0 +1,32 @@
+"""Ready-task index for the Postgres queue mode
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "004"
+down_revision = "003"
+branch_labels = None
+depends_on = None
+
+# Должно совпадать с app.db.models.task.PRIORITY_RANK_SQL
+PRIORITY_RANK_SQL = "CASE priority WHEN 'HIGH' THEN 0 WHEN 'MEDIUM' THEN 1 ELSE 2 END"
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_tasks_ready",
+        "tasks",
+        [sa.text(f"({PRIORITY_RANK_SQL})"), "created_at"],
+        postgresql_where=sa.text("status = 'NEW'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_ready", table_name="tasks")
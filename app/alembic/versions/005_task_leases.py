@@ -0,0 +1,45 @@
+"""Task leases and heartbeats for IN_PROGRESS tasks
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "005"
+down_revision = "004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tasks",
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column("tasks", sa.Column("lease_owner", sa.String(255), nullable=True))
+    op.add_column(
+        "tasks",
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "tasks", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_index(
+        "ix_tasks_lease_expires_at",
+        "tasks",
+        ["lease_expires_at"],
+        postgresql_where=sa.text("status = 'IN_PROGRESS'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_lease_expires_at", table_name="tasks")
+    op.drop_column("tasks", "heartbeat_at")
+    op.drop_column("tasks", "lease_expires_at")
+    op.drop_column("tasks", "lease_owner")
+    op.drop_column("tasks", "attempts")
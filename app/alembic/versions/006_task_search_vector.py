@@ -0,0 +1,38 @@
+"""Full-text search over task title and description
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "006"
+down_revision = "005"
+branch_labels = None
+depends_on = None
+
+# Должно совпадать с app.db.models.task.SEARCH_VECTOR_SQL
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    # Генерируемый STORED-столбец пересчитывается Postgres при каждой записи
+    # (нужен Postgres 12+); добавление переписывает таблицу
+    op.execute(
+        "ALTER TABLE tasks ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    )
+    op.execute(
+        "CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_search_vector", table_name="tasks")
+    op.drop_column("tasks", "search_vector")
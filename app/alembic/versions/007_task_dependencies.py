@@ -0,0 +1,48 @@
+"""Task dependencies: edge table and pending dependency counter
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "007"
+down_revision = "006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tasks",
+        sa.Column(
+            "pending_dependencies", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    # Первичный ключ (parent_id, child_id) служит и индексом для поиска
+    # зависимых задач завершённой задачи
+    op.create_table(
+        "task_dependencies",
+        sa.Column(
+            "parent_id",
+            sa.Integer(),
+            sa.ForeignKey("tasks.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "child_id",
+            sa.Integer(),
+            sa.ForeignKey("tasks.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("parent_id", "child_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("task_dependencies")
+    op.drop_column("tasks", "pending_dependencies")
@@ -0,0 +1,56 @@
+"""Task memoization: input hash, reused task and memo indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "008"
+down_revision = "007"
+branch_labels = None
+depends_on = None
+
+# Должны совпадать с app.db.models.task.MEMO_LEADER_SQL и MEMO_RESULT_SQL
+MEMO_LEADER_SQL = (
+    "input_hash IS NOT NULL AND memo_of IS NULL "
+    "AND status IN ('NEW', 'IN_PROGRESS')"
+)
+MEMO_RESULT_SQL = "input_hash IS NOT NULL AND memo_of IS NULL AND status = 'COMPLETED'"
+
+
+def upgrade() -> None:
+    op.add_column("tasks", sa.Column("input_hash", sa.String(64), nullable=True))
+    op.add_column(
+        "tasks",
+        sa.Column(
+            "memo_of",
+            sa.Integer(),
+            sa.ForeignKey("tasks.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_tasks_memo_leader",
+        "tasks",
+        ["input_hash"],
+        unique=True,
+        postgresql_where=sa.text(MEMO_LEADER_SQL),
+    )
+    op.create_index(
+        "ix_tasks_memo_result",
+        "tasks",
+        ["input_hash", "finished_at"],
+        postgresql_where=sa.text(MEMO_RESULT_SQL),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_memo_result", table_name="tasks")
+    op.drop_index("ix_tasks_memo_leader", table_name="tasks")
+    op.drop_column("tasks", "memo_of")
+    op.drop_column("tasks", "input_hash")
@@ -0,0 +1,28 @@
+"""Task progress reported by handlers
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "009"
+down_revision = "008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("tasks", sa.Column("progress", sa.Float(), nullable=True))
+    op.add_column(
+        "tasks", sa.Column("progress_message", sa.String(255), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("tasks", "progress_message")
+    op.drop_column("tasks", "progress")
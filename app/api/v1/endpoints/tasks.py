@@ -1,14 +1,52 @@
 from collections.abc import Sequence
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query
-from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.status import (
+    HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_429_TOO_MANY_REQUESTS,
+)
 
+from app.core.config import settings
 from app.db.models.task import Status
-from app.db.session import get_db
-from app.repositories.task_repository import TaskRepository
-from app.schemas.task import TaskCreate, TaskRead, TaskStatus
+from app.db.session import get_db, get_read_db, get_read_session_factory
+from app.repositories.task_repository import DependencyNotFound, TaskRepository
+from app.schemas.task import (
+    CountMode,
+    ExportFormat,
+    TaskBulkCancel,
+    TaskBulkCancelResult,
+    TaskCreate,
+    TaskRead,
+    TaskStatus,
+)
+from app.services.admission import get_admission_controller
+from app.services.export import MEDIA_TYPES, export_tasks
+from app.services.http_cache import (
+    CachedResponse,
+    get_task_response_cache,
+    remember,
+    task_responses,
+)
+from app.services.idempotency import get_idempotency_cache
+from app.services.memoization import record_memo_outcome
+from app.services.messages import TaskMessage
+from app.services.task_counts import count_tasks
 from app.services.task_processor import get_task_processor
 
 router = APIRouter(
@@ -20,6 +58,46 @@ router = APIRouter(
     },
 )
 
+CONDITIONAL_RESPONSES = {
+    HTTP_304_NOT_MODIFIED: {"description": "Not modified since the given validators"}
+}
+
+
+async def _task_response(
+    view: str,
+    schema: type[BaseModel],
+    task_id: int,
+    session_factory: async_sessionmaker[AsyncSession],
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+) -> Response:
+    """
+    Serve a task view with ETag/Last-Modified validators, answering 304 when
+    they match. Views of terminal tasks never change and are served from the
+    in-process cache without opening a database session.
+    """
+    key = (view, task_id)
+    cached = get_task_response_cache().get(key)
+    hit = cached is not None
+    if cached is None:
+        async with session_factory() as db:
+            task = await TaskRepository(db).get_by_id(task_id)
+        if not task:
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Task not found")
+        cached = CachedResponse.build(
+            schema.model_validate(task),
+            task.status,
+            task.finished_at or task.started_at or task.created_at,
+        )
+        remember(key, cached)
+    response = cached.respond(if_none_match, if_modified_since)
+    task_responses.inc(
+        view=view,
+        cache="hit" if hit else "miss",
+        code=str(response.status_code),
+    )
+    return response
+
 
 @router.post(
     "",
@@ -27,12 +105,33 @@ router = APIRouter(
     status_code=HTTP_201_CREATED,
     summary="Create a new task",
     description="Create a task with title, description and priority. "
-    "The task is persisted with status NEW and enqueued for background processing.",
+    "The task is persisted with status NEW and enqueued for background processing. "
+    "If run_at is in the future, the task is stored as PENDING and enqueued "
+    "by the scheduler when it is due. With depends_on the task waits as PENDING "
+    "until all listed tasks complete and is cancelled if any of them fails or "
+    "is cancelled. With memoize a task identical to one completed within "
+    "MEMOIZATION_TTL is returned COMPLETED with its result, and one identical to "
+    "a queued or running task waits for it instead of running. Repeating a "
+    "request with the same Idempotency-Key returns the original task without "
+    "creating a new one. Under overload the request is rejected with 429 and a "
+    "Retry-After header; "
+    "thresholds are per priority, so HIGH tasks are admitted longest.",
     response_description="The created task with its assigned ID and status",
+    responses={
+        HTTP_429_TOO_MANY_REQUESTS: {
+            "description": "Service is overloaded, retry after Retry-After seconds"
+        }
+    },
 )
 async def create_task(
     payload: TaskCreate,
     background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(
+        None,
+        alias="Idempotency-Key",
+        max_length=255,
+        description="Client-generated key that makes retries safe",
+    ),
     db: AsyncSession = Depends(get_db),
 ) -> TaskRead:
     """
@@ -41,13 +140,56 @@ async def create_task(
     - **title**: task title
     - **description**: detailed description
     - **priority**: task priority (LOW, MEDIUM, HIGH)
+    - **run_at**: optional moment to start the task at
+    - **depends_on**: optional ids of tasks that must complete first
+    - **memoize**: reuse the result of an identical task
+    - **Idempotency-Key** header: repeated keys return the original task
     """
+    cache = get_idempotency_cache()
+    if idempotency_key is not None:
+        cached = cache.get(idempotency_key)
+        if cached is not None:
+            return cached
+
+    # Admission control: shed new work before it touches the database
+    if settings.ADMISSION_ENABLED:
+        retry_after = await get_admission_controller().check(payload.priority)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=HTTP_429_TOO_MANY_REQUESTS,
+                detail="Service is overloaded, retry later",
+                headers={"Retry-After": str(retry_after)},
+            )
+
     repository = TaskRepository(db)
-    task = await repository.create(payload)
+    try:
+        if idempotency_key is None:
+            task = await repository.create(payload, memo_ttl=settings.MEMOIZATION_TTL)
+        else:
+            task, created = await repository.create_idempotent(
+                payload,
+                idempotency_key,
+                settings.IDEMPOTENCY_KEY_TTL,
+                memo_ttl=settings.MEMOIZATION_TTL,
+            )
+            if not created:
+                return task
+            cache.set(idempotency_key, TaskRead.model_validate(task))
+    except DependencyNotFound as exc:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(exc))
+    if task.input_hash is not None:
+        record_memo_outcome(task)
 
-    # Enqueue task for background processing
-    processor = get_task_processor()
-    background_tasks.add_task(processor.enqueue, str(task.id))
+    # Enqueue task for background processing; delayed tasks go via the scheduler,
+    # tasks waiting for dependencies are enqueued by the worker completing the last one
+    if task.status == Status.NEW:
+        processor = get_task_processor()
+        background_tasks.add_task(
+            processor.enqueue,
+            str(task.id),
+            task.priority,
+            TaskMessage.from_task(task),
+        )
 
     return task
 
@@ -57,22 +199,81 @@ async def create_task(
     response_model=list[TaskRead],
     summary="List tasks",
     description="Retrieve tasks with optional filtering by status or priority, "
-    "and pagination (skip/limit).",
+    "and pagination (skip/limit). Served from the read replica when one is "
+    "configured; send X-Read-Your-Writes: true to read from the primary. "
+    "With count=exact|estimated|cached the response carries X-Total-Count. "
+    "q searches title and description; results are then ranked by relevance.",
     response_description="List of tasks",
 )
 async def list_tasks(
+    response: Response,
     status: Optional[Status] = Query(None, description="Filter by task status"),
     priority: Optional[str] = Query(None, description="Filter by task priority"),
     skip: int = Query(0, ge=0, description="Number of items to skip"),
     limit: int = Query(100, gt=0, description="Maximum number of items to return"),
-    db: AsyncSession = Depends(get_db),
+    q: Optional[str] = Query(
+        None,
+        min_length=1,
+        max_length=255,
+        description="Full-text search in title and description "
+        '(supports "quoted phrases", or, -excluded words)',
+    ),
+    count: Optional[CountMode] = Query(
+        None,
+        description="Add X-Total-Count: exact (COUNT(*), slow on large tables), "
+        "estimated (planner statistics) or cached (exact, reused for a while)",
+    ),
+    db: AsyncSession = Depends(get_read_db),
 ) -> Sequence[TaskRead]:
     """
-    Return list of tasks filtered by status and/or priority.
+    Return list of tasks filtered by status and/or priority, optionally
+    matching a search query.
     """
+    q = (q or "").strip() or None
     repository = TaskRepository(db)
-    return await repository.get_all(
-        status=status, priority=priority, skip=skip, limit=limit
+    tasks = await repository.get_all(
+        status=status, priority=priority, skip=skip, limit=limit, q=q
+    )
+    if count is not None:
+        total = await count_tasks(repository, count, status, priority, q)
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Total-Count-Mode"] = count.value
+    return tasks
+
+
+@router.get(
+    "/export",
+    summary="Export tasks",
+    description="Stream all tasks matching the filters as NDJSON (one JSON object "
+    "per line) or CSV, ordered by id. Rows are read in keyset batches, each in "
+    "its own short session closed before the rows are sent, so memory stays "
+    "constant and a slow client holds no cursor or transaction open.",
+    response_description="Stream of tasks",
+    response_class=StreamingResponse,
+)
+async def export_tasks_endpoint(
+    export_format: ExportFormat = Query(
+        ExportFormat.NDJSON, alias="format", description="ndjson or csv"
+    ),
+    status: Optional[Status] = Query(None, description="Filter by task status"),
+    priority: Optional[str] = Query(None, description="Filter by task priority"),
+    q: Optional[str] = Query(
+        None, min_length=1, max_length=255, description="Full-text search"
+    ),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        get_read_session_factory
+    ),
+) -> StreamingResponse:
+    """
+    Export tasks as a stream.
+    """
+    q = (q or "").strip() or None
+    return StreamingResponse(
+        export_tasks(session_factory, export_format, status, priority, q),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="tasks.{export_format.value}"'
+        },
     )
 
 
@@ -80,23 +281,63 @@ async def list_tasks(
     "/{task_id}",
     response_model=TaskRead,
     summary="Get task details",
-    description="Retrieve detailed information of a specific task by its ID.",
+    description="Retrieve detailed information of a specific task by its ID. "
+    "Send X-Read-Your-Writes: true right after creating or changing the task "
+    "to bypass the read replica. The response carries ETag and Last-Modified; "
+    "send If-None-Match (or If-Modified-Since) to get 304 when nothing changed. "
+    "Completed, failed and cancelled tasks never change and are cacheable "
+    "for TASK_HTTP_CACHE_MAX_AGE seconds.",
     response_description="Task details",
+    responses=CONDITIONAL_RESPONSES,
 )
 async def get_task(
     task_id: int = Path(..., description="Unique identifier of the task"),
-    db: AsyncSession = Depends(get_db),
-) -> TaskRead:
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        get_read_session_factory
+    ),
+) -> Response:
     """
     Get complete task information.
     """
-    repository = TaskRepository(db)
-    task = await repository.get_by_id(task_id)
+    return await _task_response(
+        "task", TaskRead, task_id, session_factory, if_none_match, if_modified_since
+    )
 
-    if not task:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Task not found")
 
-    return task
+@router.post(
+    "/cancel",
+    response_model=TaskBulkCancelResult,
+    summary="Cancel many tasks",
+    description="Cancel every NEW, PENDING or IN_PROGRESS task matching all given "
+    "criteria (ids, status, priority, created_before) in a single UPDATE. "
+    "Workers are told about the cancelled ids and drop their queued messages "
+    "without a database lookup.",
+    response_description="Number and ids of the cancelled tasks",
+)
+async def cancel_tasks(
+    payload: TaskBulkCancel,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+) -> TaskBulkCancelResult:
+    """
+    Cancel tasks in bulk.
+
+    - **ids**: explicit task ids
+    - **status** / **priority**: filters
+    - **created_before**: only tasks created before this moment
+    """
+    repository = TaskRepository(db)
+    cancelled = await repository.cancel_many(
+        ids=payload.ids,
+        status=payload.status,
+        priority=payload.priority,
+        created_before=payload.created_before,
+    )
+    processor = get_task_processor()
+    background_tasks.add_task(processor.publish_cancellations, cancelled)
+    return TaskBulkCancelResult(cancelled=len(cancelled), ids=cancelled)
 
 
 @router.delete(
@@ -108,6 +349,7 @@ async def get_task(
     response_description="New task status",
 )
 async def cancel_task(
+    background_tasks: BackgroundTasks,
     task_id: int = Path(..., description="Unique identifier of the task to cancel"),
     db: AsyncSession = Depends(get_db),
 ) -> TaskStatus:
@@ -122,6 +364,8 @@ async def cancel_task(
             status_code=HTTP_400_BAD_REQUEST, detail="Cannot cancel task"
         )
 
+    processor = get_task_processor()
+    background_tasks.add_task(processor.publish_cancellations, [task.id])
     return TaskStatus(status=task.status)
 
 
@@ -130,20 +374,22 @@ async def cancel_task(
     response_model=TaskStatus,
     summary="Get task status",
     description="Retrieve the current status of a task without loading all its "
-    "details.",
+    "details, with the progress last reported by its handler while it runs. "
+    "Supports If-None-Match/If-Modified-Since like the task details endpoint.",
     response_description="Current status of the task",
+    responses=CONDITIONAL_RESPONSES,
 )
 async def get_task_status(
     task_id: int = Path(..., description="Unique identifier of the task"),
-    db: AsyncSession = Depends(get_db),
-) -> TaskStatus:
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        get_read_session_factory
+    ),
+) -> Response:
     """
-    Return only the task status.
+    Return only the task status and progress.
     """
-    repository = TaskRepository(db)
-    task = await repository.get_by_id(task_id)
-
-    if not task:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Task not found")
-
-    return TaskStatus(status=task.status)
+    return await _task_response(
+        "status", TaskStatus, task_id, session_factory, if_none_match, if_modified_since
+    )
@@ -1,13 +1,173 @@
+"""Общая настройка логирования для API и воркера.
+
+structlog только собирает событие; JSON рендерится и пишется в stdout
+отдельным потоком (``QueueHandler`` -> ``QueueListener``), так что запись
+логов не блокирует event loop. Частые info-события можно прореживать
+(``LOG_SAMPLE_RATES``) и ограничивать по частоте (``LOG_RATE_LIMITS``).
+"""
+
+import atexit
 import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+import structlog
+from structlog import get_logger
+from structlog.processors import JSONRenderer, TimeStamper, format_exc_info
+from structlog.stdlib import LoggerFactory, ProcessorFormatter
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+log_events_dropped = metrics.counter(
+    "log_events_dropped_total",
+    "Log events dropped by sampling, rate limit or full queue",
+)
+
+# Прореживаются только эти уровни; предупреждения и ошибки пишутся всегда
+SAMPLED_LEVELS = frozenset({"debug", "info"})
+
+_listener: Optional[QueueListener] = None
+
+
+def parse_event_limits(value: str) -> dict[str, float]:
+    """``Received task:0.01,Task processed:100`` -> {событие: значение}."""
+    limits = {}
+    for part in value.split(","):
+        if part.strip():
+            event, limit = part.rsplit(":", 1)
+            limits[event.strip()] = float(limit)
+    return limits
+
+
+class EventSampler:
+    """Процессор structlog: выборка и ограничение частоты по имени события.
+
+    ``sample_rates`` — доля событий, которая пишется (0.01 — каждое сотое
+    в среднем); ``rate_limits`` — не больше N событий в секунду, остальные в
+    этой секунде отбрасываются. К записанным прореженным событиям добавляется
+    ``sample_rate``, чтобы по логам можно было оценить исходное число событий.
+    """
+
+    def __init__(
+        self,
+        sample_rates: dict[str, float],
+        rate_limits: dict[str, float],
+    ) -> None:
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        # событие -> (начало текущей секунды, событий в ней)
+        self._windows: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def _over_limit(self, event: str, limit: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            started, count = self._windows.get(event, (now, 0))
+            if now - started >= 1.0:
+                started, count = now, 0
+            self._windows[event] = (started, count + 1)
+        return count >= limit
+
+    def __call__(
+        self, logger: Any, method_name: str, event_dict: dict[str, Any]
+    ) -> dict[str, Any]:
+        if method_name not in SAMPLED_LEVELS:
+            return event_dict
+        event = event_dict.get("event")
+        rate = self.sample_rates.get(event)
+        if rate is not None and rate < 1:
+            if random.random() >= rate:
+                log_events_dropped.inc(event=event, reason="sampled")
+                raise structlog.DropEvent
+            event_dict["sample_rate"] = rate
+        limit = self.rate_limits.get(event)
+        if limit is not None and self._over_limit(event, limit):
+            log_events_dropped.inc(event=event, reason="rate_limited")
+            raise structlog.DropEvent
+        return event_dict
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный ``prepare`` форматирует запись до постановки в очередь,
+    то есть на event loop; здесь запись уходит как есть, а рендерит её
+    ``ProcessorFormatter`` в потоке слушателя. При переполненной очереди
+    запись отбрасывается, а не блокирует вызывающего.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_events_dropped.inc(event="", reason="queue_full")
+
+
+def init_logging(
+    level: str = settings.LOG_LEVEL,
+    sample_rates: Optional[dict[str, float]] = None,
+    rate_limits: Optional[dict[str, float]] = None,
+    queue_size: int = settings.LOG_QUEUE_SIZE,
+) -> None:
+    """Настроить structlog и фоновую запись логов (повторный вызов — no-op)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if sample_rates is None:
+        sample_rates = parse_event_limits(settings.LOG_SAMPLE_RATES)
+    if rate_limits is None:
+        rate_limits = parse_event_limits(settings.LOG_RATE_LIMITS)
+    sampler = EventSampler(sample_rates, rate_limits)
+    structlog.configure(
+        logger_factory=LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        processors=[
+            structlog.stdlib.filter_by_level,
+            sampler,
+            structlog.stdlib.add_log_level,
+            TimeStamper(fmt="iso"),
+            # Трейсбек доступен только в потоке, где поймано исключение,
+            # поэтому его приходится форматировать здесь (редкий путь ошибок)
+            format_exc_info,
+            ProcessorFormatter.wrap_for_formatter,
+        ],
+        cache_logger_on_first_use=True,
+    )
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(
+        ProcessorFormatter(
+            processor=JSONRenderer(),
+            # Записи не из structlog (uvicorn, sqlalchemy) — тоже в JSON
+            foreign_pre_chain=[structlog.stdlib.add_log_level, TimeStamper(fmt="iso")],
+        )
+    )
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    root.handlers = [BackgroundQueueHandler(log_queue)]
+    root.setLevel(level.upper())
 
-from structlog import configure, get_logger
-from structlog.processors import JSONRenderer
-from structlog.stdlib import LoggerFactory
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
 
 
-def init_logging() -> None:
-    logging.basicConfig(level=logging.INFO)
-    configure(logger_factory=LoggerFactory(), processors=[JSONRenderer()])
+def shutdown_logging() -> None:
+    """Дописать оставшиеся в очереди записи и остановить поток логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 logger = get_logger()
@@ -0,0 +1,234 @@
+"""Простые метрики процесса (счётчики, значения, гистограммы).
+
+Без внешних зависимостей: значения хранятся в памяти процесса и
+отдаются снимком (для логов) или в текстовом формате Prometheus.
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from typing import Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _key(labels: dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+
+def _render_labels(key: LabelKey, extra: Optional[tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def snapshot(self) -> dict:
+        return {
+            _render_labels(key) or "total": value
+            for key, value in self._values.items()
+        }
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_render_labels(key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[_key(labels)] = value
+
+
+class Histogram:
+    def __init__(
+        self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._counts: dict[LabelKey, list[int]] = {}
+        self._sums: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(_key(labels), []))
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        counts = self._counts.get(_key(labels))
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        result = {}
+        for key in self._counts:
+            labels = dict(key)
+            count = self.count(**labels)
+            result[_render_labels(key) or "total"] = {
+                "count": count,
+                "avg": round(self._sums[key] / count, 6) if count else 0.0,
+                "p50": self.quantile(0.5, **labels),
+                "p99": self.quantile(0.99, **labels),
+            }
+        return result
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(
+                    f"{self.name}_bucket{_render_labels(key, ('le', le))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_render_labels(key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_render_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def _get_or_create(self, cls: type, name: str, description: str, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, description, **kwargs)
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str, **kwargs) -> Histogram:
+        return self._get_or_create(Histogram, name, description, **kwargs)
+
+    def snapshot(self) -> dict:
+        """Текущие значения всех метрик (для логов)."""
+        return {
+            name: metric.snapshot()
+            for name, metric in self._metrics.items()
+            if metric.snapshot()
+        }
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for name, metric in self._metrics.items():
+            kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[
+                type(metric)
+            ]
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class LatencyTracker:
+    """Скользящее среднее (EWMA) задержки за последние секунды.
+
+    Если замеров не было дольше ``window`` секунд, значение считается
+    устаревшим и равно нулю: иначе одна медленная минута навсегда
+    запомнилась бы как перегрузка.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: float = 10.0) -> None:
+        self.alpha = alpha
+        self.window = window
+        self._value = 0.0
+        self._updated_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            if self._updated_at is None or self.value_is_stale():
+                self._value = seconds
+            else:
+                self._value += self.alpha * (seconds - self._value)
+            self._updated_at = time.monotonic()
+
+    def value_is_stale(self) -> bool:
+        return (
+            self._updated_at is None
+            or time.monotonic() - self._updated_at > self.window
+        )
+
+    @property
+    def value(self) -> float:
+        return 0.0 if self.value_is_stale() else self._value
+
+
+# Задержка запросов к БД этого процесса (см. app.db.session.instrument_engine)
+db_latency = LatencyTracker()
+# Ожидание соединения из пула БД обработчиками воркера
+db_pool_wait = LatencyTracker()
+
+
+class MetricsReporter:
+    """Периодически пишет снимок метрик в лог (для процессов без /metrics)."""
+
+    def __init__(self, interval: float, registry: MetricsRegistry = metrics) -> None:
+        self.interval = interval
+        self.registry = registry
+        self._stopped = asyncio.Event()
+
+    async def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            snapshot = self.registry.snapshot()
+            if snapshot:
+                logger.info("Metrics", **snapshot)
+
+    def stop(self) -> None:
+        self._stopped.set()
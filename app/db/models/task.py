@@ -1,7 +1,19 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import DateTime, Enum, Integer, String, Text
+from sqlalchemy import (
+    DDL,
+    DateTime,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    event,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -23,8 +35,73 @@ class Status(enum.Enum):
     CANCELLED = "CANCELLED"
 
 
+# Порядок выборки из очереди: HIGH -> MEDIUM -> LOW. Выражение одно и то же
+# в индексе и в запросе, чтобы планировщик Postgres мог использовать индекс
+PRIORITY_RANK_SQL = "CASE priority WHEN 'HIGH' THEN 0 WHEN 'MEDIUM' THEN 1 ELSE 2 END"
+
+# Полнотекстовый поиск (только Postgres): конфигурация без стемминга, чтобы
+# одинаково искать по русским и английским словам; заголовок весомее описания
+SEARCH_CONFIG = "simple"
+SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')"
+)
+
+# Мемоизация: задача, которая выполняется за все дубликаты, и задачи,
+# чей результат можно переиспользовать (посчитанные, а не взятые из кэша)
+MEMO_LEADER_SQL = (
+    "input_hash IS NOT NULL AND memo_of IS NULL "
+    "AND status IN ('NEW', 'IN_PROGRESS')"
+)
+MEMO_RESULT_SQL = "input_hash IS NOT NULL AND memo_of IS NULL AND status = 'COMPLETED'"
+
+# Длина сообщения о прогрессе; более длинные обрезаются при записи
+PROGRESS_MESSAGE_LENGTH = 255
+
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Частичный индекс: в него попадают только отложенные задачи,
+        # поэтому планировщик не сканирует всю таблицу
+        Index(
+            "ix_tasks_pending_run_at",
+            "run_at",
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'"),
+        ),
+        # Готовые к выполнению задачи в порядке выдачи (очередь в Postgres)
+        Index(
+            "ix_tasks_ready",
+            text(f"({PRIORITY_RANK_SQL})"),
+            "created_at",
+            postgresql_where=text("status = 'NEW'"),
+            sqlite_where=text("status = 'NEW'"),
+        ),
+        # Аренды выполняющихся задач: по нему работает reaper
+        Index(
+            "ix_tasks_lease_expires_at",
+            "lease_expires_at",
+            postgresql_where=text("status = 'IN_PROGRESS'"),
+            sqlite_where=text("status = 'IN_PROGRESS'"),
+        ),
+        # Мемоизация: не больше одной выполняющейся задачи на входные данные
+        # (одновременные дубликаты ждут её), и поиск готового результата
+        Index(
+            "ix_tasks_memo_leader",
+            "input_hash",
+            unique=True,
+            postgresql_where=text(MEMO_LEADER_SQL),
+            sqlite_where=text(MEMO_LEADER_SQL),
+        ),
+        Index(
+            "ix_tasks_memo_result",
+            "input_hash",
+            "finished_at",
+            postgresql_where=text(MEMO_RESULT_SQL),
+            sqlite_where=text(MEMO_RESULT_SQL),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -38,5 +115,63 @@ class Task(Base):
     finished_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
+    run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
     result: Mapped[str] = mapped_column(Text, nullable=True)
     error: Mapped[str] = mapped_column(Text, nullable=True)
+    idempotency_key: Mapped[str] = mapped_column(
+        String(255), nullable=True, unique=True, index=True
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    lease_owner: Mapped[str] = mapped_column(String(255), nullable=True)
+    lease_expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    heartbeat_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Прогресс выполнения от обработчика: процент и сообщение
+    progress: Mapped[float] = mapped_column(Float, nullable=True)
+    progress_message: Mapped[str] = mapped_column(
+        String(PROGRESS_MESSAGE_LENGTH), nullable=True
+    )
+    # Сколько зависимостей ещё не завершено; задача ждёт в PENDING, пока > 0
+    pending_dependencies: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0"
+    )
+    # Мемоизация: хэш входных данных (только у задач с memoize) и задача,
+    # чей результат взят или ожидается вместо выполнения этой
+    input_hash: Mapped[str] = mapped_column(String(64), nullable=True)
+    memo_of: Mapped[int] = mapped_column(
+        Integer, ForeignKey("tasks.id", ondelete="SET NULL"), nullable=True
+    )
+
+
+class TaskDependency(Base):
+    """Ребро графа задач: ``child_id`` запускается после ``parent_id``.
+
+    Первичный ключ начинается с ``parent_id``, поэтому все дочерние задачи
+    завершённой задачи находятся одним проходом по индексу.
+    """
+
+    __tablename__ = "task_dependencies"
+
+    parent_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True
+    )
+    child_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True
+    )
+
+
+# Генерируемый столбец search_vector и GIN-индекс не отображаются в модель:
+# в SQLite их нет, а на Postgres create_all создаёт их так же, как миграция 006
+for statement in (
+    "ALTER TABLE tasks ADD COLUMN search_vector tsvector "
+    f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED",
+    "CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)",
+):
+    event.listen(
+        Task.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
@@ -1,18 +1,166 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import time
+from collections.abc import AsyncGenerator, Callable
+from typing import Any, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import structlog
+from fastapi import Header
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
 from app.core.config import settings
+from app.core.metrics import db_latency, metrics
+
+logger = structlog.get_logger()
+
+db_query_seconds = metrics.histogram("db_query_seconds", "Database statement latency")
+
+
+def _before_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    started = conn.info["query_started_at"].pop()
+    elapsed = time.perf_counter() - started
+    db_latency.observe(elapsed)
+    db_query_seconds.observe(elapsed)
+
+
+def _on_error(context: Any) -> None:
+    # Упавший запрос не доходит до after_cursor_execute
+    if context.connection is not None and context.connection.info.get(
+        "query_started_at"
+    ):
+        context.connection.info["query_started_at"].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """Замерять задержку запросов движка (для контроля приёма и метрик)."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_execute)
+    event.listen(engine.sync_engine, "handle_error", _on_error)
+    return engine
+
+
+class LazySessionFactory:
+    """Фабрика сессий, создающая движок при первой сессии.
+
+    Импорт модуля не загружает драйвер БД и не создаёт пул: процесс
+    стартует быстрее, а недоступная БД не мешает ему подняться.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._engine: Optional[AsyncEngine] = None
+        self._factory: Optional[async_sessionmaker[AsyncSession]] = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = instrument_engine(
+                create_async_engine(self.url, future=True, echo=False)
+            )
+        return self._engine
+
+    def __call__(self, **kwargs: Any) -> AsyncSession:
+        if self._factory is None:
+            self._factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        return self._factory(**kwargs)
+
+    async def dispose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+
+
+# 1) Фабрика сессий primary (движок создаётся при первом обращении)
+AsyncSessionLocal = LazySessionFactory(settings.DATABASE_URL)
+
+# 2) Реплика для чтения (если задана)
+ReadSessionLocal: Optional[LazySessionFactory] = (
+    LazySessionFactory(settings.READ_DATABASE_URL)
+    if settings.READ_DATABASE_URL
+    else None
+)
+
+replica_lag_gauge = metrics.gauge("db_replica_lag_seconds", "Read replica lag")
+reads_routed = metrics.counter("db_reads_total", "API reads by target database")
 
-# 1) Создаём асинхронный движок
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    future=True,
-    echo=False,
+# Отставание реплики; 0, если реплика догнала primary или сама им является
+REPLICA_LAG_SQL = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE("
+    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
 )
 
-# 2) Фабрика сессий
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+class ReplicaLagMonitor:
+    """Кэширует замер отставания реплики на ``interval`` секунд.
+
+    Ошибка замера считается бесконечным отставанием: чтение уйдёт на primary.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        interval: float = settings.REPLICA_LAG_CHECK_INTERVAL,
+    ) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self._lag = float("inf")
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return (
+            self._checked_at is not None
+            and time.monotonic() - self._checked_at < self.interval
+        )
+
+    async def lag(self) -> float:
+        if self._fresh():
+            return self._lag
+        async with self._lock:
+            if not self._fresh():
+                self._lag = await self._measure()
+                self._checked_at = time.monotonic()
+                replica_lag_gauge.set(self._lag)
+        return self._lag
+
+    async def _measure(self) -> float:
+        try:
+            async with self.session_factory() as session:
+                if session.bind.dialect.name != "postgresql":
+                    return 0.0
+                return float((await session.execute(REPLICA_LAG_SQL)).scalar_one())
+        except Exception as exc:
+            logger.warning("Failed to check replica lag", error=str(exc))
+            return float("inf")
+
+
+replica_lag = ReplicaLagMonitor(ReadSessionLocal) if ReadSessionLocal else None
+
+
+async def choose_read_session_factory(
+    read_your_writes: bool = False,
+) -> LazySessionFactory:
+    """Реплика, если она есть, не запрошено чтение своих записей и отставание
+    не превышает REPLICA_MAX_LAG; иначе primary."""
+    if ReadSessionLocal is None or replica_lag is None or read_your_writes:
+        reads_routed.inc(target="primary")
+        return AsyncSessionLocal
+    if await replica_lag.lag() > settings.REPLICA_MAX_LAG:
+        reads_routed.inc(target="primary_lag")
+        return AsyncSessionLocal
+    reads_routed.inc(target="replica")
+    return ReadSessionLocal
 
 
 # 3) Депенденси для FastAPI
@@ -27,3 +175,33 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             # Всё автоматом закрывается по выходу из async with
             pass
+
+
+async def get_read_db(
+    read_your_writes: bool = Header(
+        False,
+        alias="X-Read-Your-Writes",
+        description="Read from the primary to see this client's latest writes",
+    ),
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Зависимость для GET-запросов: сессия реплики для чтения (см.
+    choose_read_session_factory), по запросу — сессия primary.
+    """
+    session_factory = await choose_read_session_factory(read_your_writes)
+    async with session_factory() as session:
+        yield session
+
+
+async def get_read_session_factory(
+    read_your_writes: bool = Header(
+        False,
+        alias="X-Read-Your-Writes",
+        description="Read from the primary to see this client's latest writes",
+    ),
+) -> LazySessionFactory:
+    """
+    Зависимость для потоковых ответов: фабрика сессий для чтения, чтобы
+    открывать короткие транзакции по ходу выдачи, а не одну на весь ответ.
+    """
+    return await choose_read_session_factory(read_your_writes)
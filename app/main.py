@@ -1,9 +1,13 @@
 import structlog
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from app.api.v1.endpoints.tasks import router as tasks_router
 from app.core.logging import init_logging
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
+from app.services.readiness import get_readiness
 from app.services.task_processor import get_task_processor
 
 logger = structlog.get_logger()
@@ -20,16 +24,64 @@ app = FastAPI(
 # Подключаем роуты
 app.include_router(tasks_router)
 
+# Встроенный воркер запущен (только для очереди в памяти процесса)
+_worker_started = False
+
+
+@app.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+async def read_metrics() -> str:
+    """Метрики процесса в текстовом формате Prometheus."""
+    return metrics.render_prometheus()
+
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness() -> dict[str, str]:
+    """Процесс жив и обслуживает запросы; зависимости не проверяются."""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness() -> JSONResponse:
+    """Готовность принимать трафик: БД отвечает и очередь подключена."""
+    ready, checks = await get_readiness().status()
+    return JSONResponse(
+        {"status": "ok" if ready else "unavailable", "checks": checks},
+        status_code=200 if ready else 503,
+    )
+
+
+async def _start_embedded_worker() -> None:
+    global _worker_started
+    # Очередь в памяти процесса: воркер работает здесь же, без брокера.
+    # Модуль воркера тянет планировщик, аренды и диспетчер — импортируем
+    # его только здесь, чтобы не замедлять старт API с внешним брокером
+    if get_task_processor().backend.in_process:
+        from app.worker import start_worker
+
+        await start_worker(AsyncSessionLocal)
+        _worker_started = True
+
 
 @app.on_event("startup")
 async def on_startup() -> None:
-    try:
-        await get_task_processor().initialize()
-    except Exception as e:
-        # В тестах сюда придёт DummyProcessor, а реальное подключение не дойдёт до этого блока
-        logger.warning(
-            "Не удалось подключиться к RabbitMQ, работаем без очереди", error=str(e)
-        )
+    # Не ждём брокер: API сразу отвечает на /health/live, а /health/ready
+    # становится 200, когда фоновое подключение к очереди удастся
+    get_readiness().start(on_queue_ready=_start_embedded_worker)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    global _worker_started
+    await get_readiness().stop()
+    if _worker_started:
+        from app.worker import drain_worker, stop_worker
+
+        await drain_worker()
+        await stop_worker()
+        _worker_started = False
+    elif get_readiness().queue_ready:
+        await get_task_processor().close()
+    await AsyncSessionLocal.dispose()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,58 @@
-from typing import Optional
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
 
+from sqlalchemy import (
+    Row,
+    Select,
+    and_,
+    bindparam,
+    case,
+    func,
+    insert,
+    literal_column,
+    or_,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.db.models.task import Status
+from app.db.models.task import (
+    MEMO_LEADER_SQL,
+    MEMO_RESULT_SQL,
+    PRIORITY_RANK_SQL,
+    SEARCH_CONFIG,
+    Priority,
+    Status,
+)
 from app.db.models.task import Task as TaskModel
+from app.db.models.task import TaskDependency
 from app.schemas.task import TaskCreate
 
+# Statuses a task can still be cancelled from
+CANCELLABLE_STATUSES = (Status.NEW, Status.PENDING, Status.IN_PROGRESS)
+
+# A dependency in one of these statuses cancels its dependents
+DEPENDENCY_FAILED_STATUSES = (Status.FAILED, Status.CANCELLED)
+
+# Ids per statement when walking the dependency graph (bind parameter limit)
+DEPENDENCY_CHUNK = 5000
+
+# Every column of a task, returned by the Core ``INSERT/UPDATE ... RETURNING``
+# fast paths
+TASK_COLUMNS = tuple(TaskModel.__table__.columns)
+
+# A task row from ``RETURNING``: read like the model and validated by
+# TaskRead/TaskStatus directly, but not tracked by the session identity map
+TaskRow = Row[Any]
+
+
+class DependencyNotFound(ValueError):
+    """A ``depends_on`` id does not refer to an existing task"""
+
 
 class TaskRepository:
     """Repository for task database operations"""
@@ -14,59 +60,927 @@ class TaskRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def create(self, task_data: TaskCreate) -> TaskModel:
-        """Create a new task"""
-        from datetime import datetime
+    async def create(
+        self,
+        task_data: TaskCreate,
+        idempotency_key: Optional[str] = None,
+        memo_ttl: float = 0.0,
+    ) -> TaskRow:
+        """Create a new task
+
+        Tasks with ``run_at`` in the future are stored as PENDING and are
+        released later by the scheduler instead of being enqueued right away.
+        Tasks with unfinished ``depends_on`` tasks wait as PENDING too, until
+        the last of them completes; a task depending on a failed or cancelled
+        task is created CANCELLED. Raises ``DependencyNotFound`` for unknown
+        dependency ids.
+
+        With ``memoize`` and a positive ``memo_ttl`` the task may be answered
+        from an identical task instead, see ``_create_memoized``.
+
+        The row is written and read back by one ``INSERT ... RETURNING``.
+        """
+        data = task_data.model_dump()
+        depends_on = sorted(set(data.pop("depends_on", None) or ()))
+        memoize = data.pop("memoize", False)
+        run_at = data["run_at"] = _as_utc(data.get("run_at"))
+        is_delayed = run_at is not None and run_at > datetime.now(timezone.utc)
+
+        if memoize and memo_ttl > 0 and not depends_on and not is_delayed:
+            return await self._create_memoized(data, idempotency_key, memo_ttl)
+
+        pending, failed = 0, []
+        if depends_on:
+            # Shared row locks: a dependency cannot finish between this read
+            # and the commit, so its completion is sure to see the new edges
+            stmt = (
+                select(TaskModel.id, TaskModel.status)
+                .where(TaskModel.id.in_(depends_on))
+                .with_for_update(read=True)
+            )
+            statuses = dict((await self.db.execute(stmt)).tuples().all())
+            missing = [task_id for task_id in depends_on if task_id not in statuses]
+            if missing:
+                await self.db.rollback()
+                raise DependencyNotFound(
+                    f"Unknown dependencies: {', '.join(map(str, missing[:10]))}"
+                )
+            pending = sum(status != Status.COMPLETED for status in statuses.values())
+            failed = [
+                task_id
+                for task_id, status in statuses.items()
+                if status in DEPENDENCY_FAILED_STATUSES
+            ]
+
+        if failed:
+            status = Status.CANCELLED
+            data["error"] = f"Dependency {failed[0]} failed or was cancelled"
+        elif pending or is_delayed:
+            status = Status.PENDING
+        else:
+            status = Status.NEW
+
+        task = await self._insert(
+            **data,
+            status=status,
+            created_at=datetime.utcnow(),
+            idempotency_key=idempotency_key,
+            pending_dependencies=0 if failed else pending,
+        )
+        if depends_on:
+            await self.db.execute(
+                insert(TaskDependency),
+                [{"parent_id": parent, "child_id": task.id} for parent in depends_on],
+            )
+        await self.db.commit()
+        return task
+
+    async def _insert(self, **values: Any) -> TaskRow:
+        """Insert one task, returning the stored row with its defaults"""
+        stmt = insert(TaskModel).values(**values).returning(*TASK_COLUMNS)
+        return (await self.db.execute(stmt)).one()
+
+    async def _create_memoized(
+        self,
+        data: dict[str, Any],
+        idempotency_key: Optional[str],
+        ttl: float,
+        retry: bool = True,
+    ) -> TaskRow:
+        """Create a memoized task, reusing identical work where possible
+
+        Input is identified by a hash of title and description. If a task with
+        that input completed within ``ttl`` seconds, the new task is created
+        COMPLETED with its result. If one is queued or running (the leader),
+        the new task waits as PENDING and finishes with the leader's outcome.
+        Otherwise the new task becomes the leader and runs. ``memo_of`` points
+        to the task whose result is used.
 
-        task = TaskModel(
-            **task_data.model_dump(), status=Status.NEW, created_at=datetime.utcnow()
+        A partial unique index admits one leader per input: of two concurrent
+        duplicates, the one losing the race retries as a follower.
+        """
+        input_hash = _input_hash(data["title"], data["description"])
+        now = datetime.now(timezone.utc)
+        values = dict(
+            data,
+            status=Status.NEW,
+            created_at=datetime.utcnow(),
+            idempotency_key=idempotency_key,
+            input_hash=input_hash,
         )
-        self.db.add(task)
+        cached = await self._memo_result(input_hash, now - timedelta(seconds=ttl))
+        if cached is not None:
+            memo_of, result = cached
+            values.update(
+                status=Status.COMPLETED,
+                memo_of=memo_of,
+                result=result,
+                started_at=now,
+                finished_at=now,
+            )
+        elif (leader := await self._memo_leader(input_hash)) is not None:
+            values.update(
+                status=Status.PENDING, memo_of=leader, pending_dependencies=1
+            )
+        try:
+            task = await self._insert(**values)
+        except IntegrityError:
+            await self.db.rollback()
+            # Retry once, as a follower, if a concurrent duplicate became the leader
+            if not retry or await self._memo_leader(input_hash) is None:
+                raise
+            return await self._create_memoized(data, idempotency_key, ttl, retry=False)
+        if task.status == Status.PENDING:
+            # The edge makes the follower share the leader's cancellation
+            await self.db.execute(
+                insert(TaskDependency).values(parent_id=task.memo_of, child_id=task.id)
+            )
         await self.db.commit()
-        await self.db.refresh(task)
         return task
 
+    async def _memo_result(
+        self, input_hash: str, since: datetime
+    ) -> Optional[tuple[int, Optional[str]]]:
+        """(id, result) of the latest computed task with this input"""
+        stmt = (
+            select(TaskModel.id, TaskModel.result)
+            .where(
+                TaskModel.input_hash == input_hash,
+                text(MEMO_RESULT_SQL),
+                TaskModel.finished_at >= since,
+            )
+            .order_by(TaskModel.finished_at.desc())
+            .limit(1)
+        )
+        row = (await self.db.execute(stmt)).first()
+        return None if row is None else (row.id, row.result)
+
+    async def _memo_leader(self, input_hash: str) -> Optional[int]:
+        """Id of the queued or running task with this input
+
+        The row is share-locked, so the leader cannot finish before the
+        follower referring to it is committed.
+        """
+        stmt = (
+            select(TaskModel.id)
+            .where(TaskModel.input_hash == input_hash, text(MEMO_LEADER_SQL))
+            .with_for_update(read=True)
+        )
+        return (await self.db.execute(stmt)).scalar_one_or_none()
+
+    async def create_idempotent(
+        self,
+        task_data: TaskCreate,
+        idempotency_key: str,
+        ttl: int,
+        memo_ttl: float = 0.0,
+    ) -> tuple[TaskModel | TaskRow, bool]:
+        """Create a task unless one with the same key exists within ``ttl`` seconds
+
+        Returns the task and whether it was created by this call.
+        """
+        existing = await self.get_by_idempotency_key(idempotency_key, ttl)
+        if existing:
+            return existing, False
+        try:
+            return await self.create(task_data, idempotency_key, memo_ttl), True
+        except IntegrityError:
+            # A concurrent request with the same key won the unique index
+            await self.db.rollback()
+            existing = await self.get_by_idempotency_key(idempotency_key, ttl)
+            if existing is None:
+                raise
+            return existing, False
+
+    async def get_by_idempotency_key(
+        self, idempotency_key: str, ttl: int
+    ) -> Optional[TaskModel]:
+        """Get task by idempotency key; expired keys are released"""
+        stmt = select(TaskModel).where(TaskModel.idempotency_key == idempotency_key)
+        task = (await self.db.execute(stmt)).scalar_one_or_none()
+        if task is None:
+            return None
+
+        expires_at = _as_utc(task.created_at) + timedelta(seconds=ttl)
+        if expires_at > datetime.now(timezone.utc):
+            return task
+
+        # The key is free to be used for a new task
+        task.idempotency_key = None
+        await self.db.commit()
+        return None
+
     async def get_by_id(self, task_id: int) -> Optional[TaskModel]:
         """Get task by ID"""
         return await self.db.get(TaskModel, task_id)
 
+    async def get_many(self, task_ids: list[int]) -> list[TaskModel]:
+        """Get several tasks by ID in one query (missing ids are skipped)"""
+        if not task_ids:
+            return []
+        stmt = select(TaskModel).where(TaskModel.id.in_(task_ids))
+        return list((await self.db.execute(stmt)).scalars().all())
+
     async def get_all(
         self,
         status: Optional[Status] = None,
         priority: Optional[str] = None,
         skip: int = 0,
         limit: int = 100,
+        q: Optional[str] = None,
     ) -> list[TaskModel]:
-        """Get tasks with optional filtering and pagination"""
-        stmt = select(TaskModel).offset(skip).limit(limit)
+        """Get tasks with optional filtering and pagination
 
+        With ``q`` only tasks matching the search are returned, best matches
+        first (see ``_search``).
+        """
+        stmt = self._filtered(select(TaskModel), status, priority, q)
+        if q:
+            stmt = stmt.order_by(self._search_rank(q), TaskModel.id)
+        stmt = stmt.offset(skip).limit(limit)
+
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def count(
+        self,
+        status: Optional[Status] = None,
+        priority: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> int:
+        """Exact number of tasks matching the filters"""
+        stmt = self._filtered(
+            select(func.count()).select_from(TaskModel), status, priority, q
+        )
+        return (await self.db.execute(stmt)).scalar_one()
+
+    async def estimate_count(
+        self,
+        status: Optional[Status] = None,
+        priority: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> int:
+        """Planner's row estimate for the filters (Postgres ``EXPLAIN``)
+
+        Costs a plan, not a scan, so it stays cheap on any table size. The
+        estimate is as fresh as the table statistics (``ANALYZE``). Other
+        databases fall back to an exact count.
+        """
+        if not self._is_postgres():
+            return await self.count(status, priority, q)
+        query = self._filtered(select(TaskModel.id), status, priority, q).compile(
+            dialect=self.db.bind.dialect, compile_kwargs={"literal_binds": True}
+        )
+        plan = (
+            await self.db.execute(text(f"EXPLAIN (FORMAT JSON) {query}"))
+        ).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    async def get_export_batch(
+        self,
+        status: Optional[Status] = None,
+        priority: Optional[str] = None,
+        q: Optional[str] = None,
+        after_id: int = 0,
+        limit: int = 1000,
+    ) -> list[dict[str, Any]]:
+        """Next ``limit`` matching tasks after ``after_id`` as plain dicts
+
+        Keyset pagination in ``id`` order: each batch is one short query, so
+        a caller can close the session between batches. Rows are not loaded
+        into the session.
+        """
+        stmt = (
+            self._filtered(select(*EXPORT_COLUMNS), status, priority, q)
+            .where(TaskModel.id > after_id)
+            .order_by(TaskModel.id)
+            .limit(limit)
+        )
+        result = await self.db.execute(stmt)
+        return [dict(row) for row in result.mappings()]
+
+    def _is_postgres(self) -> bool:
+        return self.db.bind.dialect.name == "postgresql"
+
+    def _filtered(
+        self,
+        stmt: Select,
+        status: Optional[Status],
+        priority: Optional[str],
+        q: Optional[str] = None,
+    ) -> Select:
+        """Apply the task listing filters"""
         if status:
             stmt = stmt.where(TaskModel.status == status)
         if priority:
             stmt = stmt.where(TaskModel.priority == priority)
+        if q:
+            stmt = stmt.where(self._search(q))
+        return stmt
 
-        result = await self.db.execute(stmt)
-        return list(result.scalars().all())
+    def _search(self, q: str):
+        """Full-text match of title and description
 
-    async def update_status(self, task_id: int, status: Status) -> Optional[TaskModel]:
-        """Update task status"""
-        task = await self.get_by_id(task_id)
-        if task:
-            task.status = status
-            await self.db.commit()
-            await self.db.refresh(task)
+        On Postgres this is ``search_vector @@ websearch_to_tsquery(q)`` over
+        the GIN index (quoted phrases, ``or`` and ``-word`` are supported).
+        Elsewhere every word must occur in the title or the description.
+        """
+        if self._is_postgres():
+            return SEARCH_VECTOR.op("@@")(_tsquery(q))
+        return and_(
+            *(
+                or_(
+                    _contains(TaskModel.title, word),
+                    _contains(TaskModel.description, word),
+                )
+                for word in q.split()
+            )
+        )
+
+    def _search_rank(self, q: str):
+        """Ordering for search results, best match first"""
+        if self._is_postgres():
+            return func.ts_rank_cd(SEARCH_VECTOR, _tsquery(q)).desc()
+        # Without tsvector: tasks having every word in the title come first
+        in_title = and_(*(_contains(TaskModel.title, word) for word in q.split()))
+        return case((in_title, 0), else_=1)
+
+    async def update_status(self, task_id: int, status: Status) -> Optional[TaskRow]:
+        """Update task status with one ``UPDATE ... RETURNING``"""
+        stmt = (
+            update(TaskModel)
+            .where(TaskModel.id == task_id)
+            .values(status=status)
+            .returning(*TASK_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        task = (await self.db.execute(stmt)).one_or_none()
+        await self.db.commit()
+        return task
+
+    async def cancel_task(self, task_id: int) -> Optional[TaskRow]:
+        """Cancel a task if it can be cancelled
+
+        The status check and the change are one conditional ``UPDATE ...
+        RETURNING``: a task finishing concurrently is never cancelled.
+        """
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id == task_id, TaskModel.status.in_(CANCELLABLE_STATUSES)
+            )
+            .values(status=Status.CANCELLED, finished_at=datetime.now(timezone.utc))
+            .returning(*TASK_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        task = (await self.db.execute(stmt)).one_or_none()
+        if task is not None:
+            await self.cancel_dependents([task.id])
+        await self.db.commit()
         return task
 
-    async def cancel_task(self, task_id: int) -> Optional[TaskModel]:
-        """Cancel a task if it can be cancelled"""
-        task = await self.get_by_id(task_id)
-        if task and task.status not in {
-            Status.COMPLETED,
-            Status.FAILED,
-            Status.CANCELLED,
-        }:
-            task.status = Status.CANCELLED
+    async def cancel_many(
+        self,
+        ids: Optional[list[int]] = None,
+        status: Optional[Status] = None,
+        priority: Optional[Priority] = None,
+        created_before: Optional[datetime] = None,
+    ) -> list[int]:
+        """Cancel every cancellable task matching all given criteria
+
+        One ``UPDATE ... RETURNING`` regardless of how many tasks match;
+        returns the ids of the cancelled tasks, including waiting dependents
+        cancelled along with them.
+        """
+        stmt = (
+            update(TaskModel)
+            .where(TaskModel.status.in_(CANCELLABLE_STATUSES))
+            .values(status=Status.CANCELLED, finished_at=datetime.now(timezone.utc))
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        if ids is not None:
+            stmt = stmt.where(TaskModel.id.in_(ids))
+        if status is not None:
+            stmt = stmt.where(TaskModel.status == status)
+        if priority is not None:
+            stmt = stmt.where(TaskModel.priority == priority)
+        if created_before is not None:
+            stmt = stmt.where(TaskModel.created_at < created_before)
+        result = await self.db.execute(stmt)
+        cancelled = list(result.scalars().all())
+        cancelled += await self.cancel_dependents(cancelled)
+        await self.db.commit()
+        return cancelled
+
+    async def release_due_tasks(
+        self, now: datetime, limit: int
+    ) -> list[tuple[int, Priority]]:
+        """Move due delayed tasks from PENDING to NEW and return (id, priority)
+
+        Uses the partial index on pending ``run_at``; concurrent schedulers
+        skip rows locked by each other.
+        """
+        due = (
+            select(TaskModel.id)
+            .where(
+                _status_is(Status.PENDING),
+                TaskModel.run_at <= now,
+                TaskModel.pending_dependencies == 0,
+            )
+            .order_by(TaskModel.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(TaskModel)
+            .where(TaskModel.id.in_(due.scalar_subquery()))
+            .values(status=Status.NEW)
+            .returning(TaskModel.id, TaskModel.priority)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        released = [(row.id, row.priority) for row in result]
+        await self.db.commit()
+        return released
+
+    async def claim_ready_tasks(
+        self, limit: int, owner: str, lease_ttl: float
+    ) -> list[tuple[int, Priority]]:
+        """Claim up to ``limit`` NEW tasks for a worker (Postgres queue mode)
+
+        Tasks are taken in priority order (HIGH first), oldest first, through
+        the partial ``ix_tasks_ready`` index; rows locked by other workers are
+        skipped. Claimed tasks become IN_PROGRESS under the worker's lease.
+        """
+        now = datetime.now(timezone.utc)
+        ready = (
+            select(TaskModel.id)
+            .where(_status_is(Status.NEW))
+            .order_by(literal_column(PRIORITY_RANK_SQL), TaskModel.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(TaskModel)
+            .where(TaskModel.id.in_(ready.scalar_subquery()))
+            .values(
+                status=Status.IN_PROGRESS,
+                started_at=now,
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=lease_ttl),
+                heartbeat_at=now,
+            )
+            .returning(TaskModel.id, TaskModel.priority)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        claimed = [(row.id, row.priority) for row in result]
+        await self.db.commit()
+        return claimed
+
+    async def count_ready(self, limit: int) -> int:
+        """Count NEW tasks, stopping at ``limit``
+
+        The count reads at most ``limit`` entries of the partial
+        ``ix_tasks_ready`` index, so it stays cheap however deep the queue is.
+        """
+        ready = select(TaskModel.id).where(_status_is(Status.NEW)).limit(limit)
+        stmt = select(func.count()).select_from(ready.subquery())
+        return (await self.db.execute(stmt)).scalar_one()
+
+    async def get_ready(
+        self, after_id: int = 0, limit: int = 1000
+    ) -> list[tuple[int, Priority]]:
+        """(id, priority) of the next ``limit`` NEW tasks after ``after_id``"""
+        stmt = (
+            select(TaskModel.id, TaskModel.priority)
+            .where(_status_is(Status.NEW), TaskModel.id > after_id)
+            .order_by(TaskModel.id)
+            .limit(limit)
+        )
+        return [(row.id, row.priority) for row in await self.db.execute(stmt)]
+
+    async def claim_for_processing(
+        self, task_id: int, owner: str, lease_ttl: float
+    ) -> bool:
+        """Start processing a task under ``owner``'s lease
+
+        Succeeds for NEW tasks, tasks already leased by ``owner`` and tasks
+        whose lease has expired; a live lease of another worker wins.
+        """
+        return bool(await self.claim_many_for_processing([task_id], owner, lease_ttl))
+
+    async def claim_many_for_processing(
+        self, task_ids: list[int], owner: str, lease_ttl: float
+    ) -> list[int]:
+        """Start processing several tasks under ``owner``'s lease at once
+
+        Same rules as ``claim_for_processing`` for each task, in a single
+        ``UPDATE ... RETURNING``. Returns the ids actually claimed.
+        """
+        if not task_ids:
+            return []
+        now = datetime.now(timezone.utc)
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id.in_(task_ids),
+                or_(
+                    TaskModel.status == Status.NEW,
+                    and_(
+                        TaskModel.status == Status.IN_PROGRESS,
+                        or_(
+                            TaskModel.lease_owner == owner,
+                            TaskModel.lease_expires_at.is_(None),
+                            TaskModel.lease_expires_at < now,
+                        ),
+                    ),
+                ),
+            )
+            .values(
+                status=Status.IN_PROGRESS,
+                started_at=now,
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=lease_ttl),
+                heartbeat_at=now,
+                attempts=TaskModel.attempts + 1,
+            )
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = list((await self.db.execute(stmt)).scalars().all())
+        await self.db.commit()
+        return claimed
+
+    async def finish_task(
+        self,
+        task_id: int,
+        owner: str,
+        status: Status,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> Optional[list[tuple[int, Priority]]]:
+        """Record the outcome of a leased task and release the lease
+
+        Returns None if the task was cancelled or re-leased meanwhile (nothing
+        is recorded). Otherwise returns (id, priority) of dependents that became
+        ready to run and must be enqueued; in the same transaction dependents
+        of a failed task are cancelled.
+        """
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id == task_id,
+                TaskModel.status == Status.IN_PROGRESS,
+                TaskModel.lease_owner == owner,
+            )
+            .values(
+                status=status,
+                finished_at=datetime.now(timezone.utc),
+                result=result,
+                error=error,
+                lease_owner=None,
+                lease_expires_at=None,
+                # A failed task keeps the last progress it reported
+                progress=100.0 if status == Status.COMPLETED else TaskModel.progress,
+            )
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        if (await self.db.execute(stmt)).scalar_one_or_none() is None:
             await self.db.commit()
-            await self.db.refresh(task)
-            return task
-        return None
+            return None
+        followers = await self.finish_followers([task_id], status, result, error)
+        released = []
+        if status == Status.COMPLETED:
+            for finished_id in (task_id, *followers):
+                released += await self.release_dependents(finished_id)
+        elif status in DEPENDENCY_FAILED_STATUSES:
+            await self.cancel_dependents([task_id, *followers])
+        await self.db.commit()
+        return released
+
+    async def finish_followers(
+        self,
+        task_ids: list[int],
+        status: Status,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> list[int]:
+        """Give memoized tasks waiting for ``task_ids`` the same outcome
+
+        Returns the ids of the finished followers. Does not commit.
+        """
+        if not task_ids:
+            return []
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.memo_of.in_(task_ids),
+                TaskModel.status == Status.PENDING,
+            )
+            .values(
+                status=status,
+                result=result,
+                error=error,
+                finished_at=datetime.now(timezone.utc),
+                pending_dependencies=0,
+            )
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        return list((await self.db.execute(stmt)).scalars().all())
+
+    async def release_dependents(self, task_id: int) -> list[tuple[int, Priority]]:
+        """Count a completed dependency off all its waiting dependents
+
+        One ``UPDATE ... RETURNING`` over the edge table whatever the fan-out;
+        dependents whose last dependency this was move to NEW (or stay PENDING
+        until ``run_at``). Returns (id, priority) of the tasks now NEW.
+        Does not commit.
+        """
+        now = datetime.now(timezone.utc)
+        children = select(TaskDependency.child_id).where(
+            TaskDependency.parent_id == task_id
+        )
+        ready = and_(
+            TaskModel.pending_dependencies == 1,
+            or_(TaskModel.run_at.is_(None), TaskModel.run_at <= now),
+        )
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id.in_(children.scalar_subquery()),
+                TaskModel.status == Status.PENDING,
+                TaskModel.pending_dependencies > 0,
+            )
+            .values(
+                pending_dependencies=TaskModel.pending_dependencies - 1,
+                status=case(
+                    (ready, literal_column(f"'{Status.NEW.value}'")),
+                    else_=TaskModel.status,
+                ),
+            )
+            .returning(TaskModel.id, TaskModel.priority, TaskModel.status)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        return [(row.id, row.priority) for row in result if row.status == Status.NEW]
+
+    async def cancel_dependents(self, task_ids: list[int]) -> list[int]:
+        """Cancel every waiting task that depends, directly or transitively,
+        on one of ``task_ids``
+
+        A recursive CTE walks the graph in the database, one statement per
+        ``DEPENDENCY_CHUNK`` ids. Returns the ids of the cancelled tasks.
+        Does not commit.
+        """
+        cancelled: list[int] = []
+        now = datetime.now(timezone.utc)
+        for start in range(0, len(task_ids), DEPENDENCY_CHUNK):
+            chunk = task_ids[start : start + DEPENDENCY_CHUNK]
+            descendants = (
+                select(TaskDependency.child_id)
+                .where(TaskDependency.parent_id.in_(chunk))
+                .cte("descendants", recursive=True)
+            )
+            descendants = descendants.union(
+                select(TaskDependency.child_id).join(
+                    descendants, TaskDependency.parent_id == descendants.c.child_id
+                )
+            )
+            stmt = (
+                update(TaskModel)
+                .where(
+                    TaskModel.id.in_(select(descendants.c.child_id)),
+                    TaskModel.status == Status.PENDING,
+                    TaskModel.pending_dependencies > 0,
+                )
+                .values(
+                    status=Status.CANCELLED,
+                    finished_at=now,
+                    error="A dependency failed or was cancelled",
+                )
+                .returning(TaskModel.id)
+                .execution_options(synchronize_session=False)
+            )
+            cancelled += (await self.db.execute(stmt)).scalars().all()
+        return cancelled
+
+    async def save_progress(
+        self, updates: list[tuple[int, float, Optional[str]]], owner: str
+    ) -> None:
+        """Store (id, percent, message) progress of ``owner``'s running tasks
+
+        One executemany round trip for the whole batch; tasks that finished or
+        were re-leased meanwhile are left untouched.
+        """
+        if not updates:
+            return
+        table = TaskModel.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.id == bindparam("task_id"),
+                table.c.status == Status.IN_PROGRESS,
+                table.c.lease_owner == owner,
+            )
+            .values(
+                progress=bindparam("percent"), progress_message=bindparam("message")
+            )
+        )
+        await self.db.execute(
+            stmt,
+            [
+                {"task_id": task_id, "percent": percent, "message": message}
+                for task_id, percent, message in updates
+            ],
+        )
+        await self.db.commit()
+
+    async def renew_leases(
+        self, task_ids: list[int], owner: str, lease_ttl: float
+    ) -> int:
+        """Extend the leases of all ``owner``'s running tasks in one statement"""
+        if not task_ids:
+            return 0
+        now = datetime.now(timezone.utc)
+        stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id.in_(task_ids),
+                TaskModel.status == Status.IN_PROGRESS,
+                TaskModel.lease_owner == owner,
+            )
+            .values(
+                heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_ttl)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        await self.db.commit()
+        return result.rowcount
+
+    async def reap_expired_leases(
+        self, now: datetime, max_attempts: int, limit: int
+    ) -> tuple[list[tuple[int, Priority]], list[int]]:
+        """Requeue or fail IN_PROGRESS tasks whose lease has expired
+
+        Returns (requeued (id, priority) pairs, failed ids). Tasks that have
+        used up ``max_attempts`` are failed, the rest go back to NEW.
+        """
+        error = f"Lease expired, giving up after {max_attempts} attempts"
+        expired = (
+            select(TaskModel.id)
+            .where(_status_is(Status.IN_PROGRESS), TaskModel.lease_expires_at < now)
+            .order_by(TaskModel.lease_expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        released = {"lease_owner": None, "lease_expires_at": None}
+
+        failed_stmt = (
+            update(TaskModel)
+            .where(
+                TaskModel.id.in_(expired.scalar_subquery()),
+                TaskModel.attempts >= max_attempts,
+            )
+            .values(
+                status=Status.FAILED,
+                finished_at=now,
+                error=error,
+                **released,
+            )
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        failed = list((await self.db.execute(failed_stmt)).scalars().all())
+
+        requeue_stmt = (
+            update(TaskModel)
+            .where(TaskModel.id.in_(expired.scalar_subquery()))
+            .values(status=Status.NEW, **released)
+            .returning(TaskModel.id, TaskModel.priority)
+            .execution_options(synchronize_session=False)
+        )
+        requeued = [
+            (row.id, row.priority) for row in await self.db.execute(requeue_stmt)
+        ]
+        followers = await self.finish_followers(failed, Status.FAILED, error=error)
+        await self.cancel_dependents(failed + followers)
+        await self.db.commit()
+        return requeued, failed
+
+    async def release_leases(self, owner: str) -> list[int]:
+        """Return every task leased by ``owner`` to NEW (worker shutdown)
+
+        Lets other workers claim them right away instead of waiting for the
+        leases to expire. Returns the ids of the released tasks.
+        """
+        stmt = (
+            update(TaskModel)
+            .where(
+                _status_is(Status.IN_PROGRESS),
+                TaskModel.lease_owner == owner,
+            )
+            .values(status=Status.NEW, lease_owner=None, lease_expires_at=None)
+            .returning(TaskModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        released = list((await self.db.execute(stmt)).scalars().all())
+        await self.db.commit()
+        return released
+
+    async def expire_for_requeue(self, task_ids: list[int]) -> None:
+        """Hand NEW tasks whose queue message was not published to the reaper
+
+        They become IN_PROGRESS with an already expired lease and no owner, so
+        the next ``reap_expired_leases`` pass returns them to NEW and publishes
+        them again. Tasks claimed meanwhile are left untouched.
+        """
+        if not task_ids:
+            return
+        await self.db.execute(
+            update(TaskModel)
+            .where(TaskModel.id.in_(task_ids), TaskModel.status == Status.NEW)
+            .values(
+                status=Status.IN_PROGRESS,
+                lease_owner=None,
+                lease_expires_at=datetime.now(timezone.utc),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+
+    async def return_to_pending(self, task_ids: list[int]) -> None:
+        """Put released tasks back to PENDING (e.g. when publishing failed)"""
+        if not task_ids:
+            return
+        await self.db.execute(
+            update(TaskModel)
+            .where(TaskModel.id.in_(task_ids), TaskModel.status == Status.NEW)
+            .values(status=Status.PENDING)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+
+    async def get_next_run_at(self) -> Optional[datetime]:
+        """Get the earliest ``run_at`` among delayed tasks"""
+        stmt = select(func.min(TaskModel.run_at)).where(
+            _status_is(Status.PENDING), TaskModel.pending_dependencies == 0
+        )
+        return _as_utc((await self.db.execute(stmt)).scalar())
+
+
+# Columns of a task export, in output order
+EXPORT_COLUMNS = [
+    TaskModel.id,
+    TaskModel.title,
+    TaskModel.description,
+    TaskModel.priority,
+    TaskModel.status,
+    TaskModel.created_at,
+    TaskModel.started_at,
+    TaskModel.finished_at,
+    TaskModel.run_at,
+    TaskModel.attempts,
+    TaskModel.result,
+    TaskModel.error,
+]
+
+# Generated column from migration 006 (not mapped on the model)
+SEARCH_VECTOR = literal_column("tasks.search_vector")
+
+
+def _tsquery(q: str):
+    return func.websearch_to_tsquery(
+        literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q
+    )
+
+
+def _contains(column, word: str):
+    """Case-insensitive substring match with LIKE wildcards escaped"""
+    escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def _status_is(status: Status):
+    """Status filter with an inline literal, so partial indexes stay usable
+    for prepared statements"""
+    return TaskModel.status == literal_column(f"'{status.value}'")
+
+
+def _input_hash(title: str, description: Optional[str]) -> str:
+    """Hash identifying a task's input for memoization"""
+    payload = json.dumps([title, description], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Treat naive datetimes as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
@@ -1,6 +1,9 @@
 from datetime import datetime
+from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from app.core.config import settings
 
 from app.db.models.task import Priority, Status
 
@@ -14,7 +17,24 @@ class TaskBase(BaseModel):
 class TaskCreate(TaskBase):
     """Schema for creating a new task"""
 
-    pass
+    run_at: datetime | None = Field(
+        None,
+        description="Do not start the task before this moment (UTC if no timezone)",
+        examples=["2030-01-01T12:00:00Z"],
+    )
+    depends_on: list[int] | None = Field(
+        None,
+        max_length=settings.TASK_MAX_DEPENDENCIES,
+        description="Start the task only after all these tasks complete; "
+        "if any of them fails or is cancelled, the task is cancelled too",
+        examples=[[1, 2]],
+    )
+    memoize: bool = Field(
+        False,
+        description="Reuse the result of a completed task with the same title "
+        "and description instead of running again; identical tasks submitted "
+        "while one is running wait for it. Ignored with run_at or depends_on",
+    )
 
 
 class TaskRead(BaseModel):
@@ -28,8 +48,14 @@ class TaskRead(BaseModel):
     created_at: datetime
     started_at: datetime | None = None
     finished_at: datetime | None = None
+    run_at: datetime | None = None
     result: str | None = None
     error: str | None = None
+    attempts: int = 0
+    progress: float | None = None
+    progress_message: str | None = None
+    pending_dependencies: int = 0
+    memo_of: int | None = None
 
     class Config:
         from_attributes = True
@@ -39,6 +65,56 @@ class TaskStatus(BaseModel):
     """Schema for task status only"""
 
     status: Status
+    progress: float | None = Field(
+        None, description="Percent done reported by the handler (0-100)"
+    )
+    progress_message: str | None = None
 
     class Config:
         from_attributes = True
+
+
+class TaskBulkCancel(BaseModel):
+    """Schema for cancelling many tasks at once
+
+    Criteria are combined with AND; at least one is required.
+    """
+
+    ids: list[int] | None = Field(
+        None, max_length=settings.BULK_CANCEL_MAX_IDS, examples=[[1, 2, 3]]
+    )
+    status: Status | None = Field(None, examples=[Status.NEW])
+    priority: Priority | None = Field(None, examples=[Priority.LOW])
+    created_before: datetime | None = Field(
+        None, description="Only tasks created before this moment"
+    )
+
+    @model_validator(mode="after")
+    def check_criteria(self) -> "TaskBulkCancel":
+        if self.ids is None and not (
+            self.status or self.priority or self.created_before
+        ):
+            raise ValueError("Specify ids or at least one filter")
+        return self
+
+
+class TaskBulkCancelResult(BaseModel):
+    """Schema for the result of a bulk cancel"""
+
+    cancelled: int
+    ids: list[int]
+
+
+class CountMode(str, Enum):
+    """How the X-Total-Count header of a task listing is computed"""
+
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    CACHED = "cached"
+
+
+class ExportFormat(str, Enum):
+    """Output format of the task export"""
+
+    NDJSON = "ndjson"
+    CSV = "csv"
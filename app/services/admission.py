@@ -0,0 +1,123 @@
+import asyncio
+import math
+import time
+from typing import Optional
+
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import LatencyTracker, db_latency, metrics
+from app.db.models.task import Priority
+from app.services.queue_backend import QueueBackend, get_queue_backend
+
+logger = structlog.get_logger()
+
+# Retry-After не растёт бесконечно при сильной перегрузке
+MAX_RETRY_AFTER = 60
+
+rejected = metrics.counter(
+    "tasks_rejected_total", "Task creations rejected by admission"
+)
+queue_depth_gauge = metrics.gauge("task_queue_depth", "Sampled queue depth")
+
+
+def parse_priority_limits(value: str) -> dict[Priority, float]:
+    """``HIGH:0,MEDIUM:500,LOW:200`` -> пороги по приоритетам (0 — без порога)."""
+    limits = {priority: 0.0 for priority in Priority}
+    for part in value.split(","):
+        name, limit = part.split(":")
+        limits[Priority(name.strip().upper())] = float(limit)
+    return limits
+
+
+class AdmissionController:
+    """Решает, принимать ли новую задачу при текущей нагрузке.
+
+    Глубина очереди замеряется у бэкенда не чаще раза в ``sample_interval``
+    секунд (одновременные запросы ждут один замер), задержка БД — скользящее
+    среднее по запросам этого процесса. Пороги задаются по приоритетам, так
+    что при перегрузке сначала отсекается LOW, а HIGH по-прежнему принимается.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[QueueBackend] = None,
+        max_queue_depth: Optional[dict[Priority, float]] = None,
+        max_db_latency_ms: Optional[dict[Priority, float]] = None,
+        latency: LatencyTracker = db_latency,
+        sample_interval: float = settings.ADMISSION_SAMPLE_INTERVAL,
+        retry_after: int = settings.ADMISSION_RETRY_AFTER,
+    ) -> None:
+        self.backend = backend
+        self.max_queue_depth = max_queue_depth or parse_priority_limits(
+            settings.ADMISSION_MAX_QUEUE_DEPTH
+        )
+        self.max_db_latency_ms = max_db_latency_ms or parse_priority_limits(
+            settings.ADMISSION_MAX_DB_LATENCY_MS
+        )
+        self.latency = latency
+        self.sample_interval = sample_interval
+        self.retry_after = retry_after
+        self._depth: Optional[int] = None
+        self._sampled_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def queue_depth(self) -> Optional[int]:
+        """Последний замер глубины очереди (обновляется не чаще sample_interval)."""
+        if self._fresh():
+            return self._depth
+        async with self._lock:
+            if self._fresh():
+                return self._depth
+            backend = self.backend or get_queue_backend()
+            # Больше наибольшего порога считать незачем
+            limit = int(max(self.max_queue_depth.values())) + 1
+            try:
+                self._depth = await backend.queue_depth(limit)
+            except Exception as exc:
+                # Не смогли замерить — не отказываем, а ждём следующего замера
+                logger.warning("Failed to sample queue depth", error=str(exc))
+                self._depth = None
+            self._sampled_at = time.monotonic()
+            if self._depth is not None:
+                queue_depth_gauge.set(self._depth)
+            return self._depth
+
+    def _fresh(self) -> bool:
+        return (
+            self._sampled_at is not None
+            and time.monotonic() - self._sampled_at < self.sample_interval
+        )
+
+    async def check(self, priority: Priority) -> Optional[int]:
+        """``None`` — задачу принять, иначе число секунд для Retry-After."""
+        overload = 0.0
+        reason = None
+
+        max_latency = self.max_db_latency_ms[priority]
+        latency_ms = self.latency.value * 1000
+        if max_latency and latency_ms > max_latency:
+            overload, reason = latency_ms / max_latency, "db_latency"
+
+        max_depth = self.max_queue_depth[priority]
+        if max_depth:
+            depth = await self.queue_depth()
+            if depth is not None and depth > max_depth:
+                if depth / max_depth > overload:
+                    overload, reason = depth / max_depth, "queue_depth"
+
+        if reason is None:
+            return None
+        rejected.inc(priority=priority.value, reason=reason)
+        return min(math.ceil(self.retry_after * overload), MAX_RETRY_AFTER)
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Синглтон контроля приёма для процесса API."""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
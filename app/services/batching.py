@@ -0,0 +1,100 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Optional
+
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.queue_backend import QueueMessage
+
+logger = structlog.get_logger()
+
+batch_sizes = metrics.histogram(
+    "task_batch_size",
+    "Messages per batch handed to the batch handler",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+# Исход каждого сообщения пачки в том же порядке: None — подтвердить,
+# исключение — отклонить это сообщение
+BatchHandler = Callable[[list[QueueMessage]], Awaitable[list[Optional[Exception]]]]
+
+
+class BatchCollector:
+    """Собирает сообщения очереди в пачки для пакетного обработчика.
+
+    Пачка уходит обработчику, как только в ней ``max_size`` сообщений или
+    через ``max_wait`` секунд после первого. Каждое сообщение остаётся
+    неподтверждённым, пока обработчик не вернёт его исход, и подтверждается
+    или отклоняется само по себе: ошибка одного не затрагивает остальные.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        max_size: int = settings.BATCH_MAX_SIZE,
+        max_wait: float = settings.BATCH_MAX_WAIT_MS / 1000,
+    ) -> None:
+        self.handler = handler
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: list[tuple[QueueMessage, asyncio.Future[None]]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: set[asyncio.Task[None]] = set()
+
+    async def submit(self, message: QueueMessage) -> None:
+        """Обработчик для бэкенда очереди: ждёт исхода сообщения в его пачке."""
+        async with message.process():
+            loop = asyncio.get_running_loop()
+            done: asyncio.Future[None] = loop.create_future()
+            self._pending.append((message, done))
+            if len(self._pending) >= self.max_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self.flush)
+            # Исключение исхода выходит из process() и отклоняет сообщение
+            await done
+
+    def flush(self) -> None:
+        """Отдать обработчику накопленную пачку, не дожидаясь её заполнения."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def pause(self) -> int:
+        """Отдать обработчику неполную пачку сразу, не дожидаясь max_wait."""
+        self.flush()
+        return 0
+
+    def cancel(self) -> None:
+        """Прервать пачки, не успевшие обработаться."""
+        for task in list(self._batches):
+            task.cancel()
+
+    async def _run(
+        self, batch: list[tuple[QueueMessage, asyncio.Future[None]]]
+    ) -> None:
+        batch_sizes.observe(len(batch))
+        try:
+            outcomes = await self.handler([message for message, _ in batch])
+        except asyncio.CancelledError:
+            # Сообщения прерванной пачки уже возвращены брокеру (nack)
+            for _, done in batch:
+                done.cancel()
+            raise
+        except Exception as exc:
+            logger.error("Batch handler failed", size=len(batch), error=str(exc))
+            outcomes = [exc] * len(batch)
+        for (_, done), outcome in zip(batch, outcomes):
+            if done.done():
+                continue
+            if outcome is None:
+                done.set_result(None)
+            else:
+                done.set_exception(outcome)
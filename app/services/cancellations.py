@@ -0,0 +1,41 @@
+from collections.abc import Iterable
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+_cancelled: Optional["CancelledTasks"] = None
+
+
+class CancelledTasks:
+    """Недавно отменённые задачи, о которых воркеру сообщил API.
+
+    Сообщение такой задачи воркер подтверждает и отбрасывает, не обращаясь
+    к БД. Набор — лишь ускорение: задачу, которой в нём нет (воркер
+    перезапущен, запись вытеснена), отсеет проверка статуса в БД.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.CANCELLED_CACHE_SIZE,
+        ttl: float = settings.CANCELLED_CACHE_TTL,
+    ) -> None:
+        self._ids: TTLCache[int, bool] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def add(self, task_ids: Iterable[int]) -> None:
+        for task_id in task_ids:
+            self._ids.set(task_id, True)
+
+    def __contains__(self, task_id: int) -> bool:
+        return self._ids.get(task_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def get_cancelled_tasks() -> CancelledTasks:
+    """Синглтон: отменённые задачи для текущего процесса воркера."""
+    global _cancelled
+    if _cancelled is None:
+        _cancelled = CancelledTasks()
+    return _cancelled
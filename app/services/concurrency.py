@@ -0,0 +1,157 @@
+import asyncio
+import math
+from collections.abc import Awaitable, Callable
+from typing import Optional
+
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import LatencyTracker, db_pool_wait, metrics
+
+logger = structlog.get_logger()
+
+# Во сколько раз уменьшается предел при перегрузке (мультипликативная часть AIMD)
+BACKOFF = 0.75
+# Насколько базовая задержка может подрасти за один пересчёт: базовая линия
+# следует за сменой нагрузки, но медленно
+BASELINE_DRIFT = 0.05
+
+limit_gauge = metrics.gauge("worker_concurrency_limit", "Adaptive in-flight limit")
+prefetch_gauge = metrics.gauge("worker_prefetch", "Broker prefetch per queue")
+adjustments = metrics.counter(
+    "worker_concurrency_adjustments_total", "Concurrency limit changes"
+)
+handler_latency = metrics.histogram(
+    "task_handler_seconds", "Time spent handling a message"
+)
+
+LimitListener = Callable[[int], Awaitable[None]]
+
+
+class AdaptiveConcurrencyLimiter:
+    """Подбирает предел одновременных задач воркера (AIMD).
+
+    Раз в ``interval`` секунд смотрит на окно наблюдений:
+
+    * доля ошибок выше ``max_error_rate``, ожидание соединения из пула БД
+      дольше ``max_pool_wait_ms`` или средняя задержка обработчика выше
+      базовой в ``latency_tolerance`` раз — предел умножается на ``BACKOFF``;
+    * иначе, если все слоты были заняты, — предел растёт на единицу.
+
+    Базовая задержка — наименьшая средняя за окно, медленно дрейфующая вверх.
+    """
+
+    def __init__(
+        self,
+        initial: int = settings.MAX_CONCURRENCY,
+        min_limit: int = settings.CONCURRENCY_LIMIT_MIN,
+        max_limit: int = settings.CONCURRENCY_LIMIT_MAX,
+        interval: float = settings.CONCURRENCY_ADJUST_INTERVAL,
+        max_error_rate: float = settings.CONCURRENCY_MAX_ERROR_RATE,
+        max_pool_wait_ms: float = settings.CONCURRENCY_MAX_POOL_WAIT_MS,
+        latency_tolerance: float = settings.CONCURRENCY_LATENCY_TOLERANCE,
+        pool_wait: LatencyTracker = db_pool_wait,
+        on_change: Optional[LimitListener] = None,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(max(initial, min_limit), max_limit)
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+        self.max_pool_wait_ms = max_pool_wait_ms
+        self.latency_tolerance = latency_tolerance
+        self.pool_wait = pool_wait
+        self.on_change = on_change
+        self.baseline: Optional[float] = None
+        self._reset_window()
+        self._stopped = asyncio.Event()
+        limit_gauge.set(self.limit)
+
+    def _reset_window(self) -> None:
+        self._count = 0
+        self._errors = 0
+        self._latency_sum = 0.0
+        self._saturated = False
+
+    def observe(self, latency: float, error: bool, saturated: bool) -> None:
+        """Учесть завершённое сообщение; ``saturated`` — были заняты все слоты."""
+        self._count += 1
+        self._errors += error
+        self._latency_sum += latency
+        self._saturated = self._saturated or saturated
+        handler_latency.observe(latency)
+
+    def adjust(self) -> int:
+        """Пересчитать предел по накопленному окну и начать новое окно."""
+        if not self._count:
+            return self.limit
+
+        latency = self._latency_sum / self._count
+        error_rate = self._errors / self._count
+        pool_wait_ms = self.pool_wait.value * 1000
+
+        reason = None
+        if error_rate > self.max_error_rate:
+            reason = "errors"
+        elif self.max_pool_wait_ms and pool_wait_ms > self.max_pool_wait_ms:
+            reason = "db_pool_wait"
+        elif self.baseline and latency > self.baseline * self.latency_tolerance:
+            reason = "latency"
+
+        previous = self.limit
+        if reason is not None:
+            self.limit = max(self.min_limit, math.floor(self.limit * BACKOFF))
+        elif self._saturated:
+            reason = "saturated"
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        if self.baseline is None:
+            self.baseline = latency
+        else:
+            self.baseline = min(latency, self.baseline * (1 + BASELINE_DRIFT))
+
+        if self.limit != previous:
+            direction = "up" if self.limit > previous else "down"
+            adjustments.inc(direction=direction, reason=reason or "")
+            limit_gauge.set(self.limit)
+            logger.info(
+                "Concurrency limit adjusted",
+                previous=previous,
+                limit=self.limit,
+                reason=reason,
+                latency_ms=round(latency * 1000, 3),
+                baseline_ms=round(self.baseline * 1000, 3),
+                error_rate=round(error_rate, 4),
+                pool_wait_ms=round(pool_wait_ms, 3),
+            )
+        self._reset_window()
+        return self.limit
+
+    async def run(self) -> None:
+        logger.info("Adaptive concurrency started", limit=self.limit)
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            previous = self.limit
+            if self.adjust() != previous and self.on_change is not None:
+                try:
+                    await self.on_change(self.limit)
+                except Exception as exc:
+                    logger.error("Failed to apply concurrency limit", error=str(exc))
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def prefetch_for(limit: int) -> int:
+    """Prefetch очереди, сохраняющий настроенное соотношение с пределом.
+
+    Значение округляется вверх до степени двойки: смена prefetch стоит
+    переподписки потребителей, а так её вызывают только кратные изменения
+    предела, а не каждый шаг AIMD.
+    """
+    ratio = settings.QUEUE_PREFETCH / max(settings.MAX_CONCURRENCY, 1)
+    prefetch = max(1, math.ceil(limit * ratio))
+    return 1 << (prefetch - 1).bit_length()
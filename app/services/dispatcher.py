@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any, Optional
+
+import structlog
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.models.task import Priority
+from app.services.queue_backend import MessageHandler, QueueMessage
+
+logger = structlog.get_logger()
+
+# Порядок обхода классов в раунде deficit round-robin
+PRIORITY_ORDER = (Priority.HIGH, Priority.MEDIUM, Priority.LOW)
+
+queue_wait = metrics.histogram(
+    "task_queue_wait_seconds", "Time from publishing a task to starting it"
+)
+dispatched = metrics.counter("tasks_dispatched_total", "Tasks started by priority")
+
+# (задержка обработчика, была ли ошибка, были ли заняты все слоты)
+Observer = Callable[[float, bool, bool], None]
+
+
+def parse_weights(value: str) -> dict[Priority, float]:
+    """``HIGH:70,MEDIUM:25,LOW:5`` -> веса классов приоритета."""
+    weights = {priority: 0.0 for priority in PRIORITY_ORDER}
+    for part in value.split(","):
+        name, weight = part.split(":")
+        weights[Priority(name.strip().upper())] = float(weight)
+    if any(weight <= 0 for weight in weights.values()):
+        raise ValueError(f"All priorities need a positive weight: {value}")
+    return weights
+
+
+class WeightedFairDispatcher:
+    """Диспетчер воркера: делит слоты обработки между приоритетами по весам.
+
+    Сообщения из очередей разных приоритетов буферизуются локально (размер
+    буфера ограничен prefetch брокера), а свободный слот получает следующее
+    сообщение по алгоритму deficit round-robin. При весах 70/25/5 и полной
+    загрузке LOW получает не меньше 5% слотов; пока других задач нет, LOW
+    занимает все слоты.
+    """
+
+    def __init__(
+        self,
+        handler: MessageHandler,
+        weights: Optional[dict[Priority, float]] = None,
+        concurrency: int = settings.MAX_CONCURRENCY,
+        observer: Optional[Observer] = None,
+    ) -> None:
+        self.handler = handler
+        self.observer = observer
+        weights = weights or parse_weights(settings.PRIORITY_WEIGHTS)
+        smallest = min(weights.values())
+        # Квант на раунд в «задачах»; наименьший вес получает одну задачу
+        self.quantum = {priority: weights[priority] / smallest for priority in weights}
+        self.concurrency = concurrency
+        self._queues: dict[Priority, deque[tuple[QueueMessage, asyncio.Future]]] = {
+            priority: deque() for priority in PRIORITY_ORDER
+        }
+        self._deficit = {priority: 0.0 for priority in PRIORITY_ORDER}
+        self._cursor = 0
+        self._running = 0
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.paused = False
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """Изменить число слотов; лишние задачи доработают, новые не начнутся."""
+        self.concurrency = concurrency
+        self._dispatch()
+
+    async def submit(self, message: QueueMessage) -> None:
+        """Обработчик для бэкенда очереди: ждёт, пока сообщение не обработают.
+
+        Ожидание сохраняет обратное давление: бэкенд не выдаёт новых
+        сообщений сверх prefetch, пока эти не подтверждены.
+        """
+        priority = getattr(message, "priority", None) or Priority.MEDIUM
+        done: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((message, done))
+        self._dispatch()
+        await done
+
+    def _next(self) -> Optional[tuple[Priority, QueueMessage, asyncio.Future]]:
+        """Выбрать следующее сообщение (deficit round-robin, стоимость задачи 1)."""
+        if not any(self._queues.values()):
+            return None
+        while True:
+            priority = PRIORITY_ORDER[self._cursor]
+            queue = self._queues[priority]
+            if queue and self._deficit[priority] >= 1:
+                self._deficit[priority] -= 1
+                message, done = queue.popleft()
+                return priority, message, done
+            if not queue:
+                # Пустой класс не копит кредит
+                self._deficit[priority] = 0.0
+            self._cursor = (self._cursor + 1) % len(PRIORITY_ORDER)
+            following = PRIORITY_ORDER[self._cursor]
+            if self._queues[following]:
+                self._deficit[following] += self.quantum[following]
+
+    async def pause(self) -> int:
+        """Не запускать новые сообщения, а буферизованные вернуть брокеру.
+
+        Возвращает число возвращённых сообщений; начатые дорабатываются.
+        """
+        self.paused = True
+        returned = 0
+        for queue in self._queues.values():
+            while queue:
+                message, done = queue.popleft()
+                await message.nack(requeue=True)
+                if not done.done():
+                    done.set_result(None)
+                returned += 1
+        return returned
+
+    def cancel(self) -> None:
+        """Прервать обработчики, не успевшие завершиться."""
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _dispatch(self) -> None:
+        if self.paused:
+            return
+        while self._running < self.concurrency:
+            selected = self._next()
+            if selected is None:
+                return
+            priority, message, done = selected
+            self._running += 1
+            task = asyncio.create_task(self._run(priority, message, done))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self, priority: Priority, message: QueueMessage, done: asyncio.Future
+    ) -> None:
+        enqueued_at: Any = getattr(message, "enqueued_at", None)
+        if enqueued_at is not None:
+            queue_wait.observe(
+                max(time.time() - enqueued_at, 0.0), priority=priority.value
+            )
+        dispatched.inc(priority=priority.value)
+        started = time.perf_counter()
+        error = False
+        try:
+            await self.handler(message)
+        except Exception as exc:
+            error = True
+            logger.error("Message handler failed", error=str(exc))
+        finally:
+            if self.observer is not None:
+                self.observer(
+                    time.perf_counter() - started,
+                    error,
+                    self._running >= self.concurrency,
+                )
+            self._running -= 1
+            if not done.done():
+                done.set_result(None)
+            self._dispatch()
+
+    def buffered(self) -> dict[str, int]:
+        return {priority.value: len(queue) for priority, queue in self._queues.items()}
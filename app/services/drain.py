@@ -0,0 +1,64 @@
+import asyncio
+
+from app.core.metrics import metrics
+from app.services.queue_backend import MessageHandler, QueueMessage
+
+drain_duration = metrics.histogram(
+    "worker_drain_seconds", "Time from the stop signal to a drained worker"
+)
+drained_messages = metrics.counter(
+    "worker_drain_messages_total", "Messages finished or returned while draining"
+)
+
+
+class InFlightMessages:
+    """Сообщения, выданные воркеру и ещё не обработанные.
+
+    ``wrap`` оборачивает обработчик бэкенда очереди. При остановке воркер
+    ждёт, пока обработчики доработают (``wait``), а то, что не успело,
+    возвращает брокеру (``nack_all``). Сообщение, доставленное уже после
+    начала остановки, сразу возвращается.
+    """
+
+    def __init__(self) -> None:
+        self.draining = False
+        self._messages: set[QueueMessage] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def wrap(self, handler: MessageHandler) -> MessageHandler:
+        async def tracked(message: QueueMessage) -> None:
+            if self.draining:
+                # Пришло между отменой подписки и её подтверждением брокером
+                await message.nack(requeue=True)
+                drained_messages.inc(outcome="returned")
+                return
+            self._messages.add(message)
+            self._idle.clear()
+            try:
+                await handler(message)
+            finally:
+                self._messages.discard(message)
+                if not self._messages:
+                    self._idle.set()
+
+        return tracked
+
+    async def wait(self, timeout: float) -> bool:
+        """Дождаться обработки всех сообщений; False — не успели за timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def nack_all(self) -> int:
+        """Вернуть брокеру все необработанные сообщения."""
+        returned = 0
+        for message in list(self._messages):
+            await message.nack(requeue=True)
+            returned += 1
+        return returned
+
+    def __len__(self) -> int:
+        return len(self._messages)
@@ -0,0 +1,77 @@
+import csv
+import enum
+import io
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.models.task import Status
+from app.repositories.task_repository import EXPORT_COLUMNS, TaskRepository
+from app.schemas.task import ExportFormat
+
+FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_line(row: dict[str, Any]) -> str:
+    return json.dumps({key: _plain(value) for key, value in row.items()}) + "\n"
+
+
+def _csv_line(values: list[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+async def export_tasks(
+    session_factory: async_sessionmaker[AsyncSession],
+    export_format: ExportFormat,
+    status: Optional[Status] = None,
+    priority: Optional[str] = None,
+    q: Optional[str] = None,
+    batch_size: int = settings.EXPORT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """Выгрузка задач построчно для StreamingResponse.
+
+    Задачи читаются пачками по ``batch_size`` с последнего отданного id
+    (keyset), каждая пачка — в своей короткой сессии, которая закрывается
+    до отдачи строк клиенту. Память не зависит от объёма выгрузки, а
+    медленный или зависший клиент не держит открытыми ни курсор, ни
+    транзакцию.
+    """
+    if export_format == ExportFormat.CSV:
+        yield _csv_line(FIELDS).encode()
+
+    last_id = 0
+    while True:
+        async with session_factory() as session:
+            rows = await TaskRepository(session).get_export_batch(
+                status, priority, q, after_id=last_id, limit=batch_size
+            )
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        for row in rows:
+            if export_format == ExportFormat.CSV:
+                line = _csv_line([_plain(row[field]) for field in FIELDS])
+            else:
+                line = _ndjson_line(row)
+            yield line.encode()
+        if len(rows) < batch_size:
+            return
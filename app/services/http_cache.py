@@ -0,0 +1,122 @@
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Response
+from pydantic import BaseModel
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.models.task import Status
+
+# Задача в этих статусах больше не меняется
+TERMINAL_STATUSES = frozenset({Status.COMPLETED, Status.FAILED, Status.CANCELLED})
+
+task_responses = metrics.counter(
+    "task_http_responses_total", "Task GET responses by cache outcome"
+)
+
+# (представление: "task" | "status", id задачи)
+ResponseKey = tuple[str, int]
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """Готовый ответ на GET задачи вместе с его валидаторами."""
+
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]
+    terminal: bool
+
+    @classmethod
+    def build(
+        cls,
+        payload: BaseModel,
+        status: Status,
+        last_modified: Optional[datetime],
+    ) -> "CachedResponse":
+        body = payload.model_dump_json().encode()
+        # ETag — хэш тела: любое изменение задачи, включая прогресс, меняет его
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if last_modified is not None and last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        if last_modified is not None and status not in TERMINAL_STATUSES:
+            # Last-Modified точен до секунды: незавершённая задача помечается
+            # секундой раньше, чтобы завершение в ту же секунду было новее
+            # её отметки для If-Modified-Since
+            last_modified = last_modified.replace(microsecond=0) - timedelta(
+                seconds=1
+            )
+        return cls(body, etag, last_modified, status in TERMINAL_STATUSES)
+
+    def headers(self) -> dict[str, str]:
+        headers = {"ETag": self.etag}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.astimezone(timezone.utc), usegmt=True
+            )
+        if self.terminal:
+            headers["Cache-Control"] = (
+                f"public, max-age={settings.TASK_HTTP_CACHE_MAX_AGE}, immutable"
+            )
+        else:
+            # Клиент может хранить ответ, но обязан перепроверять его
+            headers["Cache-Control"] = "no-cache"
+        return headers
+
+    def not_modified(
+        self, if_none_match: Optional[str], if_modified_since: Optional[str]
+    ) -> bool:
+        """Совпадают ли валидаторы запроса с ответом (RFC 9110, 13.1)."""
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag in tags
+        # Last-Modified точен только для завершённых задач: прогресс
+        # выполняющейся меняется без отметки времени
+        if if_modified_since is None or not self.terminal or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.last_modified.replace(microsecond=0) <= since
+
+    def respond(
+        self, if_none_match: Optional[str], if_modified_since: Optional[str]
+    ) -> Response:
+        if self.not_modified(if_none_match, if_modified_since):
+            return Response(status_code=HTTP_304_NOT_MODIFIED, headers=self.headers())
+        return Response(
+            content=self.body, media_type="application/json", headers=self.headers()
+        )
+
+
+_cache: Optional[TTLCache[ResponseKey, CachedResponse]] = None
+
+
+def get_task_response_cache() -> TTLCache[ResponseKey, CachedResponse]:
+    """Кэш ответов на GET завершённых задач.
+
+    Завершённая задача неизменна, поэтому её ответ и валидаторы хранятся в
+    памяти процесса, и повторный опрос (в том числе условный) не обращается
+    к БД. Незавершённые задачи сюда не попадают.
+    """
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(
+            maxsize=settings.TASK_HTTP_CACHE_SIZE,
+            ttl=settings.TASK_HTTP_CACHE_TTL,
+        )
+    return _cache
+
+
+def remember(key: ResponseKey, response: CachedResponse) -> None:
+    if response.terminal:
+        get_task_response_cache().set(key, response)
@@ -0,0 +1,23 @@
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.schemas.task import TaskRead
+
+_cache: Optional[TTLCache[str, TaskRead]] = None
+
+
+def get_idempotency_cache() -> TTLCache[str, TaskRead]:
+    """Кэш ответов на повторные запросы с тем же Idempotency-Key.
+
+    Хранит задачу в том виде, в каком она была возвращена при создании,
+    поэтому частый повтор (ретрай клиента по таймауту) обслуживается
+    без обращения к БД.
+    """
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(
+            maxsize=settings.IDEMPOTENCY_CACHE_SIZE,
+            ttl=settings.IDEMPOTENCY_KEY_TTL,
+        )
+    return _cache
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.models.task import Priority
+from app.repositories.task_repository import TaskRepository
+from app.services.task_processor import TaskProcessor
+
+logger = structlog.get_logger()
+
+
+async def publish_released(
+    processor: TaskProcessor,
+    session_factory: async_sessionmaker[AsyncSession],
+    tasks: list[tuple[int, Priority]],
+) -> int:
+    """Опубликовать задачи, уже переведённые в NEW. Возвращает число опубликованных.
+
+    Если брокер недоступен, неопубликованные задачи отдаются сборщику аренд
+    (IN_PROGRESS с истёкшей арендой): иначе они остались бы в NEW без
+    сообщения в очереди, и их никто бы не забрал.
+    """
+    published: set[int] = set()
+    try:
+        for task_id, priority in tasks:
+            await processor.enqueue(str(task_id), priority)
+            published.add(task_id)
+    except Exception as exc:
+        unpublished = [task_id for task_id, _ in tasks if task_id not in published]
+        logger.error(
+            "Failed to publish released tasks", task_ids=unpublished, error=str(exc)
+        )
+        async with session_factory() as session:
+            await TaskRepository(session).expire_for_requeue(unpublished)
+    return len(published)
+
+
+class LeaseKeeper:
+    """Продлевает аренду задач, которые сейчас выполняет этот воркер.
+
+    Обработчики лишь добавляют и убирают id задачи; продление для всех
+    выполняющихся задач делается одним UPDATE раз в ``interval`` секунд.
+    """
+
+    def __init__(
+        self,
+        owner: str = settings.WORKER_ID,
+        lease_ttl: float = settings.LEASE_TTL,
+        interval: float = settings.HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.task_ids: set[int] = set()
+        self._stopped = asyncio.Event()
+
+    def track(self, task_id: int) -> None:
+        self.task_ids.add(task_id)
+
+    def untrack(self, task_id: int) -> None:
+        self.task_ids.discard(task_id)
+
+    async def renew(self, session_factory: async_sessionmaker[AsyncSession]) -> int:
+        """Продлить аренду всех отслеживаемых задач."""
+        if not self.task_ids:
+            return 0
+        async with session_factory() as session:
+            return await TaskRepository(session).renew_leases(
+                list(self.task_ids), self.owner, self.lease_ttl
+            )
+
+    async def run(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.renew(session_factory)
+            except Exception as exc:
+                logger.error("Failed to renew task leases", error=str(exc))
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class LeaseReaper:
+    """Возвращает в очередь задачи с истёкшей арендой (упавший воркер).
+
+    Задача, исчерпавшая ``max_attempts`` попыток, помечается FAILED.
+    Выборка идёт по частичному индексу ``ix_tasks_lease_expires_at``.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        processor: TaskProcessor,
+        interval: float = settings.REAPER_INTERVAL,
+        batch_size: int = settings.REAPER_BATCH_SIZE,
+        max_attempts: int = settings.MAX_ATTEMPTS,
+    ) -> None:
+        self.session_factory = session_factory
+        self.processor = processor
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._stopped = asyncio.Event()
+
+    async def run_once(self) -> int:
+        """Один проход. Возвращает число обработанных задач."""
+        async with self.session_factory() as session:
+            requeued, failed = await TaskRepository(session).reap_expired_leases(
+                datetime.now(timezone.utc), self.max_attempts, self.batch_size
+            )
+        await publish_released(self.processor, self.session_factory, requeued)
+        if requeued or failed:
+            logger.warning(
+                "Reaped tasks with expired leases",
+                requeued=[task_id for task_id, _ in requeued],
+                failed=failed,
+            )
+        return len(requeued) + len(failed)
+
+    async def run(self) -> None:
+        logger.info("Lease reaper started", interval=self.interval)
+        while not self._stopped.is_set():
+            try:
+                reaped = await self.run_once()
+            except Exception as exc:
+                logger.error("Lease reaper iteration failed", error=str(exc))
+                reaped = 0
+            if reaped >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+_lease_keeper: Optional[LeaseKeeper] = None
+
+
+def get_lease_keeper() -> LeaseKeeper:
+    """Синглтон: аренды задач текущего процесса воркера."""
+    global _lease_keeper
+    if _lease_keeper is None:
+        _lease_keeper = LeaseKeeper()
+    return _lease_keeper
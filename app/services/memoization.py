@@ -0,0 +1,23 @@
+from app.core.metrics import metrics
+from app.db.models.task import Status
+from app.db.models.task import Task as TaskModel
+
+memo_outcomes = metrics.counter(
+    "task_memo_total", "Memoized task creations by outcome (hit, coalesced, miss)"
+)
+
+
+def record_memo_outcome(task: TaskModel) -> str:
+    """Учесть исход создания задачи с memoize для метрики доли попаданий.
+
+    ``hit`` — взят готовый результат, ``coalesced`` — задача ждёт такую же
+    выполняющуюся, ``miss`` — задача выполнится сама.
+    """
+    if task.memo_of is None:
+        outcome = "miss"
+    elif task.status == Status.COMPLETED:
+        outcome = "hit"
+    else:
+        outcome = "coalesced"
+    memo_outcomes.inc(outcome=outcome)
+    return outcome
@@ -0,0 +1,81 @@
+"""Формат сообщений очереди задач.
+
+Версия 1 — массив msgpack ``[версия, id, приоритет, заголовок, описание]``:
+воркер получает всё, что нужно обработчику, и не читает строку задачи из БД.
+Новые поля добавляются в конец массива (старые воркеры их игнорируют), номер
+версии меняется только при несовместимом изменении.
+
+Старый формат — id задачи текстом (``b"42"``) — по-прежнему принимается:
+его публикуют планировщик, сборщик аренд, релиз зависимых задач и API при
+``QUEUE_MESSAGE_FORMAT=id``. Первый байт массива msgpack (0x90–0x9f) не
+бывает цифрой, поэтому форматы различаются однозначно.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import msgpack
+
+from app.db.models.task import Priority
+from app.db.models.task import Task as TaskModel
+
+MESSAGE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class TaskMessage:
+    """Задача в том виде, в каком её получает воркер.
+
+    ``version`` 0 — сообщение старого формата с одним id: входных данных
+    в нём нет, и воркер читает строку задачи сам.
+    """
+
+    id: int
+    priority: Priority = Priority.MEDIUM
+    title: Optional[str] = None
+    description: Optional[str] = None
+    version: int = MESSAGE_VERSION
+
+    @property
+    def complete(self) -> bool:
+        return self.version >= 1
+
+    @classmethod
+    def from_task(cls, task: TaskModel) -> "TaskMessage":
+        return cls(task.id, Priority(task.priority), task.title, task.description)
+
+
+def encode_task_message(message: TaskMessage) -> bytes:
+    return msgpack.packb(
+        [
+            MESSAGE_VERSION,
+            message.id,
+            message.priority.value,
+            message.title,
+            message.description,
+        ],
+        use_bin_type=True,
+    )
+
+
+def decode_task_message(
+    body: bytes, priority: Optional[Priority] = None
+) -> TaskMessage:
+    """Разобрать тело сообщения любого поддерживаемого формата.
+
+    ``priority`` — приоритет очереди, из которой пришло сообщение старого
+    формата. Нераспознанное тело — ValueError.
+    """
+    if body[:1].isdigit():
+        return TaskMessage(int(body), priority or Priority.MEDIUM, version=0)
+    try:
+        fields = msgpack.unpackb(body, raw=False)
+    except (ValueError, msgpack.UnpackException) as exc:
+        raise ValueError(f"Malformed task message: {exc}") from exc
+    if not isinstance(fields, list) or not fields or fields[0] != MESSAGE_VERSION:
+        raise ValueError("Unsupported task message version")
+    try:
+        _, task_id, priority_value, title, description = fields[:5]
+        return TaskMessage(int(task_id), Priority(priority_value), title, description)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Malformed task message: {exc}") from exc
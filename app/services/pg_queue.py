@@ -0,0 +1,200 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.models.task import Priority
+from app.repositories.task_repository import TaskRepository
+from app.services.queue_backend import MessageHandler, QueueBackend
+
+logger = structlog.get_logger()
+
+
+class PgQueueMessage:
+    """Задача, забранная воркером из таблицы tasks."""
+
+    def __init__(self, task_id: int, priority: Priority) -> None:
+        self.body = str(task_id).encode()
+        self.priority = priority
+
+    @asynccontextmanager
+    async def process(self) -> AsyncIterator["PgQueueMessage"]:
+        # Подтверждать нечего: состояние задачи хранится в самой строке
+        yield self
+
+    async def nack(self, requeue: bool = True) -> None:
+        # Задача уже в аренде воркера: при остановке её возвращает в NEW
+        # TaskRepository.release_leases
+        return
+
+
+class PostgresQueueBackend(QueueBackend):
+    """Очередь без брокера: воркеры забирают NEW-задачи прямо из таблицы.
+
+    Выборка идёт пачками через ``FOR UPDATE SKIP LOCKED`` по частичному
+    индексу ``ix_tasks_ready``, поэтому воркеры не блокируют друг друга;
+    забранные задачи сразу оформляются в аренду этого воркера.
+    Публикация — это ``NOTIFY``: воркер просыпается сразу, а не по таймеру;
+    ``idle_timeout`` лишь страхует от потерянных уведомлений.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker[AsyncSession]] = None,
+        concurrency: int = settings.MAX_CONCURRENCY,
+        batch_size: int = settings.PG_QUEUE_BATCH_SIZE,
+        idle_timeout: float = settings.PG_QUEUE_IDLE_TIMEOUT,
+        channel: str = settings.PG_QUEUE_CHANNEL,
+    ) -> None:
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.channel = channel
+        self._wakeup = asyncio.Event()
+        self._slot_freed = asyncio.Event()
+        self._consumer: Optional[asyncio.Task[None]] = None
+        self._in_flight: set[asyncio.Task[None]] = set()
+        self._listener: Any = None
+        self._closing = False
+
+    async def initialize(self) -> None:
+        if self.session_factory is None:
+            from app.db.session import AsyncSessionLocal
+
+            self.session_factory = AsyncSessionLocal
+
+    def _is_postgres(self, session: AsyncSession) -> bool:
+        return session.bind.dialect.name == "postgresql"
+
+    async def publish(
+        self, body: bytes, priority: Priority = Priority.MEDIUM, shard: int = 0
+    ) -> None:
+        # Задача уже лежит в tasks со статусом NEW — достаточно разбудить воркеры.
+        # Тело (msgpack, с описанием задачи) в NOTIFY не передаётся: оно бинарное
+        # и может превысить лимит 8000 байт, а воркер его всё равно не читает
+        self._wakeup.set()
+        await self.initialize()
+        assert self.session_factory is not None
+        async with self.session_factory() as session:
+            if self._is_postgres(session):
+                await session.execute(
+                    text("SELECT pg_notify(:channel, '')"), {"channel": self.channel}
+                )
+                await session.commit()
+
+    async def resize(self, concurrency: int, prefetch: int) -> None:
+        # Забранные задачи сразу в аренде — держим не больше, чем обрабатываем
+        self.concurrency = concurrency
+        self._slot_freed.set()
+
+    async def queue_depth(self, limit: int) -> Optional[int]:
+        await self.initialize()
+        assert self.session_factory is not None
+        async with self.session_factory() as session:
+            return await TaskRepository(session).count_ready(limit)
+
+    async def consume(self, handler: MessageHandler) -> None:
+        await self.initialize()
+        if self._consumer is None:
+            await self._listen()
+            self._consumer = asyncio.create_task(self._consume_loop(handler))
+
+    async def _listen(self) -> None:
+        """Подписаться на NOTIFY отдельным соединением asyncpg."""
+        assert self.session_factory is not None
+        async with self.session_factory() as session:
+            if not self._is_postgres(session):
+                return
+            url = session.bind.url
+
+        import asyncpg
+
+        dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        try:
+            self._listener = await asyncpg.connect(dsn)
+            await self._listener.add_listener(self.channel, self._on_notify)
+        except Exception as exc:
+            logger.warning(
+                "LISTEN failed, falling back to periodic polling", error=str(exc)
+            )
+            self._listener = None
+
+    def _on_notify(self, *args: Any) -> None:
+        self._wakeup.set()
+
+    async def _claim(self, limit: int) -> list[tuple[int, Priority]]:
+        assert self.session_factory is not None
+        async with self.session_factory() as session:
+            return await TaskRepository(session).claim_ready_tasks(
+                limit, settings.WORKER_ID, settings.LEASE_TTL
+            )
+
+    async def _consume_loop(self, handler: MessageHandler) -> None:
+        while not self._closing:
+            free = self.concurrency - len(self._in_flight)
+            if free <= 0:
+                await self._slot_freed.wait()
+                self._slot_freed.clear()
+                continue
+
+            limit = min(free, self.batch_size)
+            # Сбрасываем до выборки: NOTIFY во время запроса не потеряется
+            self._wakeup.clear()
+            try:
+                claimed = await self._claim(limit)
+            except Exception as exc:
+                logger.error("Failed to claim tasks", error=str(exc))
+                claimed = []
+
+            for task_id, priority in claimed:
+                task = asyncio.create_task(
+                    self._dispatch(handler, PgQueueMessage(task_id, priority))
+                )
+                self._in_flight.add(task)
+
+            if len(claimed) < limit:
+                # Очередь пуста — ждём NOTIFY
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _dispatch(self, handler: MessageHandler, message: PgQueueMessage) -> None:
+        try:
+            await handler(message)
+        except Exception as exc:
+            logger.error("Message handler failed", error=str(exc))
+        finally:
+            self._in_flight.discard(asyncio.current_task())  # type: ignore[arg-type]
+            self._slot_freed.set()
+
+    async def stop_consuming(self) -> None:
+        # Новых задач не забираем; уже забранные дорабатываются
+        self._closing = True
+        self._wakeup.set()
+        self._slot_freed.set()
+        if self._consumer is not None:
+            await self._consumer
+            self._consumer = None
+        self._closing = False
+
+    async def close(self) -> None:
+        # Не прерываем запрос на середине: задачи уже помечены IN_PROGRESS,
+        # поэтому даём циклу и текущим обработчикам завершиться
+        self._closing = True
+        self._wakeup.set()
+        self._slot_freed.set()
+        if self._consumer is not None:
+            await self._consumer
+            self._consumer = None
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._closing = False
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
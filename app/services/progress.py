@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Optional
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.models.task import PROGRESS_MESSAGE_LENGTH
+from app.repositories.task_repository import TaskRepository
+
+logger = structlog.get_logger()
+
+progress_reported = metrics.counter(
+    "task_progress_reported_total", "Progress updates reported by handlers"
+)
+progress_written = metrics.counter(
+    "task_progress_written_total", "Progress updates written to the database"
+)
+
+
+class ProgressWriter:
+    """Копит прогресс выполняющихся задач и пишет его в БД пачками.
+
+    Обработчик вызывает ``report`` сколько угодно часто: вызов только
+    запоминает последнее значение для задачи. Раз в ``flush_interval``
+    секунд накопленные значения пишутся одним пакетным UPDATE, причём
+    каждая задача обновляется не чаще раза в ``min_interval`` секунд —
+    промежуточные значения схлопываются в последнее.
+    """
+
+    def __init__(
+        self,
+        owner: str = settings.WORKER_ID,
+        flush_interval: float = settings.PROGRESS_FLUSH_INTERVAL,
+        min_interval: float = settings.PROGRESS_MIN_INTERVAL,
+        batch_size: int = settings.PROGRESS_BATCH_SIZE,
+    ) -> None:
+        self.owner = owner
+        self.flush_interval = flush_interval
+        self.min_interval = min_interval
+        self.batch_size = batch_size
+        # id задачи -> (процент, сообщение), ещё не записанные
+        self.pending: dict[int, tuple[float, Optional[str]]] = {}
+        # id задачи -> момент последней записи
+        self._written_at: dict[int, float] = {}
+        self._stopped = asyncio.Event()
+
+    def report(
+        self, task_id: int, percent: float, message: Optional[str] = None
+    ) -> None:
+        """Сообщить прогресс задачи (0–100) и необязательное сообщение."""
+        if message is not None:
+            message = message[:PROGRESS_MESSAGE_LENGTH]
+        self.pending[task_id] = (min(max(percent, 0.0), 100.0), message)
+        progress_reported.inc()
+
+    def discard(self, task_id: int) -> None:
+        """Забыть задачу: она завершена, её прогресс больше не нужен."""
+        self.pending.pop(task_id, None)
+        self._written_at.pop(task_id, None)
+
+    def _due(self, now: float, force: bool) -> list[tuple[int, float, Optional[str]]]:
+        """Очередная пачка задач, чей прогресс пора записать."""
+        due = []
+        for task_id, (percent, message) in self.pending.items():
+            written_at = self._written_at.get(task_id)
+            if force or written_at is None or now - written_at >= self.min_interval:
+                due.append((task_id, percent, message))
+                if len(due) >= self.batch_size:
+                    break
+        return due
+
+    async def flush(
+        self, session_factory: async_sessionmaker[AsyncSession], force: bool = False
+    ) -> int:
+        """Записать накопленный прогресс; ``force`` — без учёта min_interval."""
+        now = time.monotonic()
+        written = 0
+        while True:
+            due = self._due(now, force)
+            if not due:
+                return written
+            for task_id, _, _ in due:
+                del self.pending[task_id]
+                self._written_at[task_id] = now
+            async with session_factory() as session:
+                await TaskRepository(session).save_progress(due, self.owner)
+            progress_written.inc(len(due))
+            written += len(due)
+
+    async def run(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._stopped.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush(session_factory, force=self._stopped.is_set())
+            except Exception as exc:
+                logger.error("Failed to write task progress", error=str(exc))
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+_progress_writer: Optional[ProgressWriter] = None
+
+
+def get_progress_writer() -> ProgressWriter:
+    """Синглтон: прогресс задач текущего процесса воркера."""
+    global _progress_writer
+    if _progress_writer is None:
+        _progress_writer = ProgressWriter()
+    return _progress_writer
+
+
+def report_progress(
+    task_id: int, percent: float, message: Optional[str] = None
+) -> None:
+    """API для обработчиков задач: сообщить прогресс без обращения к БД."""
+    get_progress_writer().report(task_id, percent, message)
@@ -0,0 +1,498 @@
+import asyncio
+import itertools
+import json
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, Optional, Protocol
+
+import structlog
+
+from app.core.config import settings
+from app.db.models.task import Priority
+
+logger = structlog.get_logger()
+
+# Чем меньше число, тем раньше сообщение будет выдано потребителю
+PRIORITY_RANK = {Priority.HIGH: 0, Priority.MEDIUM: 1, Priority.LOW: 2}
+
+
+class QueueMessage(Protocol):
+    """Сообщение, которое получает обработчик (совместимо с aio_pika)."""
+
+    body: bytes
+
+    def process(self) -> AsyncContextManager[Any]:
+        """Подтвердить сообщение при успехе, отклонить при исключении."""
+        ...
+
+    async def nack(self, requeue: bool = True) -> None:
+        """Вернуть сообщение, не обработав его (остановка воркера)."""
+        ...
+
+
+MessageHandler = Callable[[QueueMessage], Awaitable[None]]
+# Получатель id отменённых задач
+CancellationHandler = Callable[[list[int]], None]
+
+# Сколько id отменённых задач помещается в одно широковещательное сообщение
+CANCELLATION_CHUNK = 5000
+
+
+class QueueBackend(ABC):
+    """Транспорт между API (публикация) и воркером (потребление)."""
+
+    #: Потребитель должен работать в том же процессе, что и публикатор
+    in_process: bool = False
+    #: На сколько очередей-шардов делится поток задач (см. shard_for)
+    shards: int = 1
+
+    @abstractmethod
+    async def initialize(self) -> None:
+        """Подключиться к брокеру и объявить очереди."""
+
+    @abstractmethod
+    async def publish(
+        self, body: bytes, priority: Priority = Priority.MEDIUM, shard: int = 0
+    ) -> None:
+        """Опубликовать сообщение в шард ``shard`` (если бэкенд их различает)."""
+
+    @abstractmethod
+    async def consume(self, handler: MessageHandler) -> None:
+        """Начать доставку сообщений в ``handler`` (не блокирует)."""
+
+    async def stop_consuming(self) -> None:
+        """Перестать получать новые сообщения; выданные дорабатываются."""
+        return
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Остановить потребление и закрыть соединения."""
+
+    async def publish_cancellations(self, task_ids: list[int]) -> None:
+        """Сообщить воркерам об отменённых задачах.
+
+        По умолчанию ничего не делает: воркер узнает об отмене из БД.
+        """
+        return
+
+    async def consume_cancellations(self, handler: CancellationHandler) -> None:
+        """Получать id отменённых задач (не блокирует)."""
+        return
+
+    async def resize(self, concurrency: int, prefetch: int) -> None:
+        """Изменить, сколько сообщений бэкенд выдаёт воркеру.
+
+        ``concurrency`` — предел одновременной обработки, ``prefetch`` —
+        сколько неподтверждённых сообщений можно держать на очередь.
+        """
+        return
+
+    async def queue_depth(self, limit: int) -> Optional[int]:
+        """Число ожидающих сообщений (можно остановиться на ``limit``).
+
+        ``None`` — глубину узнать нельзя (например, нет подключения).
+        """
+        return None
+
+
+def shard_for(task_id: str, shards: int) -> int:
+    """Шард задачи: стабильный хэш id, одинаковый во всех процессах."""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(task_id.encode()) % shards
+
+
+def parse_shards(value: str, shards: int) -> list[int]:
+    """``0,2,4-6`` -> номера шардов воркера; пустая строка — все шарды."""
+    if not value.strip():
+        return list(range(shards))
+    assigned: set[int] = set()
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        assigned.update(range(int(first), int(last or first) + 1))
+    unknown = sorted(shard for shard in assigned if not 0 <= shard < shards)
+    if unknown:
+        raise ValueError(f"Shards {unknown} out of range for QUEUE_SHARDS={shards}")
+    return sorted(assigned)
+
+
+def _shard_suffix(shard: int) -> str:
+    # Шард 0 сохраняет прежние имена: при включении шардирования очереди
+    # без номера продолжают читаться и не теряют сообщения
+    return f".{shard}" if shard else ""
+
+
+def priority_queue_name(priority: Priority, shard: int = 0) -> str:
+    return f"{settings.TASKS_QUEUE}.{priority.value.lower()}{_shard_suffix(shard)}"
+
+
+def priority_routing_key(priority: Priority, shard: int = 0) -> str:
+    return (
+        f"{settings.TASKS_ROUTING_KEY}.{priority.value.lower()}{_shard_suffix(shard)}"
+    )
+
+
+class RabbitMQMessage:
+    """Сообщение aio_pika с приоритетом очереди и временем публикации."""
+
+    def __init__(self, message: Any, priority: Priority) -> None:
+        self._message = message
+        self.body: bytes = message.body
+        self.priority = priority
+        self.enqueued_at: Optional[float] = (message.headers or {}).get("enqueued_at")
+
+    def process(self) -> AsyncContextManager[Any]:
+        # ignore_processed: сообщение, возвращённое через nack() при
+        # остановке, на выходе из контекста не подтверждается и не отклоняется
+        return self._message.process(ignore_processed=True)
+
+    async def nack(self, requeue: bool = True) -> None:
+        if not self._message.processed:
+            await self._message.nack(requeue=requeue)
+
+
+class RabbitMQBackend(QueueBackend):
+    """Очередь в RabbitMQ: durable direct-exchange и очередь на каждый приоритет.
+
+    Каждая очередь приоритета делится на ``shards`` шардов: одна очередь
+    RabbitMQ обслуживается одним ядром брокера, а шарды распределяются по
+    ядрам и узлам кластера. Публикатор объявляет все шарды (иначе direct-
+    exchange отбросит сообщение без привязанной очереди), воркер читает
+    только ``consume_shards``.
+
+    Старая общая очередь ``TASKS_QUEUE`` тоже читается (как MEDIUM) воркером
+    шарда 0, чтобы при обновлении не потерять уже опубликованные в неё сообщения.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.RABBITMQ_URL,
+        shards: int = settings.QUEUE_SHARDS,
+        consume_shards: Optional[list[int]] = None,
+    ) -> None:
+        self.url = url
+        self.shards = max(shards, 1)
+        self.consume_shards = (
+            consume_shards
+            if consume_shards is not None
+            else parse_shards(settings.WORKER_SHARDS, self.shards)
+        )
+        self._initialized = False
+        self.connection: Any = None
+        self.channel: Any = None
+        self.exchange: Any = None
+        self.cancel_exchange: Any = None
+        self.queues: dict[tuple[int, Priority], Any] = {}
+        self.legacy_queue: Any = None
+        self.prefetch = settings.QUEUE_PREFETCH
+        self._init_lock = asyncio.Lock()
+        self._handler: Optional[MessageHandler] = None
+        self._consumer_tags: list[tuple[Any, str]] = []
+        # Переподписка в resize и остановка потребителей не перемежаются
+        self._consumers_lock = asyncio.Lock()
+        self._stopping = False
+
+    async def initialize(self) -> None:
+        """Асинхронная инициализация подключения к RabbitMQ."""
+        if self._initialized:
+            return
+        # Старт API и первая публикация могут подключаться одновременно
+        async with self._init_lock:
+            if not self._initialized:
+                await self._connect()
+
+    async def _connect(self) -> None:
+        # aio_pika импортируется только при подключении: импорт приложения
+        # остаётся быстрым, а в режимах memory/postgres он не нужен вовсе
+        import aio_pika
+        from aio_pika import ExchangeType
+
+        # Подключаемся к RabbitMQ (robust—с автоматическим восстановлением);
+        # первая попытка ограничена по времени, чтобы не висеть на недоступном брокере
+        self.connection = await aio_pika.connect_robust(
+            self.url, timeout=settings.CONNECT_TIMEOUT
+        )
+        self.channel = await self.connection.channel()
+        # global_=False: лимит неподтверждённых сообщений на каждую очередь,
+        # чтобы занятая HIGH не выбирала весь prefetch канала
+        await self.channel.set_qos(prefetch_count=self.prefetch, global_=False)
+        # Объявляем direct-exchange
+        self.exchange = await self.channel.declare_exchange(
+            name=settings.TASKS_EXCHANGE, type=ExchangeType.DIRECT, durable=True
+        )
+        # Широковещательный exchange для отмен: у каждого воркера своя очередь
+        self.cancel_exchange = await self.channel.declare_exchange(
+            name=f"{settings.TASKS_EXCHANGE}.cancelled",
+            type=ExchangeType.FANOUT,
+            durable=True,
+        )
+        # Объявляем очереди приоритетов всех шардов и привязываем их к exchange
+        for shard in range(self.shards):
+            for priority in Priority:
+                queue = await self.channel.declare_queue(
+                    name=priority_queue_name(priority, shard), durable=True
+                )
+                await queue.bind(
+                    exchange=self.exchange,
+                    routing_key=priority_routing_key(priority, shard),
+                )
+                self.queues[shard, priority] = queue
+        self.legacy_queue = await self.channel.declare_queue(
+            name=settings.TASKS_QUEUE, durable=True
+        )
+        await self.legacy_queue.bind(
+            exchange=self.exchange, routing_key=settings.TASKS_ROUTING_KEY
+        )
+
+        self._initialized = True
+
+    async def publish(
+        self, body: bytes, priority: Priority = Priority.MEDIUM, shard: int = 0
+    ) -> None:
+        from aio_pika import DeliveryMode, Message
+
+        await self.initialize()
+        if self.exchange is None:
+            raise RuntimeError("Exchange not initialized")
+        await self.exchange.publish(
+            message=Message(
+                body=body,
+                delivery_mode=DeliveryMode.PERSISTENT,
+                # timestamp AMQP хранит целые секунды, для ожидания нужны доли
+                headers={"enqueued_at": time.time()},
+            ),
+            routing_key=priority_routing_key(priority, shard % self.shards),
+        )
+
+    async def publish_cancellations(self, task_ids: list[int]) -> None:
+        from aio_pika import Message
+
+        await self.initialize()
+        for start in range(0, len(task_ids), CANCELLATION_CHUNK):
+            chunk = task_ids[start : start + CANCELLATION_CHUNK]
+            await self.cancel_exchange.publish(
+                Message(body=json.dumps(chunk).encode()), routing_key=""
+            )
+
+    async def consume_cancellations(self, handler: CancellationHandler) -> None:
+        await self.initialize()
+        # Временная очередь: отмены нужны только работающему воркеру
+        queue = await self.channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(self.cancel_exchange)
+
+        async def on_message(message: Any) -> None:
+            handler(json.loads(message.body))
+
+        await queue.consume(on_message, no_ack=True)
+
+    async def consume(self, handler: MessageHandler) -> None:
+        await self.initialize()
+        self._stopping = False
+        self._handler = handler
+        consumers = [
+            (queue, priority)
+            for (shard, priority), queue in self.queues.items()
+            if shard in self.consume_shards
+        ]
+        if 0 in self.consume_shards:
+            consumers.append((self.legacy_queue, Priority.MEDIUM))
+        for queue, priority in consumers:
+            tag = await queue.consume(self._wrap(handler, priority))
+            self._consumer_tags.append((queue, tag))
+
+    async def stop_consuming(self) -> None:
+        # basic.cancel: брокер больше не выдаёт сообщений этому воркеру,
+        # поэтому возвращённые через nack уходят другим потребителям
+        self._stopping = True
+        self._handler = None
+        # Идущая переподписка завершится раньше, и её потребители тоже
+        # будут отменены
+        async with self._consumers_lock:
+            consumers, self._consumer_tags = self._consumer_tags, []
+            for queue, tag in consumers:
+                await queue.cancel(tag)
+
+    async def resize(self, concurrency: int, prefetch: int) -> None:
+        # Предел обработки держит диспетчер, брокеру нужен только prefetch
+        handler = self._handler
+        if prefetch == self.prefetch or self._stopping:
+            return
+        async with self._consumers_lock:
+            if prefetch == self.prefetch or self._stopping:
+                return
+            self.prefetch = prefetch
+            if not self._initialized:
+                return
+            # Per-consumer prefetch применяется только к новым подпискам,
+            # поэтому переподписываемся; выданные сообщения остаются за каналом
+            await self.channel.set_qos(prefetch_count=prefetch, global_=False)
+            if handler is None or handler is not self._handler:
+                return
+            consumers, self._consumer_tags = self._consumer_tags, []
+            for queue, tag in consumers:
+                await queue.cancel(tag)
+            if not self._stopping:
+                await self.consume(handler)
+
+    async def queue_depth(self, limit: int) -> Optional[int]:
+        if not self._initialized:
+            return None
+        depth = 0
+        # Пассивное объявление возвращает текущее число сообщений в очереди
+        for queue in [*self.queues.values(), self.legacy_queue]:
+            declared = await self.channel.declare_queue(name=queue.name, passive=True)
+            depth += declared.declaration_result.message_count
+        return depth
+
+    @staticmethod
+    def _wrap(
+        handler: MessageHandler, priority: Priority
+    ) -> Callable[[Any], Awaitable[None]]:
+        async def on_message(message: Any) -> None:
+            await handler(RabbitMQMessage(message, priority))
+
+        return on_message
+
+    async def close(self) -> None:
+        """Закрытие соединения при завершении работы приложения."""
+        if self.connection:
+            await self.connection.close()
+            self._initialized = False
+
+
+class InMemoryMessage:
+    """Сообщение очереди в памяти процесса."""
+
+    def __init__(self, body: bytes, priority: Priority) -> None:
+        self.body = body
+        self.priority = priority
+        self.enqueued_at = time.time()
+
+    @asynccontextmanager
+    async def process(self) -> AsyncIterator["InMemoryMessage"]:
+        # Как и в aio_pika (requeue=False): ошибка отклоняет сообщение
+        # без повторной доставки и пробрасывается дальше
+        yield self
+
+    async def nack(self, requeue: bool = True) -> None:
+        # Очередь живёт в памяти процесса и всё равно теряется при остановке;
+        # задача остаётся NEW, и её заново опубликует воркер при старте
+        # (republish_ready_tasks)
+        return
+
+
+class InMemoryBackend(QueueBackend):
+    """Очередь на asyncio.PriorityQueue для одного узла и бенчмарков.
+
+    Сообщения живут только в памяти процесса: API и воркер должны работать
+    в одном процессе, перезапуск теряет неразобранные сообщения.
+    """
+
+    in_process = True
+
+    def __init__(self, concurrency: int = settings.QUEUE_PREFETCH) -> None:
+        self.concurrency = concurrency
+        self._queue: asyncio.PriorityQueue[
+            tuple[int, int, InMemoryMessage]
+        ] = asyncio.PriorityQueue()
+        # Порядковый номер сохраняет FIFO внутри одного приоритета
+        self._sequence = itertools.count()
+        self._consumer: Optional[asyncio.Task[None]] = None
+        self._in_flight: set[asyncio.Task[None]] = set()
+        self._slot_freed = asyncio.Event()
+        self._cancellation_handlers: list[CancellationHandler] = []
+
+    async def initialize(self) -> None:
+        return
+
+    async def publish_cancellations(self, task_ids: list[int]) -> None:
+        for handler in self._cancellation_handlers:
+            handler(task_ids)
+
+    async def consume_cancellations(self, handler: CancellationHandler) -> None:
+        self._cancellation_handlers.append(handler)
+
+    async def resize(self, concurrency: int, prefetch: int) -> None:
+        self.concurrency = prefetch
+        self._slot_freed.set()
+
+    async def publish(
+        self, body: bytes, priority: Priority = Priority.MEDIUM, shard: int = 0
+    ) -> None:
+        message = InMemoryMessage(body, priority)
+        await self._queue.put((PRIORITY_RANK[priority], next(self._sequence), message))
+
+    async def consume(self, handler: MessageHandler) -> None:
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._consume_loop(handler))
+
+    async def stop_consuming(self) -> None:
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+
+    async def _consume_loop(self, handler: MessageHandler) -> None:
+        while True:
+            # Предел читается на каждой итерации: resize() меняет его на ходу
+            while len(self._in_flight) >= self.concurrency:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+            _, _, message = await self._queue.get()
+            task = asyncio.create_task(self._dispatch(handler, message))
+            self._in_flight.add(task)
+
+    async def _dispatch(
+        self, handler: MessageHandler, message: InMemoryMessage
+    ) -> None:
+        try:
+            await handler(message)
+        except Exception as exc:
+            logger.error("Message handler failed", error=str(exc))
+        finally:
+            self._in_flight.discard(asyncio.current_task())  # type: ignore[arg-type]
+            self._queue.task_done()
+            self._slot_freed.set()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def queue_depth(self, limit: int) -> Optional[int]:
+        return self.qsize()
+
+    async def join(self) -> None:
+        """Дождаться, пока все опубликованные сообщения будут обработаны."""
+        await self._queue.join()
+
+    async def close(self) -> None:
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+
+_backend: Optional[QueueBackend] = None
+
+
+def create_queue_backend(name: str = settings.QUEUE_BACKEND) -> QueueBackend:
+    """Создать бэкенд очереди по имени из настроек."""
+    if name == "rabbitmq":
+        return RabbitMQBackend()
+    if name == "memory":
+        return InMemoryBackend()
+    if name == "postgres":
+        from app.services.pg_queue import PostgresQueueBackend
+
+        return PostgresQueueBackend()
+    raise ValueError(f"Unknown queue backend: {name}")
+
+
+def get_queue_backend() -> QueueBackend:
+    """Синглтон бэкенда: публикатор и потребитель одного процесса делят его."""
+    global _backend
+    if _backend is None:
+        _backend = create_queue_backend()
+    return _backend
@@ -0,0 +1,109 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Optional
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.task_processor import TaskProcessor, get_task_processor
+
+logger = structlog.get_logger()
+
+
+class Readiness:
+    """Подключение API к брокеру в фоне и проверки готовности.
+
+    Старт приложения не ждёт брокер: подключение идёт в фоновой задаче,
+    каждая попытка ограничена ``timeout`` секундами, паузы между попытками
+    растут до ``max_interval``. Пока очередь не подключена или БД не отвечает,
+    ``/health/ready`` возвращает 503, а ``/health/live`` — 200.
+    """
+
+    def __init__(
+        self,
+        processor: Optional[TaskProcessor] = None,
+        timeout: float = settings.CONNECT_TIMEOUT,
+        max_interval: float = settings.CONNECT_RETRY_MAX_INTERVAL,
+        check_timeout: float = settings.HEALTH_CHECK_TIMEOUT,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+    ) -> None:
+        self.processor = processor
+        self.timeout = timeout
+        self.max_interval = max_interval
+        self.check_timeout = check_timeout
+        self.session_factory = session_factory
+        self.queue_ready = False
+        self.queue_error: Optional[str] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def start(
+        self, on_queue_ready: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> None:
+        """Начать подключение к очереди в фоне (не блокирует старт)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._connect_queue(on_queue_ready))
+
+    async def _connect_queue(
+        self, on_queue_ready: Optional[Callable[[], Awaitable[None]]]
+    ) -> None:
+        processor = self.processor or get_task_processor()
+        interval = 0.5
+        while True:
+            try:
+                await asyncio.wait_for(processor.initialize(), timeout=self.timeout)
+                break
+            except Exception as exc:
+                self.queue_error = str(exc) or type(exc).__name__
+                logger.warning(
+                    "Queue is not reachable, retrying",
+                    error=self.queue_error,
+                    retry_in=interval,
+                )
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_interval)
+
+        self.queue_ready = True
+        self.queue_error = None
+        logger.info("Queue connected")
+        if on_queue_ready is not None:
+            await on_queue_ready()
+
+    async def check_database(self) -> Optional[str]:
+        """``None``, если БД отвечает, иначе описание ошибки."""
+        try:
+            async with self.session_factory() as session:
+                await asyncio.wait_for(
+                    session.execute(text("SELECT 1")), timeout=self.check_timeout
+                )
+        except Exception as exc:
+            return str(exc) or type(exc).__name__
+        return None
+
+    async def status(self) -> tuple[bool, dict[str, str]]:
+        """Готовность и состояние зависимостей для ``/health/ready``."""
+        database_error = await self.check_database()
+        checks = {
+            "database": database_error or "ok",
+            "queue": "ok" if self.queue_ready else self.queue_error or "connecting",
+        }
+        return database_error is None and self.queue_ready, checks
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_readiness: Optional[Readiness] = None
+
+
+def get_readiness() -> Readiness:
+    """Синглтон: состояние готовности процесса API."""
+    global _readiness
+    if _readiness is None:
+        _readiness = Readiness()
+    return _readiness
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timezone
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.repositories.task_repository import TaskRepository
+from app.services.task_processor import TaskProcessor
+
+logger = structlog.get_logger()
+
+
+class TaskScheduler:
+    """Выпускает отложенные задачи (run_at) в очередь, когда наступает их время.
+
+    Каждый проход забирает из частичного индекса не больше ``batch_size``
+    созревших задач. Между проходами планировщик спит до ближайшего run_at,
+    но не дольше ``max_sleep`` — это и есть верхняя граница задержки.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        processor: TaskProcessor,
+        batch_size: int = settings.SCHEDULER_BATCH_SIZE,
+        max_sleep: float = settings.SCHEDULER_MAX_SLEEP,
+    ) -> None:
+        self.session_factory = session_factory
+        self.processor = processor
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._stopped = asyncio.Event()
+
+    async def run_once(self) -> int:
+        """Один проход: выпустить пачку созревших задач. Возвращает их число."""
+        async with self.session_factory() as session:
+            repository = TaskRepository(session)
+            released = await repository.release_due_tasks(
+                datetime.now(timezone.utc), self.batch_size
+            )
+            if not released:
+                return 0
+
+            published: set[int] = set()
+            try:
+                for task_id, priority in released:
+                    await self.processor.enqueue(str(task_id), priority)
+                    published.add(task_id)
+            except Exception as exc:
+                # Неопубликованные задачи возвращаем в PENDING до следующего прохода
+                logger.error("Failed to publish scheduled tasks", error=str(exc))
+                await repository.return_to_pending(
+                    [task_id for task_id, _ in released if task_id not in published]
+                )
+
+        logger.info("Scheduled tasks released", count=len(published))
+        return len(published)
+
+    async def _next_delay(self) -> float:
+        """Сколько спать до следующего прохода."""
+        async with self.session_factory() as session:
+            next_run_at = await TaskRepository(session).get_next_run_at()
+        if next_run_at is None:
+            return self.max_sleep
+        delay = (next_run_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(delay, 0.0), self.max_sleep)
+
+    async def run(self) -> None:
+        """Основной цикл планировщика."""
+        logger.info("Scheduler started", batch_size=self.batch_size)
+        while not self._stopped.is_set():
+            try:
+                released = await self.run_once()
+                # Полная пачка — вероятно, есть ещё созревшие задачи
+                delay = 0.0 if released >= self.batch_size else await self._next_delay()
+            except Exception as exc:
+                logger.error("Scheduler iteration failed", error=str(exc))
+                delay = self.max_sleep
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.models.task import Status
+from app.repositories.task_repository import TaskRepository
+from app.schemas.task import CountMode
+
+CountKey = tuple[Optional[Status], Optional[str], Optional[str]]
+
+_cache: Optional[TTLCache[CountKey, int]] = None
+
+
+def get_count_cache() -> TTLCache[CountKey, int]:
+    """Кэш точных подсчётов задач по сочетанию фильтров."""
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(
+            maxsize=settings.TOTAL_COUNT_CACHE_SIZE,
+            ttl=settings.TOTAL_COUNT_CACHE_TTL,
+        )
+    return _cache
+
+
+async def count_tasks(
+    repository: TaskRepository,
+    mode: CountMode,
+    status: Optional[Status] = None,
+    priority: Optional[str] = None,
+    q: Optional[str] = None,
+) -> int:
+    """Число задач для заголовка X-Total-Count.
+
+    * ``exact`` — ``COUNT(*)``, медленно на большой таблице;
+    * ``estimated`` — оценка планировщика, не сканирует таблицу;
+    * ``cached`` — точный подсчёт, повторно используемый ``TOTAL_COUNT_CACHE_TTL``
+      секунд для того же сочетания фильтров.
+    """
+    if mode == CountMode.ESTIMATED:
+        return await repository.estimate_count(status, priority, q)
+    if mode == CountMode.EXACT:
+        return await repository.count(status, priority, q)
+
+    cache = get_count_cache()
+    key = (status, priority, q)
+    total = cache.get(key)
+    if total is None:
+        total = await repository.count(status, priority, q)
+        cache.set(key, total)
+    return total
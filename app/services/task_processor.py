@@ -1,73 +1,50 @@
 from typing import Optional
 
-import aio_pika
-from aio_pika import (
-    DeliveryMode,
-    ExchangeType,
-    Message,
-)
-from aio_pika.abc import (
-    AbstractChannel,
-    AbstractConnection,
-    AbstractExchange,
-    AbstractQueue,
-)
-
 from app.core.config import settings
+from app.db.models.task import Priority
+from app.services.messages import TaskMessage, encode_task_message
+from app.services.queue_backend import QueueBackend, get_queue_backend, shard_for
 
 
 class TaskProcessor:
     _instance: Optional["TaskProcessor"] = None
 
-    def __init__(self) -> None:
-        # Флаг, чтобы инициализация сработала только один раз
-        self._initialized = False
-        self.connection: AbstractConnection | None = None
-        self.channel: AbstractChannel | None = None
-        self.exchange: AbstractExchange | None = None
-        self.queue: AbstractQueue | None = None
+    def __init__(self, backend: QueueBackend | None = None) -> None:
+        # По умолчанию — общий для процесса бэкенд из настроек (RabbitMQ)
+        self.backend = backend if backend is not None else get_queue_backend()
 
     async def initialize(self) -> None:
-        """Асинхронная инициализация подключения к RabbitMQ."""
-        if self._initialized:
-            return
-
-        # Подключаемся к RabbitMQ (robust—с автоматическим восстановлением)
-        self.connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-        self.channel = await self.connection.channel()
-        # Объявляем direct-exchange
-        self.exchange = await self.channel.declare_exchange(
-            name=settings.TASKS_EXCHANGE, type=ExchangeType.DIRECT, durable=True
-        )
-        # Объявляем очередь и привязываем её к exchange
-        self.queue = await self.channel.declare_queue(
-            name=settings.TASKS_QUEUE, durable=True
-        )
-        await self.queue.bind(
-            exchange=self.exchange, routing_key=settings.TASKS_ROUTING_KEY
+        """Асинхронная инициализация подключения к очереди."""
+        await self.backend.initialize()
+
+    async def enqueue(
+        self,
+        task_id: str,
+        priority: Priority = Priority.MEDIUM,
+        message: Optional[TaskMessage] = None,
+    ) -> None:
+        """Публикация новой задачи в очередь (шард выбирается по хэшу id).
+
+        С ``message`` публикуется самодостаточное сообщение, и воркер не
+        читает строку задачи (если QUEUE_MESSAGE_FORMAT=msgpack); без него —
+        только id.
+        """
+        if message is not None and settings.QUEUE_MESSAGE_FORMAT == "msgpack":
+            body = encode_task_message(message)
+        else:
+            body = task_id.encode()
+        await self.backend.publish(
+            body, priority, shard_for(task_id, self.backend.shards)
         )
 
-        self._initialized = True
-
-    async def enqueue(self, task_id: str) -> None:
-        """Публикация новой задачи в очередь."""
-        await self.initialize()
-        if self.exchange is None:
-            raise RuntimeError("Exchange not initialized")
-        msg = Message(
-            body=task_id.encode(),
-            delivery_mode=DeliveryMode.PERSISTENT,
-        )
-        await self.exchange.publish(
-            message=msg,
-            routing_key=settings.TASKS_ROUTING_KEY,
-        )
+    async def publish_cancellations(self, task_ids: list[int]) -> None:
+        """Сообщить воркерам об отменённых задачах."""
+        if task_ids:
+            await self.backend.publish_cancellations(task_ids)
 
     async def close(self) -> None:
         """Закрытие соединения при завершении работы приложения."""
-        if self.connection:
-            await self.connection.close()
-            self._initialized = False
+        await self.backend.close()
 
 
 def get_task_processor() -> TaskProcessor:
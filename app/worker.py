@@ -1,35 +1,66 @@
 import asyncio
-from datetime import datetime, timezone
+import signal
+import time
+from typing import Optional
 
 import structlog
-from aio_pika import ExchangeType, IncomingMessage, connect_robust
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from app.core.config import settings
+from app.core.logging import init_logging
+from app.core.metrics import MetricsReporter, db_pool_wait
 from app.db.base import Base
-from app.db.models.task import Status
+from app.db.models.task import Priority, Status
 from app.db.models.task import Task as TaskModel
-
-# Настраиваем structlog для JSON-логов
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer(),
-    ]
+from app.db.session import instrument_engine
+from app.repositories.task_repository import TaskRepository
+from app.services.batching import BatchCollector
+from app.services.cancellations import get_cancelled_tasks
+from app.services.concurrency import AdaptiveConcurrencyLimiter, prefetch_for
+from app.services.dispatcher import WeightedFairDispatcher
+from app.services.drain import InFlightMessages, drain_duration, drained_messages
+from app.services.leases import (
+    LeaseKeeper,
+    LeaseReaper,
+    get_lease_keeper,
+    publish_released,
+)
+from app.services.messages import TaskMessage, decode_task_message
+from app.services.progress import (
+    ProgressWriter,
+    get_progress_writer,
+    report_progress,
 )
+from app.services.queue_backend import QueueMessage
+from app.services.scheduler import TaskScheduler
+from app.services.task_processor import get_task_processor
+
 logger = structlog.get_logger()
 
+# На сколько шагов делится имитация работы (по шагу — отчёт о прогрессе)
+PROCESSING_STEPS = 4
+
+# Статусы, с которыми задача уже не выполняется
+FINAL_STATUSES = (Status.CANCELLED, Status.COMPLETED, Status.FAILED)
+
 # Фабрика сессий, инициализируется в main()
 AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
 
 
-async def handle_message(message: IncomingMessage) -> None:
+async def handle_message(message: QueueMessage) -> None:
     async with message.process():
-        body = message.body.decode()
         try:
-            task_id = int(body)
+            task_message = decode_task_message(
+                message.body, getattr(message, "priority", None)
+            )
         except ValueError:
-            logger.error("Invalid task id received", task_id=body)
+            logger.error("Invalid task id received", task_id=message.body[:64])
+            return
+        task_id = task_message.id
+
+        # Отменённую задачу отбрасываем без запроса к БД
+        if task_id in get_cancelled_tasks():
+            logger.info("Dropping cancelled task", task_id=task_id)
             return
 
         logger.info("Received task", task_id=task_id)
@@ -39,97 +70,427 @@ async def handle_message(message: IncomingMessage) -> None:
             return
 
         async with AsyncSessionLocal() as session:
-            task = await session.get(TaskModel, task_id)
-            if not task:
-                logger.error("Task not found in DB", task_id=task_id)
-                return
+            # Ожидание соединения из пула — сигнал для адаптивной конкурентности
+            started = time.perf_counter()
+            await session.connection()
+            db_pool_wait.observe(time.perf_counter() - started)
 
-            if task.status in (Status.CANCELLED, Status.COMPLETED, Status.FAILED):
-                logger.info(
-                    "Skipping task with final status",
-                    task_id=task_id,
-                    status=task.status.value,
-                )
-                return
+            # Сообщение старого формата несёт только id: читаем строку задачи.
+            # Полное сообщение сразу идёт на захват — его WHERE сам отсеет
+            # отсутствующие и завершённые задачи
+            if not task_message.complete:
+                task = await session.get(TaskModel, task_id)
+                if not task:
+                    logger.error("Task not found in DB", task_id=task_id)
+                    return
 
-            try:
-                # Переводим в IN_PROGRESS
-                task.status = Status.IN_PROGRESS
-                task.started_at = datetime.now(timezone.utc)
-                await session.commit()
+                if task.status in FINAL_STATUSES:
+                    logger.info(
+                        "Skipping task with final status",
+                        task_id=task_id,
+                        status=task.status.value,
+                    )
+                    return
 
-                # Бизнес-логика (например, sleep 2 сек)
-                await asyncio.sleep(2)
+            repository = TaskRepository(session)
+            leases = get_lease_keeper()
+            # Переводим в IN_PROGRESS под арендой этого воркера
+            if not await repository.claim_for_processing(
+                task_id, leases.owner, leases.lease_ttl
+            ):
+                logger.info("Task is not claimable", task_id=task_id)
+                return
 
-                # Завершаем успешно
-                task.finished_at = datetime.now(timezone.utc)
-                task.result = "Processed successfully"
-                task.status = Status.COMPLETED
-                await session.commit()
+            leases.track(task_id)
+            released = None
+            try:
+                # Бизнес-логика (например, sleep 2 сек) с отчётом о прогрессе
+                for step in range(1, PROCESSING_STEPS + 1):
+                    await asyncio.sleep(
+                        settings.TASK_PROCESSING_SECONDS / PROCESSING_STEPS
+                    )
+                    report_progress(
+                        task_id,
+                        100 * step / PROCESSING_STEPS,
+                        f"Step {step} of {PROCESSING_STEPS}",
+                    )
 
+                # Завершаем успешно; зависимые задачи, дождавшиеся последней
+                # зависимости, переходят в NEW в той же транзакции
+                released = await repository.finish_task(
+                    task_id,
+                    leases.owner,
+                    Status.COMPLETED,
+                    result="Processed successfully",
+                )
                 logger.info("Task processed", task_id=task_id)
 
             except Exception as exc:
                 await session.rollback()
-                task.error = str(exc)
-                task.status = Status.FAILED
-                await session.commit()
+                await repository.finish_task(
+                    task_id, leases.owner, Status.FAILED, error=str(exc)
+                )
                 logger.error(
                     "Task processing failed",
                     task_id=task_id,
-                    error=task.error,
+                    error=str(exc),
                 )
+            finally:
+                leases.untrack(task_id)
+                get_progress_writer().discard(task_id)
+
+        if released:
+            await publish_released(get_task_processor(), AsyncSessionLocal, released)
+            logger.info(
+                "Dependent tasks released", task_id=task_id, count=len(released)
+            )
+
+
+async def process_batch(tasks: list[TaskMessage]) -> list[str | Exception]:
+    """Бизнес-логика пакетного режима: одна обработка на всю пачку задач.
+
+    Здесь место для одного массового внешнего вызова или векторного прохода
+    по входным данным всех задач (``title``, ``description``). Возвращает
+    результат или исключение для каждой задачи в том же порядке: ошибка
+    одной задачи не роняет остальные.
+    """
+    for step in range(1, PROCESSING_STEPS + 1):
+        await asyncio.sleep(settings.TASK_PROCESSING_SECONDS / PROCESSING_STEPS)
+        for task in tasks:
+            report_progress(
+                task.id,
+                100 * step / PROCESSING_STEPS,
+                f"Step {step} of {PROCESSING_STEPS}",
+            )
+    return ["Processed successfully"] * len(tasks)
+
+
+async def handle_batch(messages: list[QueueMessage]) -> list[Optional[Exception]]:
+    """Обработать пачку сообщений (режим BATCH_MAX_SIZE > 1).
+
+    Для сообщений старого формата (только id) строки задач читаются одним
+    запросом; полные сообщения обходятся без чтения из БД. Все задачи
+    захватываются одним UPDATE, и пачка целиком уходит в process_batch.
+    Исход записывается по каждой задаче отдельно. Возвращается исход каждого
+    сообщения для его подтверждения.
+    """
+    outcomes: list[Optional[Exception]] = [None] * len(messages)
+    # id задачи -> номер её сообщения в пачке и разобранное сообщение
+    positions: dict[int, int] = {}
+    found: dict[int, TaskMessage] = {}
+    for position, message in enumerate(messages):
+        try:
+            task_message = decode_task_message(
+                message.body, getattr(message, "priority", None)
+            )
+        except ValueError:
+            logger.error("Invalid task id received", task_id=message.body[:64])
+            continue
+        task_id = task_message.id
+        if task_id in get_cancelled_tasks():
+            logger.info("Dropping cancelled task", task_id=task_id)
+            continue
+        # Повторное сообщение той же задачи подтверждается без обработки
+        if task_id not in positions:
+            positions[task_id] = position
+            found[task_id] = task_message
+    if not positions:
+        return outcomes
+
+    logger.info("Received task batch", size=len(positions))
+
+    if AsyncSessionLocal is None:
+        logger.error("Session factory not initialized")
+        return outcomes
+
+    released: list[tuple[int, Priority]] = []
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        await session.connection()
+        db_pool_wait.observe(time.perf_counter() - started)
+
+        repository = TaskRepository(session)
+        legacy = [task_id for task_id, task in found.items() if not task.complete]
+        if legacy:
+            rows = {task.id: task for task in await repository.get_many(legacy)}
+            for task_id in legacy:
+                task = rows.get(task_id)
+                if task is None:
+                    logger.error("Task not found in DB", task_id=task_id)
+                    del found[task_id]
+                elif task.status in FINAL_STATUSES:
+                    logger.info(
+                        "Skipping task with final status",
+                        task_id=task_id,
+                        status=task.status.value,
+                    )
+                    del found[task_id]
+                else:
+                    found[task_id] = TaskMessage.from_task(task)
+
+        leases = get_lease_keeper()
+        claimed = await repository.claim_many_for_processing(
+            list(found), leases.owner, leases.lease_ttl
+        )
+        for task_id in found.keys() - set(claimed):
+            logger.info("Task is not claimable", task_id=task_id)
+        tasks = [found[task_id] for task_id in claimed]
+
+        for task_id in claimed:
+            leases.track(task_id)
+        try:
+            try:
+                results = await process_batch(tasks)
+            except Exception as exc:
+                results = [exc] * len(tasks)
+
+            for task_id, result in zip(claimed, results):
+                try:
+                    if isinstance(result, Exception):
+                        await repository.finish_task(
+                            task_id, leases.owner, Status.FAILED, error=str(result)
+                        )
+                        logger.error(
+                            "Task processing failed",
+                            task_id=task_id,
+                            error=str(result),
+                        )
+                    else:
+                        released += (
+                            await repository.finish_task(
+                                task_id, leases.owner, Status.COMPLETED, result=result
+                            )
+                            or []
+                        )
+                        logger.info("Task processed", task_id=task_id)
+                except Exception as exc:
+                    # Исход не записан: сообщение этой задачи отклоняется,
+                    # задачу вернёт в очередь сборщик истёкших аренд
+                    await session.rollback()
+                    outcomes[positions[task_id]] = exc
+                    logger.error(
+                        "Failed to record task outcome", task_id=task_id, error=str(exc)
+                    )
+        finally:
+            for task_id in claimed:
+                leases.untrack(task_id)
+                get_progress_writer().discard(task_id)
+
+    if released:
+        await publish_released(get_task_processor(), AsyncSessionLocal, released)
+        logger.info("Dependent tasks released", count=len(released))
+    return outcomes
+
+
+# Фоновые циклы воркера, запускаются в start_worker()
+_loops: list[
+    TaskScheduler
+    | LeaseReaper
+    | LeaseKeeper
+    | AdaptiveConcurrencyLimiter
+    | MetricsReporter
+    | ProgressWriter
+] = []
+_background: list[asyncio.Task[None]] = []
+# Сообщения, выданные воркеру, и тот, кто их обрабатывает (для drain_worker)
+_in_flight = InFlightMessages()
+_consumer: WeightedFairDispatcher | BatchCollector | None = None
+
+
+async def republish_ready_tasks(
+    session_factory: async_sessionmaker[AsyncSession], batch_size: int = 1000
+) -> int:
+    """Опубликовать все NEW-задачи заново. Возвращает их число.
+
+    Очередь в памяти процесса теряется при остановке: сообщения, не
+    разобранные до неё, и задачи, возвращённые в NEW при остановке
+    (release_leases), иначе остались бы в NEW без сообщения навсегда.
+    Повторное сообщение уже взятой задачи воркер просто подтвердит.
+    """
+    processor = get_task_processor()
+    published = last_id = 0
+    while True:
+        async with session_factory() as session:
+            ready = await TaskRepository(session).get_ready(last_id, batch_size)
+        for task_id, priority in ready:
+            await processor.enqueue(str(task_id), priority)
+        published += len(ready)
+        if len(ready) < batch_size:
+            return published
+        last_id = ready[-1][0]
+
+
+async def start_worker(session_factory: async_sessionmaker[AsyncSession]) -> None:
+    """Начать потребление очереди и запустить фоновые циклы.
+
+    Используется как отдельным процессом воркера (main), так и API, если
+    бэкенд очереди работает в памяти процесса.
+    """
+    global AsyncSessionLocal, _consumer
+    AsyncSessionLocal = session_factory
+    _in_flight.draining = False
+
+    # Подключаемся к очереди и стартуем потребление
+    processor = get_task_processor()
+    await processor.initialize()
+    await processor.backend.consume_cancellations(get_cancelled_tasks().add)
+    if settings.BATCH_MAX_SIZE > 1:
+        # Пакетный режим: сообщения копятся в пачки для handle_batch; чтобы
+        # пачка могла заполниться, брокер должен выдавать не меньше её размера
+        collector = BatchCollector(handle_batch)
+        await processor.backend.resize(
+            settings.MAX_CONCURRENCY,
+            max(settings.QUEUE_PREFETCH, collector.max_size),
+        )
+        _consumer = collector
+        await processor.backend.consume(_in_flight.wrap(collector.submit))
+    else:
+        # Слоты обработки делятся между приоритетами по весам PRIORITY_WEIGHTS
+        dispatcher = WeightedFairDispatcher(handle_message)
+        if settings.ADAPTIVE_CONCURRENCY:
+            # Предел одновременных задач и prefetch подстраиваются под нагрузку
+            async def apply_limit(limit: int) -> None:
+                dispatcher.set_concurrency(limit)
+                await processor.backend.resize(limit, prefetch_for(limit))
+
+            limiter = AdaptiveConcurrencyLimiter(on_change=apply_limit)
+            dispatcher.observer = limiter.observe
+            await apply_limit(limiter.limit)
+            _loops.append(limiter)
+            _background.append(asyncio.create_task(limiter.run()))
+        _consumer = dispatcher
+        await processor.backend.consume(_in_flight.wrap(dispatcher.submit))
+    if processor.backend.in_process:
+        republished = await republish_ready_tasks(session_factory)
+        logger.info("Ready tasks republished", count=republished)
+    logger.info("Worker started, awaiting messages")
+
+    # Продление аренды выполняющихся задач
+    leases = get_lease_keeper()
+    _loops.append(leases)
+    _background.append(asyncio.create_task(leases.run(session_factory)))
+
+    # Пакетная запись прогресса, который сообщают обработчики
+    progress = get_progress_writer()
+    _loops.append(progress)
+    _background.append(asyncio.create_task(progress.run(session_factory)))
+
+    # Планировщик отложенных задач и сборщик задач упавших воркеров
+    # (несколько воркеров не мешают друг другу)
+    if settings.SCHEDULER_ENABLED:
+        scheduler = TaskScheduler(session_factory, processor)
+        _loops.append(scheduler)
+        _background.append(asyncio.create_task(scheduler.run()))
+    if settings.REAPER_ENABLED:
+        reaper = LeaseReaper(session_factory, processor)
+        _loops.append(reaper)
+        _background.append(asyncio.create_task(reaper.run()))
+    if settings.METRICS_LOG_INTERVAL > 0:
+        reporter = MetricsReporter(settings.METRICS_LOG_INTERVAL)
+        _loops.append(reporter)
+        _background.append(asyncio.create_task(reporter.run()))
+
+
+async def drain_worker(timeout: float = settings.WORKER_DRAIN_TIMEOUT) -> float:
+    """Плавно остановить обработку перед выключением (SIGTERM при деплое).
+
+    Воркер отписывается от очереди и возвращает брокеру ещё не начатые
+    сообщения, ждёт начатые обработчики не дольше ``timeout`` секунд и
+    дописывает накопленный прогресс. Задачи, которые не успели, возвращаются
+    в NEW, их сообщения — брокеру (nack с повторной доставкой): другие воркеры
+    забирают их сразу, а не после истечения аренды. Возвращает длительность.
+    """
+    global _consumer
+    started = time.perf_counter()
+    _in_flight.draining = True
+    processor = get_task_processor()
+    # Сначала отписка: возвращённые сообщения не придут обратно этому воркеру
+    await processor.backend.stop_consuming()
+    returned = await _consumer.pause() if _consumer is not None else 0
+    in_flight = len(_in_flight)
+    finished = await _in_flight.wait(timeout)
+
+    abandoned = released = 0
+    if AsyncSessionLocal is not None:
+        progress = get_progress_writer()
+        try:
+            await progress.flush(AsyncSessionLocal, force=True)
+            # Аренды снимаются до nack: иначе другой воркер получит сообщение,
+            # не сможет захватить задачу и подтвердит его впустую
+            async with AsyncSessionLocal() as session:
+                released = len(
+                    await TaskRepository(session).release_leases(
+                        get_lease_keeper().owner
+                    )
+                )
+        except Exception as exc:
+            logger.error("Failed to release tasks while draining", error=str(exc))
+    if not finished:
+        abandoned = await _in_flight.nack_all()
+        if _consumer is not None:
+            _consumer.cancel()
+    _consumer = None
+
+    duration = time.perf_counter() - started
+    drain_duration.observe(duration)
+    drained_messages.inc(returned + abandoned, outcome="returned")
+    drained_messages.inc(in_flight - abandoned, outcome="finished")
+    logger.info(
+        "Worker drained",
+        duration_s=round(duration, 3),
+        finished=in_flight - abandoned,
+        returned=returned,
+        abandoned=abandoned,
+        released_tasks=released,
+        timed_out=not finished,
+    )
+    return duration
+
+
+async def stop_worker() -> None:
+    """Остановить фоновые циклы и закрыть соединение с очередью."""
+    for loop in _loops:
+        loop.stop()
+    _loops.clear()
+    await asyncio.gather(*_background, return_exceptions=True)
+    _background.clear()
+    await get_task_processor().close()
 
 
 async def main() -> None:
+    # Та же настройка логов, что и у API: JSON пишется фоновым потоком
+    init_logging()
+
     # 1) Создаём движок и таблицы (если их ещё нет)
-    engine = create_async_engine(
-        settings.DATABASE_URL,
-        future=True,
-        echo=False,
+    engine = instrument_engine(
+        create_async_engine(
+            settings.DATABASE_URL,
+            future=True,
+            echo=False,
+        )
     )
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-    # 2) Фабрика сессий
-    global AsyncSessionLocal
-    AsyncSessionLocal = async_sessionmaker(
-        engine,
-        expire_on_commit=False,
-    )
-
-    # 3) Подключаемся к RabbitMQ
-    connection = await connect_robust(settings.RABBITMQ_URL)
-    channel = await connection.channel()
-
-    # 4) Объявляем exchange и очередь
-    exchange = await channel.declare_exchange(
-        name=settings.TASKS_EXCHANGE,
-        type=ExchangeType.DIRECT,
-        durable=True,
-    )
-    queue = await channel.declare_queue(
-        name=settings.TASKS_QUEUE,
-        durable=True,
-    )
-    await queue.bind(
-        exchange=exchange,
-        routing_key=settings.TASKS_ROUTING_KEY,
-    )
+    # 2) Сигналы остановки: при деплое воркер дорабатывает начатые задачи
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
 
-    # 5) Стартуем потребление
-    await queue.consume(handle_message)  # type: ignore[arg-type]
-    logger.info("Worker started, awaiting messages")
+    # 3) Фабрика сессий, очередь и фоновые циклы
+    await start_worker(async_sessionmaker(engine, expire_on_commit=False))
 
-    # 6) Ждём сигнала остановки
+    # 4) Ждём сигнала остановки
     try:
-        await asyncio.Future()
+        await stopping.wait()
+        logger.info("Stop signal received, draining worker")
+        await drain_worker()
     finally:
-        await connection.close()
+        await stop_worker()
+        await engine.dispose()
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Worker stopped by user")
+    asyncio.run(main())
+    logger.info("Worker stopped")
@@ -0,0 +1,119 @@
+"""Общие утилиты бенчмарков: замер задержек, сводка и запись результатов."""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.base import Base
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./benchmark.db"
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies: Sequence[float], elapsed: float, errors: int = 0) -> dict:
+    """Сводка по одной операции: RPS и перцентили задержки в миллисекундах."""
+    count = len(latencies)
+    return {
+        "count": count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+    }
+
+
+async def timed(call: Callable[[], Awaitable[Any]]) -> tuple[float, Any]:
+    """Выполнить корутину и вернуть (длительность в секундах, результат)."""
+    started = time.perf_counter()
+    result = await call()
+    return time.perf_counter() - started, result
+
+
+async def prepare_database(
+    database_url: str,
+) -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    """Создать движок и чистую схему для прогона."""
+    if database_url.startswith("sqlite"):
+        db_path = database_url.split("///", 1)[-1]
+        if db_path and db_path != ":memory:" and os.path.exists(db_path):
+            os.remove(db_path)
+
+    engine = create_async_engine(database_url, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def quiet_logging() -> None:
+    """Логи на каждую задачу искажают замеры — оставляем только предупреждения."""
+    logging.getLogger().setLevel(logging.WARNING)
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+
+
+def write_results(path: str, name: str, config: dict, results: dict) -> None:
+    """Записать результаты в JSON вместе с параметрами прогона и окружением."""
+    payload = {
+        "benchmark": name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "config": config,
+        "results": results,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(payload, indent=2, ensure_ascii=False))
+    print(json.dumps(payload["results"], indent=2, ensure_ascii=False))
+
+
+async def run_load(
+    operation: Callable[[int], Awaitable[bool]], total: int, concurrency: int
+) -> dict:
+    """Выполнить ``total`` операций не более чем в ``concurrency`` потоков.
+
+    ``operation(i)`` возвращает True при успехе.
+    """
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def runner() -> None:
+        nonlocal errors
+        for i in counter:
+            duration, ok = await timed(lambda: operation(i))
+            if ok:
+                latencies.append(duration)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(runner() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
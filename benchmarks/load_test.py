@@ -0,0 +1,152 @@
+"""Нагрузочный тест API и воркера без внешних сервисов.
+
+Приложение FastAPI вызывается напрямую через ASGI-транспорт httpx, вместо
+RabbitMQ используется бэкенд очереди в памяти процесса (InMemoryBackend),
+а задачи из неё обрабатываются ``app.worker.handle_message``. База — SQLite
+(aiosqlite) или локальный Postgres, указанный через ``--database-url``. Схема
+в этой базе пересоздаётся, поэтому используйте отдельную БД.
+
+Пример::
+
+    python -m benchmarks.load_test --tasks 2000 --concurrency 50 \\
+        --output bench/load_test.json
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from httpx import AsyncClient
+
+import app.api.v1.endpoints.tasks as tasks_module
+import app.worker as worker_module
+from app.core.config import settings
+from app.db.session import get_db, get_read_db, get_read_session_factory
+from app.main import app
+from app.services.queue_backend import InMemoryBackend
+from app.services.task_processor import TaskProcessor
+from benchmarks.common import (
+    DEFAULT_DATABASE_URL,
+    prepare_database,
+    quiet_logging,
+    run_load,
+    write_results,
+)
+
+PRIORITIES = ("LOW", "MEDIUM", "HIGH")
+
+
+async def drain(backend: InMemoryBackend) -> dict:
+    """Обработать всё, что накопилось в очереди."""
+    total = backend.qsize()
+    started = time.perf_counter()
+    await backend.consume(worker_module.handle_message)
+    await backend.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "tasks": total,
+        "workers": backend.concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "tasks_per_s": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    engine, session_factory = await prepare_database(args.database_url)
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    backend = InMemoryBackend(concurrency=args.workers)
+    processor = TaskProcessor(backend)
+    # GET-маршруты читают через отдельные зависимости (реплика для чтения)
+    overrides = {
+        get_db: override_get_db,
+        get_read_db: override_get_db,
+        get_read_session_factory: lambda: session_factory,
+    }
+    app.dependency_overrides.update(overrides)
+    tasks_module.get_task_processor = lambda: processor  # type: ignore[assignment]
+    worker_module.AsyncSessionLocal = session_factory
+    settings.TASK_PROCESSING_SECONDS = args.processing_seconds
+
+    created_ids: list[int] = []
+    results: dict = {}
+    try:
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+
+            async def create(i: int) -> bool:
+                resp = await client.post(
+                    "/api/v1/tasks",
+                    json={
+                        "title": f"Benchmark task {i}",
+                        "description": "load test",
+                        "priority": random.choice(PRIORITIES),
+                    },
+                )
+                if resp.status_code != 201:
+                    return False
+                created_ids.append(resp.json()["id"])
+                return True
+
+            async def status(i: int) -> bool:
+                task_id = random.choice(created_ids)
+                resp = await client.get(f"/api/v1/tasks/{task_id}/status")
+                return resp.status_code == 200
+
+            async def list_page(i: int) -> bool:
+                params = {"limit": args.page_size, "skip": 0}
+                if i % 2:
+                    params["priority"] = random.choice(PRIORITIES)
+                resp = await client.get("/api/v1/tasks", params=params)
+                return resp.status_code == 200
+
+            results["create"] = await run_load(create, args.tasks, args.concurrency)
+            results["status"] = await run_load(
+                status, args.status_requests, args.concurrency
+            )
+            results["list"] = await run_load(
+                list_page, args.list_requests, args.concurrency
+            )
+
+        results["drain"] = await drain(backend)
+    finally:
+        await backend.close()
+        for dependency in overrides:
+            app.dependency_overrides.pop(dependency, None)
+        await engine.dispose()
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--tasks", type=int, default=1000, help="POST requests")
+    parser.add_argument("--status-requests", type=int, default=2000)
+    parser.add_argument("--list-requests", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=10, help="parallel handlers")
+    parser.add_argument(
+        "--processing-seconds",
+        type=float,
+        default=0.0,
+        help="simulated work per task (TASK_PROCESSING_SECONDS)",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="load_test_results.json")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    random.seed(args.seed)
+    quiet_logging()
+    results = asyncio.run(run(args))
+    write_results(args.output, "load_test", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
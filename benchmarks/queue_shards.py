@@ -0,0 +1,181 @@
+"""Пропускная способность RabbitMQ в зависимости от числа шардов очереди.
+
+Для каждого значения из ``--shards`` публикуется ``--messages`` сообщений
+(``--publishers`` процессов через ``TaskProcessor.enqueue``, то есть с
+маршрутизацией по хэшу id), а разбирают их процессы-потребители — по одному
+на шард (``WORKER_SHARDS=<номер>``), как при горизонтальном масштабировании
+воркеров. Обработчик только подтверждает сообщение, без БД, поэтому предел —
+брокер. Каждый прогон использует свои exchange и очереди (``bench_shards_<N>``),
+которые в конце удаляются.
+
+Нужен RabbitMQ (``RABBITMQ_URL`` из окружения). Пример::
+
+    python -m benchmarks.queue_shards --shards 1,2,4,8 --messages 200000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+from app.core.config import settings
+from app.db.models.task import Priority
+from app.services.queue_backend import RabbitMQBackend, shard_for
+from app.services.task_processor import TaskProcessor
+from benchmarks.common import quiet_logging, write_results
+
+
+def use_names(shards: int) -> dict[str, str]:
+    """Отдельные exchange и очереди на прогон (и для дочерних процессов)."""
+    names = {
+        "TASKS_EXCHANGE": f"bench_shards_{shards}",
+        "TASKS_QUEUE": f"bench_shards_{shards}_queue",
+        "TASKS_ROUTING_KEY": f"bench_shards_{shards}_key",
+        "QUEUE_SHARDS": str(shards),
+    }
+    os.environ.update(names)
+    settings.TASKS_EXCHANGE = names["TASKS_EXCHANGE"]
+    settings.TASKS_QUEUE = names["TASKS_QUEUE"]
+    settings.TASKS_ROUTING_KEY = names["TASKS_ROUTING_KEY"]
+    settings.QUEUE_SHARDS = shards
+    return names
+
+
+def consume(shard: int, shards: int, expected: int, prefetch: int, ready, done) -> None:
+    quiet_logging()
+
+    async def run() -> None:
+        settings.QUEUE_PREFETCH = prefetch
+        backend = RabbitMQBackend(shards=shards, consume_shards=[shard])
+        received = 0
+        finished = asyncio.Event()
+
+        async def handler(message) -> None:
+            nonlocal received
+            async with message.process():
+                received += 1
+            if received >= expected:
+                finished.set()
+
+        await backend.initialize()
+        if expected:
+            await backend.consume(handler)
+        ready.put(shard)
+        if expected:
+            await finished.wait()
+        done.put((shard, time.time()))
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def publish(ids: list[int], shards: int, started_at, done) -> None:
+    quiet_logging()
+
+    async def run() -> None:
+        processor = TaskProcessor(RabbitMQBackend(shards=shards, consume_shards=[]))
+        await processor.initialize()
+        started_at.put(time.time())
+        for task_id in ids:
+            await processor.enqueue(str(task_id), Priority.MEDIUM)
+        done.put(time.time())
+        await processor.close()
+
+    asyncio.run(run())
+
+
+async def declare_and_cleanup(shards: int, delete: bool) -> None:
+    backend = RabbitMQBackend(shards=shards, consume_shards=[])
+    await backend.initialize()
+    if delete:
+        for queue in [*backend.queues.values(), backend.legacy_queue]:
+            await queue.delete(if_unused=False, if_empty=False)
+        await backend.exchange.delete()
+    await backend.close()
+
+
+def run_once(shards: int, args: argparse.Namespace) -> dict:
+    use_names(shards)
+    asyncio.run(declare_and_cleanup(shards, delete=False))
+
+    ids = list(range(1, args.messages + 1))
+    per_shard = Counter(shard_for(str(task_id), shards) for task_id in ids)
+
+    context = multiprocessing.get_context("spawn")
+    ready, consumed, publish_started, published = (context.Queue() for _ in range(4))
+    consumers = [
+        context.Process(
+            target=consume,
+            args=(shard, shards, per_shard[shard], args.prefetch, ready, consumed),
+        )
+        for shard in range(shards)
+    ]
+    for process in consumers:
+        process.start()
+    for _ in consumers:
+        ready.get(timeout=args.timeout)
+
+    publishers = [
+        context.Process(
+            target=publish,
+            args=(ids[i :: args.publishers], shards, publish_started, published),
+        )
+        for i in range(args.publishers)
+    ]
+    for process in publishers:
+        process.start()
+
+    starts = [publish_started.get(timeout=args.timeout) for _ in publishers]
+    publish_ends = [published.get(timeout=args.timeout) for _ in publishers]
+    consume_ends = [consumed.get(timeout=args.timeout)[1] for _ in consumers]
+    for process in [*publishers, *consumers]:
+        process.join()
+
+    asyncio.run(declare_and_cleanup(shards, delete=True))
+
+    started = min(starts)
+    elapsed = max(consume_ends) - started
+    publish_elapsed = max(publish_ends) - started
+    return {
+        "messages": args.messages,
+        "per_shard": [per_shard[shard] for shard in range(shards)],
+        "elapsed_s": round(elapsed, 4),
+        "messages_per_s": round(args.messages / elapsed, 2),
+        "publish_messages_per_s": round(args.messages / publish_elapsed, 2),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    results = {}
+    for shards in (int(value) for value in args.shards.split(",")):
+        results[f"shards_{shards}"] = run_once(shards, args)
+        print(shards, results[f"shards_{shards}"], flush=True)
+
+    baseline = results[next(iter(results))]["messages_per_s"]
+    for result in results.values():
+        result["speedup"] = round(result["messages_per_s"] / baseline, 2)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="queue_shards_results.json")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    quiet_logging()
+    results = run(args)
+    write_results(args.output, "queue_shards", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
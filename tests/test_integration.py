@@ -1,26 +1,58 @@
 import asyncio
-from datetime import datetime, timezone
+import contextlib
+import csv
+import functools
+import io
+import json
+from datetime import datetime, timedelta, timezone
 
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 import app.api.v1.endpoints.tasks as tasks_module
 import app.db.session as session_module
 from app.db.base import Base
-from app.db.models.task import Status
+from app.db.models.task import Priority, Status
 from app.db.models.task import Task as TaskModel
 from app.main import app
-from app.worker import handle_message
+from app.repositories.task_repository import TaskRepository
+from app.schemas.task import ExportFormat, TaskCreate
+from app.services.admission import AdmissionController, parse_priority_limits
+from app.services.batching import BatchCollector
+from app.services.cancellations import CancelledTasks
+from app.services.export import export_tasks
+from app.services.http_cache import get_task_response_cache
+from app.services.idempotency import get_idempotency_cache
+from app.services.leases import LeaseReaper
+from app.services.messages import TaskMessage, encode_task_message
+from app.services.pg_queue import PostgresQueueBackend
+from app.services.progress import ProgressWriter
+from app.services.queue_backend import InMemoryBackend, InMemoryMessage
+from app.services.readiness import Readiness
+from app.services.scheduler import TaskScheduler
+from app.services.task_counts import get_count_cache
+from app.services.task_processor import TaskProcessor
+from app.worker import (
+    drain_worker,
+    handle_batch,
+    handle_message,
+    start_worker,
+    stop_worker,
+)
 
 
 class DummyProcessor:
-    async def enqueue(self, task_id: str):
+    async def enqueue(self, task_id: str, priority=None, message=None):
         # вместо реального RabbitMQ просто «мокаем» вызов
         return
 
+    async def publish_cancellations(self, task_ids):
+        return
+
 
 @pytest_asyncio.fixture(scope="session")
 def event_loop():
@@ -51,11 +83,23 @@ async def prepare_test_db(monkeypatch):
             yield session
 
     # подменяем подключение к БД на наш in-memory
+    # (роутер уже импортировал get_db, поэтому нужен ещё и dependency_overrides)
     monkeypatch.setattr(session_module, "get_db", override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, tasks_module.get_db, override_get_db)
+    monkeypatch.setitem(
+        app.dependency_overrides, tasks_module.get_read_db, override_get_db
+    )
+    monkeypatch.setitem(
+        app.dependency_overrides,
+        tasks_module.get_read_session_factory,
+        lambda: AsyncSessionLocal,
+    )
     # подменяем TaskProcessor на DummyProcessor
     monkeypatch.setattr(tasks_module, "get_task_processor", lambda: DummyProcessor())
+    # id задач в новой БД начинаются заново — ответы прошлых тестов не нужны
+    get_task_response_cache().clear()
 
-    yield
+    yield AsyncSessionLocal
 
     # после всех тестов удаляем таблицы
     async with engine.begin() as conn:
@@ -119,6 +163,123 @@ async def test_list_and_filter_tasks(client: AsyncClient):
     assert all(item["priority"] == "HIGH" for item in filtered)
 
 
+@pytest.mark.asyncio
+async def test_list_total_count_modes(client: AsyncClient):
+    get_count_cache().clear()
+    for priority in ("LOW", "HIGH", "HIGH"):
+        await client.post("/api/v1/tasks", json={"title": "T", "priority": priority})
+
+    # По умолчанию подсчёта нет
+    resp = await client.get("/api/v1/tasks")
+    assert "X-Total-Count" not in resp.headers
+
+    resp = await client.get("/api/v1/tasks", params={"count": "exact", "limit": 1})
+    assert resp.headers["X-Total-Count"] == "3"
+    assert len(resp.json()) == 1
+
+    # На SQLite оценка совпадает с точным подсчётом
+    resp = await client.get(
+        "/api/v1/tasks", params={"count": "estimated", "priority": "HIGH"}
+    )
+    assert resp.headers["X-Total-Count"] == "2"
+    assert resp.headers["X-Total-Count-Mode"] == "estimated"
+
+    # Кэшированный подсчёт не видит новую задачу до истечения TTL
+    resp = await client.get("/api/v1/tasks", params={"count": "cached"})
+    assert resp.headers["X-Total-Count"] == "3"
+    await client.post("/api/v1/tasks", json={"title": "T", "priority": "LOW"})
+    resp = await client.get("/api/v1/tasks", params={"count": "cached"})
+    assert resp.headers["X-Total-Count"] == "3"
+
+
+@pytest.mark.asyncio
+async def test_search_tasks(client: AsyncClient):
+    for title, description, priority in (
+        ("Send invoice", "monthly report for ACME", "LOW"),
+        ("Report generation", "build the invoice archive", "HIGH"),
+        ("Cleanup", "remove 100%_done files", "HIGH"),
+    ):
+        await client.post(
+            "/api/v1/tasks",
+            json={"title": title, "description": description, "priority": priority},
+        )
+
+    # Совпадение в заголовке ранжируется выше совпадения в описании
+    resp = await client.get("/api/v1/tasks", params={"q": "invoice"})
+    assert [t["title"] for t in resp.json()] == ["Send invoice", "Report generation"]
+
+    # Все слова запроса должны найтись; фильтры по-прежнему работают
+    resp = await client.get("/api/v1/tasks", params={"q": "report acme"})
+    assert [t["title"] for t in resp.json()] == ["Send invoice"]
+    resp = await client.get(
+        "/api/v1/tasks", params={"q": "invoice", "priority": "HIGH", "count": "exact"}
+    )
+    assert [t["title"] for t in resp.json()] == ["Report generation"]
+    assert resp.headers["X-Total-Count"] == "1"
+
+    # Спецсимволы LIKE ищутся буквально
+    resp = await client.get("/api/v1/tasks", params={"q": "0%_d"})
+    assert [t["title"] for t in resp.json()] == ["Cleanup"]
+
+
+@pytest.mark.asyncio
+async def test_export_tasks_streams_ndjson_and_csv(client: AsyncClient, monkeypatch):
+    for i in range(5):
+        await client.post(
+            "/api/v1/tasks",
+            json={"title": f"T{i}", "description": 'say "hi", ok', "priority": "LOW"},
+        )
+    await client.post("/api/v1/tasks", json={"title": "H", "priority": "HIGH"})
+
+    resp = await client.get("/api/v1/tasks/export", params={"priority": "LOW"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [row["title"] for row in rows] == [f"T{i}" for i in range(5)]
+    assert rows[0]["status"] == "NEW"
+
+    # По строке в пачке: каждая следующая пачка читается с последнего id,
+    # без пропусков и повторов
+    monkeypatch.setattr(
+        tasks_module,
+        "export_tasks",
+        functools.partial(tasks_module.export_tasks, batch_size=1),
+    )
+    resp = await client.get("/api/v1/tasks/export", params={"format": "csv"})
+    assert resp.headers["content-type"].startswith("text/csv")
+    records = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [r["title"] for r in records] == [f"T{i}" for i in range(5)] + ["H"]
+    assert records[0]["description"] == 'say "hi", ok'
+
+
+@pytest.mark.asyncio
+async def test_export_closes_session_before_yielding_rows(prepare_test_db):
+    async with prepare_test_db() as session:
+        repository = TaskRepository(session)
+        for i in range(3):
+            await repository.create(TaskCreate(title=f"E{i}", priority="LOW"))
+
+    open_sessions = 0
+
+    @contextlib.asynccontextmanager
+    async def tracked_session():
+        nonlocal open_sessions
+        open_sessions += 1
+        try:
+            async with prepare_test_db() as session:
+                yield session
+        finally:
+            open_sessions -= 1
+
+    stream = export_tasks(tracked_session, ExportFormat.NDJSON, batch_size=2)
+    # Клиент прочитал строку и перестал читать: сессия уже закрыта
+    first = json.loads(await stream.__anext__())
+    assert first["title"] == "E0" and open_sessions == 0
+    rest = [json.loads(line) async for line in stream]
+    assert [row["title"] for row in [first, *rest]] == ["E0", "E1", "E2"]
+    assert open_sessions == 0
+
+
 @pytest.mark.asyncio
 async def test_cancel_task_and_not_found(client: AsyncClient):
     # создаём задачу
@@ -195,3 +356,620 @@ async def test_handle_message(monkeypatch):
         assert task.result == "Processed successfully"
         assert task.started_at is not None
         assert task.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_handle_message_with_full_message_skips_select(
+    prepare_test_db, monkeypatch
+):
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", prepare_test_db)
+    monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", 0)
+    async with prepare_test_db() as session:
+        task = TaskModel(title="T", description="", priority="LOW")
+        session.add(task)
+        await session.commit()
+        task_id = task.id
+
+    statements: list[str] = []
+    engine = prepare_test_db.kw["bind"].sync_engine
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.lstrip().split()[0].upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        body = encode_task_message(TaskMessage.from_task(task))
+        await handle_message(InMemoryMessage(body, task.priority))
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Сразу захват и запись исхода — без чтения строки задачи
+    assert "SELECT" not in statements
+    async with prepare_test_db() as session:
+        assert (await session.get(TaskModel, task_id)).status == Status.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_delayed_task_released_by_scheduler(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    published: list[str] = []
+
+    class RecordingProcessor:
+        async def enqueue(self, task_id: str, priority=None, message=None):
+            published.append(task_id)
+
+    processor = RecordingProcessor()
+    monkeypatch.setattr(tasks_module, "get_task_processor", lambda: processor)
+
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=1)
+    resp = await client.post(
+        "/api/v1/tasks",
+        json={"title": "Later", "priority": "LOW", "run_at": run_at.isoformat()},
+    )
+    assert resp.status_code == 201
+    task_id = resp.json()["id"]
+    # отложенная задача не публикуется сразу
+    assert resp.json()["status"] == "PENDING"
+    assert published == []
+
+    scheduler = TaskScheduler(prepare_test_db, processor)
+    assert await scheduler.run_once() == 0
+
+    await asyncio.sleep(1.1)
+    assert await scheduler.run_once() == 1
+    assert published == [str(task_id)]
+
+    resp2 = await client.get(f"/api/v1/tasks/{task_id}/status")
+    assert resp2.json()["status"] == "NEW"
+
+
+@pytest.mark.asyncio
+async def test_unpublished_tasks_return_through_reaper(prepare_test_db, monkeypatch):
+    published: list[str] = []
+
+    class FlakyProcessor:
+        broken = True
+
+        async def enqueue(self, task_id: str, priority=None, message=None):
+            # Брокер отказывает после первой публикации
+            if self.broken and published:
+                raise ConnectionError("broker is down")
+            published.append(task_id)
+
+    processor = FlakyProcessor()
+    reaper = LeaseReaper(prepare_test_db, processor, max_attempts=5)
+
+    async def statuses(ids):
+        async with prepare_test_db() as session:
+            tasks = [await session.get(TaskModel, task_id) for task_id in ids]
+            return [task.status for task in tasks]
+
+    async with prepare_test_db() as session:
+        repository = TaskRepository(session)
+        ids = [
+            (await repository.create(TaskCreate(title="Lost", priority="LOW"))).id
+            for _ in range(3)
+        ]
+        for task_id in ids:
+            # Аренда истекает сразу: воркер «упал»
+            assert await repository.claim_for_processing(task_id, "dead", lease_ttl=0)
+
+    assert await reaper.run_once() == 3
+    assert published == [str(ids[0])]
+    # Неопубликованные не застряли в NEW: их снова вернёт сборщик аренд
+    assert await statuses(ids[1:]) == [Status.IN_PROGRESS] * 2
+    processor.broken = False
+    assert await reaper.run_once() == 2
+    assert published == [str(task_id) for task_id in ids]
+    assert await statuses(ids) == [Status.NEW] * 3
+
+    # То же для зависимых задач, выпущенных воркером
+    async with prepare_test_db() as session:
+        repository = TaskRepository(session)
+        parent = await repository.create(TaskCreate(title="Parent", priority="LOW"))
+        children = [
+            await repository.create(
+                TaskCreate(title="Child", priority="LOW", depends_on=[parent.id])
+            )
+            for _ in range(2)
+        ]
+    published.clear()
+    processor.broken = True
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", prepare_test_db)
+    monkeypatch.setattr("app.worker.get_task_processor", lambda: processor)
+    monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", 0)
+    await handle_message(InMemoryMessage(str(parent.id).encode(), Priority.LOW))
+
+    child_ids = [child.id for child in children]
+    assert len(published) == 1
+    unpublished = [task_id for task_id in child_ids if str(task_id) not in published]
+    assert await statuses(unpublished) == [Status.IN_PROGRESS]
+    processor.broken = False
+    assert await reaper.run_once() == 1
+    assert sorted(published) == sorted(str(task_id) for task_id in child_ids)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_returns_original_task(client: AsyncClient, monkeypatch):
+    published: list[str] = []
+
+    class RecordingProcessor:
+        async def enqueue(self, task_id: str, priority=None, message=None):
+            published.append(task_id)
+
+    monkeypatch.setattr(tasks_module, "get_task_processor", RecordingProcessor)
+    get_idempotency_cache().clear()
+
+    payload = {"title": "Retry me", "description": "", "priority": "HIGH"}
+    headers = {"Idempotency-Key": "retry-key-1"}
+    first = await client.post("/api/v1/tasks", json=payload, headers=headers)
+    assert first.status_code == 201
+
+    # повтор из кэша в памяти
+    second = await client.post("/api/v1/tasks", json=payload, headers=headers)
+    assert second.json()["id"] == first.json()["id"]
+
+    # повтор мимо кэша (например, на другом инстансе API) — из БД по индексу
+    get_idempotency_cache().clear()
+    third = await client.post("/api/v1/tasks", json=payload, headers=headers)
+    assert third.json()["id"] == first.json()["id"]
+
+    assert published == [str(first.json()["id"])]
+    tasks = (await client.get("/api/v1/tasks")).json()
+    assert [t["title"] for t in tasks].count("Retry me") == 1
+
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_end_to_end(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    # API и воркер в одном процессе, без брокера
+    backend = InMemoryBackend(concurrency=2)
+    processor = TaskProcessor(backend)
+    monkeypatch.setattr(tasks_module, "get_task_processor", lambda: processor)
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", prepare_test_db)
+    monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", 0)
+
+    ids = []
+    for priority in ("LOW", "HIGH"):
+        resp = await client.post(
+            "/api/v1/tasks", json={"title": priority, "priority": priority}
+        )
+        ids.append(resp.json()["id"])
+
+    await backend.consume(handle_message)
+    await asyncio.wait_for(backend.join(), timeout=5)
+    await backend.close()
+
+    for task_id in ids:
+        resp = await client.get(f"/api/v1/tasks/{task_id}/status")
+        assert resp.json()["status"] == "COMPLETED"
+
+
+@pytest.mark.asyncio
+async def test_batch_mode_loads_once_and_records_each_outcome(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    ids = []
+    for title in ("ok", "boom", "done"):
+        resp = await client.post(
+            "/api/v1/tasks", json={"title": title, "priority": "LOW"}
+        )
+        ids.append(resp.json()["id"])
+    async with prepare_test_db() as session:
+        await TaskRepository(session).update_status(ids[2], Status.COMPLETED)
+
+    batches = []
+    loads = []
+
+    async def process_batch(tasks):
+        batches.append([task.id for task in tasks])
+        return [
+            RuntimeError("boom") if task.title == "boom" else f"done {task.id}"
+            for task in tasks
+        ]
+
+    get_many = TaskRepository.get_many
+
+    async def counting_get_many(self, task_ids):
+        loads.append(sorted(task_ids))
+        return await get_many(self, task_ids)
+
+    monkeypatch.setattr("app.worker.process_batch", process_batch)
+    monkeypatch.setattr(TaskRepository, "get_many", counting_get_many)
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", prepare_test_db)
+
+    backend = InMemoryBackend(concurrency=10)
+    for task_id in ids:
+        await backend.publish(str(task_id).encode())
+    await backend.publish(b"not-a-number")
+    await backend.consume(BatchCollector(handle_batch, max_size=4, max_wait=1).submit)
+    await asyncio.wait_for(backend.join(), timeout=5)
+    await backend.close()
+
+    # Одна пачка, один запрос за строками; завершённая задача не обрабатывается
+    assert loads == [sorted(ids)]
+    assert batches == [ids[:2]]
+    ok = (await client.get(f"/api/v1/tasks/{ids[0]}")).json()
+    assert ok["status"] == "COMPLETED" and ok["result"] == f"done {ids[0]}"
+    failed = (await client.get(f"/api/v1/tasks/{ids[1]}")).json()
+    assert failed["status"] == "FAILED" and failed["error"] == "boom"
+
+
+@pytest.mark.asyncio
+async def test_drain_worker_finishes_or_returns_tasks(prepare_test_db, monkeypatch):
+    for flag in ("SCHEDULER_ENABLED", "REAPER_ENABLED", "ADAPTIVE_CONCURRENCY"):
+        monkeypatch.setattr(f"app.worker.settings.{flag}", False)
+    monkeypatch.setattr("app.worker.settings.METRICS_LOG_INTERVAL", 0)
+    monkeypatch.setattr("app.worker.settings.BATCH_MAX_SIZE", 1)
+
+    async def run(seconds: float, drain_timeout: float) -> tuple[float, list]:
+        monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", seconds)
+        processor = TaskProcessor(InMemoryBackend(concurrency=10))
+        monkeypatch.setattr("app.worker.get_task_processor", lambda: processor)
+        async with prepare_test_db() as session:
+            repository = TaskRepository(session)
+            ids = [
+                (await repository.create(TaskCreate(title="t", priority="LOW"))).id
+                for _ in range(7)
+            ]
+        await start_worker(prepare_test_db)
+        for task_id in ids:
+            await processor.enqueue(str(task_id))
+        await asyncio.sleep(0.05)
+
+        duration = await drain_worker(drain_timeout)
+        await stop_worker()
+        async with prepare_test_db() as session:
+            tasks = [await session.get(TaskModel, task_id) for task_id in ids]
+            for task in tasks:
+                await session.refresh(task)
+        return duration, [(task.status, task.lease_owner) for task in tasks]
+
+    # Пять слотов заняты и успевают доработать, два сообщения не начаты
+    duration, states = await run(0.2, drain_timeout=5)
+    assert duration < 5
+    assert [status for status, _ in states].count(Status.COMPLETED) == 5
+    assert [status for status, _ in states].count(Status.NEW) == 2
+
+    # Не успели к сроку: задачи возвращены в NEW без аренды, сразу доступны
+    duration, states = await run(10, drain_timeout=0.1)
+    assert duration < 2
+    assert states == [(Status.NEW, None)] * 7
+
+
+@pytest.mark.asyncio
+async def test_in_memory_tasks_survive_drain_and_restart(prepare_test_db, monkeypatch):
+    for flag in ("SCHEDULER_ENABLED", "REAPER_ENABLED", "ADAPTIVE_CONCURRENCY"):
+        monkeypatch.setattr(f"app.worker.settings.{flag}", False)
+    monkeypatch.setattr("app.worker.settings.METRICS_LOG_INTERVAL", 0)
+    monkeypatch.setattr("app.worker.settings.BATCH_MAX_SIZE", 1)
+
+    async def statuses(ids):
+        async with prepare_test_db() as session:
+            tasks = [await session.get(TaskModel, task_id) for task_id in ids]
+            for task in tasks:
+                await session.refresh(task)
+            return [task.status for task in tasks]
+
+    async def start(seconds: float) -> TaskProcessor:
+        # Новый процесс: очередь в памяти пуста
+        monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", seconds)
+        processor = TaskProcessor(InMemoryBackend(concurrency=10))
+        monkeypatch.setattr("app.worker.get_task_processor", lambda: processor)
+        await start_worker(prepare_test_db)
+        return processor
+
+    async with prepare_test_db() as session:
+        repository = TaskRepository(session)
+        ids = [
+            (await repository.create(TaskCreate(title="t", priority="LOW"))).id
+            for _ in range(7)
+        ]
+    # Воркер сам публикует семь NEW-задач: пять выполняются, две ждут в
+    # буфере диспетчера; срок остановки истекает, и все сообщения пропадают
+    # вместе с очередью в памяти
+    await start(10)
+    await asyncio.sleep(0.05)
+    await drain_worker(0.05)
+    await stop_worker()
+    assert await statuses(ids) == [Status.NEW] * 7
+
+    # После перезапуска воркер сам публикует задачи, оставшиеся в NEW
+    await start(0)
+    for _ in range(100):
+        if await statuses(ids) == [Status.COMPLETED] * 7:
+            break
+        await asyncio.sleep(0.02)
+    await drain_worker(1)
+    await stop_worker()
+    assert await statuses(ids) == [Status.COMPLETED] * 7
+
+
+@pytest.mark.asyncio
+async def test_admission_control_rejects_low_priority(client: AsyncClient, monkeypatch):
+    # В очереди 3 сообщения: LOW (порог 2) отклоняется, HIGH (без порога) принят
+    backend = InMemoryBackend()
+    for _ in range(3):
+        await backend.publish(b"1")
+    controller = AdmissionController(
+        backend,
+        max_queue_depth=parse_priority_limits("HIGH:0,MEDIUM:10,LOW:2"),
+        retry_after=4,
+    )
+    monkeypatch.setattr(tasks_module, "get_admission_controller", lambda: controller)
+
+    resp = await client.post("/api/v1/tasks", json={"title": "L", "priority": "LOW"})
+    assert resp.status_code == 429
+    # Перегрузка в 1.5 раза — Retry-After растёт пропорционально
+    assert resp.headers["Retry-After"] == "6"
+
+    for priority in ("HIGH", "MEDIUM"):
+        resp = await client.post(
+            "/api/v1/tasks", json={"title": priority, "priority": priority}
+        )
+        assert resp.status_code == 201
+
+
+@pytest.mark.asyncio
+async def test_progress_is_coalesced_and_returned_by_status(
+    client: AsyncClient, prepare_test_db
+):
+    task_id = (
+        await client.post("/api/v1/tasks", json={"title": "Long", "priority": "LOW"})
+    ).json()["id"]
+    async with prepare_test_db() as session:
+        await TaskRepository(session).claim_for_processing(task_id, "w1", 60)
+
+    writer = ProgressWriter(owner="w1", min_interval=60)
+    for percent in (10, 20, 30):
+        writer.report(task_id, percent, "Working")
+    # Три отчёта схлопнулись в одну запись последнего значения
+    assert await writer.flush(prepare_test_db) == 1
+    status = (await client.get(f"/api/v1/tasks/{task_id}/status")).json()
+    assert status == {
+        "status": "IN_PROGRESS",
+        "progress": 30.0,
+        "progress_message": "Working",
+    }
+
+    # Чаще min_interval задача не пишется, пока не попросят дописать всё
+    writer.report(task_id, 150, "x" * 300)
+    assert await writer.flush(prepare_test_db) == 0
+    assert await writer.flush(prepare_test_db, force=True) == 1
+    status = (await client.get(f"/api/v1/tasks/{task_id}/status")).json()
+    assert status["progress"] == 100.0 and len(status["progress_message"]) == 255
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_and_terminal_task_cache(
+    client: AsyncClient, monkeypatch
+):
+    task_id = (
+        await client.post("/api/v1/tasks", json={"title": "Poll", "priority": "LOW"})
+    ).json()["id"]
+    url = f"/api/v1/tasks/{task_id}"
+
+    # Незавершённая задача: валидаторы есть, но ответ надо перепроверять
+    first = await client.get(url)
+    assert first.status_code == 200 and first.json()["status"] == "NEW"
+    assert first.headers["Cache-Control"] == "no-cache"
+    etag = first.headers["ETag"]
+    resp = await client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.content == b""
+
+    # После отмены тело и ETag другие, ответ кэшируется надолго
+    await client.delete(url)
+    resp = await client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.json()["status"] == "CANCELLED"
+    assert "immutable" in resp.headers["Cache-Control"]
+    final_etag = resp.headers["ETag"]
+    assert final_etag != etag
+    status = await client.get(f"{url}/status")
+    assert status.json()["status"] == "CANCELLED"
+
+    # Завершённая задача отдаётся из памяти процесса, БД не нужна
+    def no_database():
+        raise AssertionError("database must not be used")
+
+    monkeypatch.setitem(
+        app.dependency_overrides,
+        tasks_module.get_read_session_factory,
+        lambda: no_database,
+    )
+    resp = await client.get(url)
+    assert resp.json()["status"] == "CANCELLED"
+    assert resp.headers["ETag"] == final_etag
+    resp = await client.get(url, headers={"If-None-Match": final_etag})
+    assert resp.status_code == 304
+    last_modified = (await client.get(url)).headers["Last-Modified"]
+    resp = await client.get(url, headers={"If-Modified-Since": last_modified})
+    assert resp.status_code == 304
+    assert (await client.get(f"{url}/status")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_if_modified_since_after_cancel_returns_new_body(client: AsyncClient):
+    payload = {"title": "Stale", "priority": "LOW"}
+    ids = [
+        (await client.post("/api/v1/tasks", json=payload)).json()["id"]
+        for _ in range(2)
+    ]
+    seen = {}
+    for task_id in ids:
+        resp = await client.get(f"/api/v1/tasks/{task_id}")
+        assert resp.json()["status"] == "NEW"
+        seen[task_id] = resp.headers["Last-Modified"]
+
+    # Одна задача отменяется по DELETE, другая — массовой отменой
+    assert (await client.delete(f"/api/v1/tasks/{ids[0]}")).status_code == 200
+    resp = await client.post("/api/v1/tasks/cancel", json={"ids": [ids[1]]})
+    assert resp.json()["cancelled"] == 1
+
+    # Отметка ответа NEW старше отмены, даже случившейся в ту же секунду
+    for task_id in ids:
+        resp = await client.get(
+            f"/api/v1/tasks/{task_id}", headers={"If-Modified-Since": seen[task_id]}
+        )
+        assert resp.status_code == 200 and resp.json()["status"] == "CANCELLED"
+        assert resp.json()["finished_at"] is not None
+        resp = await client.get(
+            f"/api/v1/tasks/{task_id}",
+            headers={"If-Modified-Since": resp.headers["Last-Modified"]},
+        )
+        assert resp.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_liveness_and_readiness(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    readiness = Readiness(session_factory=prepare_test_db)
+    monkeypatch.setattr("app.main.get_readiness", lambda: readiness)
+
+    # Очередь ещё не подключена: процесс жив, но трафик принимать не готов
+    assert (await client.get("/health/live")).status_code == 200
+    resp = await client.get("/health/ready")
+    assert resp.status_code == 503
+    assert resp.json()["checks"] == {"database": "ok", "queue": "connecting"}
+
+    readiness.queue_ready = True
+    resp = await client.get("/health/ready")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "ok"
+
+
+@pytest.mark.asyncio
+async def test_read_routing_falls_back_to_primary(monkeypatch):
+    replica = object()
+    lag = [0.5]
+
+    class FakeLagMonitor:
+        async def lag(self):
+            return lag[0]
+
+    monkeypatch.setattr(session_module, "ReadSessionLocal", replica)
+    monkeypatch.setattr(session_module, "replica_lag", FakeLagMonitor())
+    monkeypatch.setattr(session_module.settings, "REPLICA_MAX_LAG", 1.0)
+
+    choose = session_module.choose_read_session_factory
+    assert await choose() is replica
+    # Чтение своих записей и отставшая реплика — на primary
+    assert await choose(read_your_writes=True) is session_module.AsyncSessionLocal
+    lag[0] = 3.0
+    assert await choose() is session_module.AsyncSessionLocal
+
+
+@pytest.mark.asyncio
+async def test_bulk_cancel_drops_queued_messages(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    backend = InMemoryBackend(concurrency=1)
+    processor = TaskProcessor(backend)
+    cancelled = CancelledTasks()
+    await backend.consume_cancellations(cancelled.add)
+    monkeypatch.setattr(tasks_module, "get_task_processor", lambda: processor)
+    monkeypatch.setattr("app.worker.get_cancelled_tasks", lambda: cancelled)
+    monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", 0)
+
+    # Считаем сессии воркера: отменённые сообщения не должны открывать их
+    sessions = []
+
+    def counting_session_factory():
+        sessions.append(1)
+        return prepare_test_db()
+
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", counting_session_factory)
+
+    for priority in ("LOW", "LOW", "LOW", "HIGH"):
+        await client.post("/api/v1/tasks", json={"title": "T", "priority": priority})
+
+    resp = await client.post("/api/v1/tasks/cancel", json={})
+    assert resp.status_code == 422
+    resp = await client.post(
+        "/api/v1/tasks/cancel", json={"priority": "LOW", "status": "NEW"}
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["cancelled"] == 3
+    assert all(task_id in cancelled for task_id in body["ids"])
+
+    await backend.consume(handle_message)
+    await asyncio.wait_for(backend.join(), timeout=5)
+    await backend.close()
+    assert len(sessions) == 1
+
+    resp = await client.get("/api/v1/tasks", params={"status": "CANCELLED"})
+    assert sorted(t["id"] for t in resp.json()) == sorted(body["ids"])
+
+
+@pytest.mark.asyncio
+async def test_postgres_queue_backend_claims_from_table(
+    client: AsyncClient, prepare_test_db, monkeypatch
+):
+    # Без брокера: воркер забирает NEW-задачи прямо из таблицы
+    # (in-memory SQLite — одно соединение, поэтому обработка по одной задаче)
+    backend = PostgresQueueBackend(prepare_test_db, concurrency=1, idle_timeout=0.05)
+    processor = TaskProcessor(backend)
+    monkeypatch.setattr(tasks_module, "get_task_processor", lambda: processor)
+    monkeypatch.setattr("app.worker.AsyncSessionLocal", prepare_test_db)
+    monkeypatch.setattr("app.worker.settings.TASK_PROCESSING_SECONDS", 0)
+
+    ids = []
+    for i in range(3):
+        resp = await client.post(
+            "/api/v1/tasks", json={"title": f"pg {i}", "priority": "MEDIUM"}
+        )
+        ids.append(resp.json()["id"])
+
+    processed: list[bytes] = []
+    done = asyncio.Event()
+
+    async def handler(message):
+        await handle_message(message)
+        processed.append(message.body)
+        if len(processed) == len(ids):
+            done.set()
+
+    await backend.consume(handler)
+    await asyncio.wait_for(done.wait(), timeout=5)
+    await backend.close()
+
+    assert sorted(processed) == sorted(str(i).encode() for i in ids)
+    for task_id in ids:
+        resp = await client.get(f"/api/v1/tasks/{task_id}/status")
+        assert resp.json()["status"] == "COMPLETED"
+
+
+@pytest.mark.asyncio
+async def test_postgres_queue_notify_with_msgpack_body(monkeypatch):
+    # На SQLite ветка NOTIFY не выполняется — подменяем сессию записывающей
+    executed: list[tuple[str, dict]] = []
+
+    class RecordingSession:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, stmt, params):
+            executed.append((str(stmt), params))
+
+        async def commit(self):
+            return
+
+    backend = PostgresQueueBackend(RecordingSession, channel="tasks_ready")
+    monkeypatch.setattr(backend, "_is_postgres", lambda session: True)
+    body = encode_task_message(
+        TaskMessage(7, Priority.HIGH, "Title", "описание " * 2000)
+    )
+
+    await backend.publish(body, Priority.HIGH)
+
+    # Бинарное тело не декодируется и не уходит в NOTIFY (лимит 8000 байт)
+    assert executed == [
+        ("SELECT pg_notify(:channel, '')", {"channel": "tasks_ready"})
+    ]
+    assert backend._wakeup.is_set()
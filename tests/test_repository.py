@@ -1,12 +1,15 @@
+from datetime import datetime, timedelta, timezone
+
 import pytest
 import pytest_asyncio
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.db.base import Base
 from app.db.models.task import Priority, Status
-from app.repositories.task_repository import TaskRepository
-from app.schemas.task import TaskCreate
+from app.repositories.task_repository import DependencyNotFound, TaskRepository
+from app.schemas.task import TaskCreate, TaskRead
 
 
 @pytest_asyncio.fixture
@@ -120,3 +123,265 @@ async def test_cancel_completed_task(repository):
 
     # Должно вернуть None, так как задача уже завершена
     assert cancelled_task is None
+
+
+@pytest.mark.asyncio
+async def test_core_fast_paths_single_statement(repository):
+    """Тест Core-путей: по одному оператору на создание, смену статуса и отмену"""
+    statements: list[str] = []
+    engine = repository.db.bind.sync_engine
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.lstrip().split()[0].upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        task = await repository.create(
+            TaskCreate(title="Fast", description="path", priority=Priority.HIGH)
+        )
+        updated = await repository.update_status(task.id, Status.IN_PROGRESS)
+        cancelled = await repository.cancel_task(task.id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Без refresh: значения по умолчанию сервера приходят из RETURNING
+    assert statements.count("INSERT") == 1 and "SELECT" not in statements
+    assert task.attempts == 0 and task.priority == Priority.HIGH
+    assert updated.status == Status.IN_PROGRESS
+    assert cancelled.status == Status.CANCELLED
+    # Строка сразу проходит валидацию схемы ответа
+    assert TaskRead.model_validate(cancelled).title == "Fast"
+    assert await repository.update_status(task.id + 1, Status.FAILED) is None
+    assert await repository.cancel_task(task.id) is None
+
+
+@pytest.mark.asyncio
+async def test_create_delayed_task_is_pending(repository):
+    """Тест: задача с run_at в будущем сохраняется как PENDING"""
+    run_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    task = await repository.create(
+        TaskCreate(title="Later", description="", priority=Priority.LOW, run_at=run_at)
+    )
+
+    assert task.status == Status.PENDING
+    assert await repository.get_next_run_at() == run_at
+
+
+@pytest.mark.asyncio
+async def test_release_due_tasks(repository):
+    """Тест выпуска созревших отложенных задач пачками"""
+    now = datetime.now(timezone.utc)
+    due = []
+    for minutes in (3, 2, 1):
+        task = await repository.create(
+            TaskCreate(
+                title=f"Due {minutes}",
+                priority=Priority.MEDIUM,
+                run_at=now + timedelta(minutes=minutes),
+            )
+        )
+        due.append(task.id)
+    future = await repository.create(
+        TaskCreate(
+            title="Future", priority=Priority.MEDIUM, run_at=now + timedelta(days=1)
+        )
+    )
+
+    later = now + timedelta(minutes=5)
+    # Сначала самые ранние, не больше limit
+    assert set(await repository.release_due_tasks(later, limit=2)) == {
+        (due[2], Priority.MEDIUM),
+        (due[1], Priority.MEDIUM),
+    }
+    assert await repository.release_due_tasks(later, limit=2) == [
+        (due[0], Priority.MEDIUM)
+    ]
+    assert await repository.release_due_tasks(later, limit=2) == []
+
+    released = await repository.get_by_id(due[0])
+    await repository.db.refresh(released)
+    assert released.status == Status.NEW
+    assert (await repository.get_by_id(future.id)).status == Status.PENDING
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_expires(repository):
+    """Тест: по истечении окна ключ можно использовать для новой задачи"""
+    task_data = TaskCreate(title="Once", priority=Priority.LOW)
+
+    first, created = await repository.create_idempotent(task_data, "key", ttl=3600)
+    again, created_again = await repository.create_idempotent(
+        task_data, "key", ttl=3600
+    )
+    assert created and not created_again
+    assert again.id == first.id
+
+    fresh, created_fresh = await repository.create_idempotent(task_data, "key", ttl=0)
+    assert created_fresh
+    assert fresh.id != first.id
+
+
+@pytest.mark.asyncio
+async def test_claim_ready_tasks_in_priority_order(repository):
+    """Тест выборки готовых задач для очереди в Postgres"""
+    low = await repository.create(TaskCreate(title="Low", priority=Priority.LOW))
+    high = await repository.create(TaskCreate(title="High", priority=Priority.HIGH))
+    medium = await repository.create(
+        TaskCreate(title="Medium", priority=Priority.MEDIUM)
+    )
+    await repository.create(
+        TaskCreate(
+            title="Later",
+            priority=Priority.HIGH,
+            run_at=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+    )
+
+    claimed = await repository.claim_ready_tasks(2, "worker-1", lease_ttl=10)
+    assert {task_id for task_id, _ in claimed} == {high.id, medium.id}
+    # повторно те же задачи не выдаются, отложенная — тоже
+    assert await repository.claim_ready_tasks(10, "worker-1", lease_ttl=10) == [
+        (low.id, Priority.LOW)
+    ]
+    assert await repository.claim_ready_tasks(10, "worker-1", lease_ttl=10) == []
+
+    task = await repository.get_by_id(high.id)
+    await repository.db.refresh(task)
+    assert task.status == Status.IN_PROGRESS
+
+
+@pytest.mark.asyncio
+async def test_leases_and_reaper(repository):
+    """Тест аренды: чужая живая аренда блокирует, истёкшая — возвращается в очередь"""
+    task = await repository.create(TaskCreate(title="Leased", priority=Priority.HIGH))
+
+    assert await repository.claim_for_processing(task.id, "worker-a", lease_ttl=60)
+    assert not await repository.claim_for_processing(task.id, "worker-b", lease_ttl=60)
+    assert await repository.renew_leases([task.id], "worker-a", lease_ttl=60) == 1
+    assert await repository.renew_leases([task.id], "worker-b", lease_ttl=60) == 0
+
+    # worker-a «упал»: аренда истекла, задача снова NEW
+    later = datetime.now(timezone.utc) + timedelta(minutes=5)
+    requeued, failed = await repository.reap_expired_leases(
+        later, max_attempts=2, limit=10
+    )
+    assert requeued == [(task.id, Priority.HIGH)] and failed == []
+    # опоздавший worker-a не может записать результат
+    assert not await repository.finish_task(task.id, "worker-a", Status.COMPLETED)
+
+    # вторая попытка тоже истекла — попытки исчерпаны
+    assert await repository.claim_for_processing(task.id, "worker-b", lease_ttl=0)
+    requeued, failed = await repository.reap_expired_leases(
+        later, max_attempts=2, limit=10
+    )
+    assert requeued == [] and failed == [task.id]
+
+    task = await repository.get_by_id(task.id)
+    await repository.db.refresh(task)
+    assert task.status == Status.FAILED
+    assert task.attempts == 2
+    assert task.lease_owner is None
+
+
+@pytest.mark.asyncio
+async def test_dependencies_release_and_cascade(repository):
+    """Тест графа задач: выпуск после всех зависимостей и каскадная отмена"""
+
+    async def create(title, depends_on=None):
+        return await repository.create(
+            TaskCreate(title=title, priority=Priority.MEDIUM, depends_on=depends_on)
+        )
+
+    async def run(task_id, status=Status.COMPLETED):
+        assert await repository.claim_for_processing(task_id, "worker", lease_ttl=60)
+        return await repository.finish_task(task_id, "worker", status)
+
+    async def status_of(task_id):
+        task = await repository.get_by_id(task_id)
+        await repository.db.refresh(task)
+        return task.status
+
+    a, b = await create("A"), await create("B")
+    # Ромб: C и D ждут A и B, E ждёт C и D
+    c = await create("C", depends_on=[a.id, b.id])
+    d = await create("D", depends_on=[a.id, b.id, a.id])
+    e = await create("E", depends_on=[c.id, d.id])
+    assert (c.status, c.pending_dependencies) == (Status.PENDING, 2)
+    assert d.pending_dependencies == 2
+
+    assert await run(a.id) == []
+    assert set(await run(b.id)) == {(c.id, Priority.MEDIUM), (d.id, Priority.MEDIUM)}
+    # Отложенные задачи с ожидающими зависимостями планировщик не трогает
+    assert await repository.get_next_run_at() is None
+
+    assert await run(c.id) == []
+    # Упавшая зависимость отменяет всех, кто её ждёт
+    assert await run(d.id, Status.FAILED) == []
+    assert await status_of(e.id) == Status.CANCELLED
+
+    # Новая задача от упавшей зависимости сразу отменена
+    late = await create("Late", depends_on=[d.id])
+    assert late.status == Status.CANCELLED
+
+    # Отмена задачи отменяет цепочку зависимых транзитивно
+    f = await create("F")
+    g = await create("G", depends_on=[f.id])
+    h = await create("H", depends_on=[g.id])
+    assert sorted(await repository.cancel_many(ids=[f.id])) == [f.id, g.id, h.id]
+    assert await status_of(h.id) == Status.CANCELLED
+
+    # Несуществующая зависимость — ошибка, задача не создаётся
+    with pytest.raises(DependencyNotFound):
+        await create("Orphan", depends_on=[a.id, 10_000])
+
+
+@pytest.mark.asyncio
+async def test_memoization_hits_and_coalesces(repository):
+    """Тест мемоизации: дубликат ждёт выполняющуюся задачу, затем берёт результат"""
+
+    def same(**kwargs):
+        return TaskCreate(
+            title="Render", description="report", priority=Priority.LOW, **kwargs
+        )
+
+    leader = await repository.create(same(memoize=True), memo_ttl=60)
+    follower = await repository.create(same(memoize=True), memo_ttl=60)
+    plain = await repository.create(same())
+    assert (leader.status, leader.memo_of) == (Status.NEW, None)
+    assert (follower.status, follower.memo_of) == (Status.PENDING, leader.id)
+    assert plain.input_hash is None and plain.status == Status.NEW
+
+    assert await repository.claim_for_processing(leader.id, "worker", lease_ttl=60)
+    assert await repository.finish_task(
+        leader.id, "worker", Status.COMPLETED, result="42"
+    ) == []
+    follower = await repository.get_by_id(follower.id)
+    await repository.db.refresh(follower)
+    assert (follower.status, follower.result) == (Status.COMPLETED, "42")
+
+    hit = await repository.create(same(memoize=True), memo_ttl=60)
+    assert (hit.status, hit.result, hit.memo_of) == (Status.COMPLETED, "42", leader.id)
+
+    # Без memo_ttl (мемоизация выключена) задача выполняется сама
+    fresh = await repository.create(same(memoize=True))
+    assert fresh.status == Status.NEW and fresh.memo_of is None
+
+
+@pytest.mark.asyncio
+async def test_memoization_race_retries_as_follower(repository, monkeypatch):
+    """Тест: проигравший гонку дубликат становится ведомым, а не второй копией"""
+    data = TaskCreate(title="Race", priority=Priority.LOW, memoize=True)
+    leader_id = (await repository.create(data, memo_ttl=60)).id
+
+    # Первая проверка «не увидела» лидера, как при одновременном создании
+    lookup = repository._memo_leader
+    calls = []
+
+    async def racing_lookup(input_hash):
+        calls.append(input_hash)
+        return None if len(calls) == 1 else await lookup(input_hash)
+
+    monkeypatch.setattr(repository, "_memo_leader", racing_lookup)
+    follower = await repository.create(data, memo_ttl=60)
+    assert (follower.status, follower.memo_of) == (Status.PENDING, leader_id)
+    assert len(calls) == 3
@@ -1,8 +1,29 @@
+import asyncio
+
+import msgpack
 import pytest
+import structlog
 from pydantic import ValidationError
 
+from app.core.cache import TTLCache
+from app.core.logging import EventSampler, parse_event_limits
+from app.core.metrics import LatencyTracker
 from app.db.models.task import Priority, Status
 from app.schemas.task import TaskCreate, TaskRead, TaskStatus
+from app.services.admission import AdmissionController, parse_priority_limits
+from app.services.batching import BatchCollector
+from app.services.concurrency import AdaptiveConcurrencyLimiter, prefetch_for
+from app.services.dispatcher import WeightedFairDispatcher, parse_weights
+from app.services.messages import TaskMessage, decode_task_message, encode_task_message
+from app.services.queue_backend import (
+    InMemoryBackend,
+    InMemoryMessage,
+    RabbitMQBackend,
+    parse_shards,
+    priority_queue_name,
+    shard_for,
+)
+from app.services.readiness import Readiness
 from app.services.task_processor import TaskProcessor, get_task_processor
 
 
@@ -55,3 +76,347 @@ def test_get_task_processor_singleton():
     assert isinstance(p1, TaskProcessor)
     # должно быть один и тот же экземпляр
     assert p1 is p2
+
+
+def test_ttl_cache_expiry_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.core.cache.time.monotonic", lambda: now[0])
+
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" давно не использовался и вытесняется
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_priority_order():
+    backend = InMemoryBackend(concurrency=1)
+    await backend.publish(b"1", Priority.LOW)
+    await backend.publish(b"2", Priority.HIGH)
+    await backend.publish(b"3", Priority.MEDIUM)
+    await backend.publish(b"4", Priority.HIGH)
+
+    received = []
+
+    async def handler(message):
+        async with message.process():
+            received.append(message.body)
+
+    await backend.consume(handler)
+    await asyncio.wait_for(backend.join(), timeout=1)
+    await backend.close()
+
+    assert received == [b"2", b"4", b"3", b"1"]
+
+
+def test_shard_for_is_stable_and_even():
+    ids = [str(task_id) for task_id in range(1, 8001)]
+    shards = [shard_for(task_id, 8) for task_id in ids]
+    assert all(0 <= shard < 8 for shard in shards)
+    # Хэш не зависит от процесса: API и воркеры считают шард одинаково
+    assert shards == [shard_for(task_id, 8) for task_id in ids]
+    counts = [shards.count(shard) for shard in range(8)]
+    assert min(counts) > 0.8 * len(ids) / 8
+    assert shard_for("42", 1) == 0
+
+
+def test_parse_shards():
+    assert parse_shards("", 4) == [0, 1, 2, 3]
+    assert parse_shards("0, 2-3", 4) == [0, 2, 3]
+    with pytest.raises(ValueError):
+        parse_shards("3-4", 4)
+    # Шард 0 сохраняет прежние имена очередей
+    assert priority_queue_name(Priority.HIGH) == priority_queue_name(Priority.HIGH, 0)
+    assert priority_queue_name(Priority.HIGH, 3).endswith(".high.3")
+
+
+@pytest.mark.asyncio
+async def test_task_processor_routes_by_shard():
+    class ShardedBackend(InMemoryBackend):
+        shards = 4
+
+        def __init__(self):
+            super().__init__()
+            self.published = []
+
+        async def publish(self, body, priority=Priority.MEDIUM, shard=0):
+            self.published.append((body.decode(), shard))
+
+    backend = ShardedBackend()
+    processor = TaskProcessor(backend)
+    for task_id in ("1", "2", "3", "1"):
+        await processor.enqueue(task_id)
+
+    assert backend.published == [
+        (task_id, shard_for(task_id, 4)) for task_id in ("1", "2", "3", "1")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batch_collector_sizes_and_per_item_outcomes():
+    class RecordingMessage(InMemoryMessage):
+        outcome = None
+
+        def process(self):
+            message = self
+
+            class Context:
+                async def __aenter__(self):
+                    return message
+
+                async def __aexit__(self, exc_type, exc, tb):
+                    # Как aio_pika: ошибка — reject, иначе ack
+                    message.outcome = "reject" if exc_type else "ack"
+
+            return Context()
+
+    batches = []
+
+    async def handler(messages):
+        batches.append([m.body for m in messages])
+        return [ValueError("bad") if m.body == b"2" else None for m in messages]
+
+    collector = BatchCollector(handler, max_size=3, max_wait=0.05)
+    messages = [RecordingMessage(str(i).encode(), Priority.MEDIUM) for i in range(1, 5)]
+    results = await asyncio.gather(
+        *(collector.submit(m) for m in messages), return_exceptions=True
+    )
+
+    # Три сообщения ушли сразу по размеру, четвёртое — по таймауту
+    assert batches == [[b"1", b"2", b"3"], [b"4"]]
+    assert [m.outcome for m in messages] == ["ack", "reject", "ack", "ack"]
+    assert isinstance(results[1], ValueError)
+    assert results[0] is None and results[3] is None
+
+
+def test_task_message_round_trip_and_legacy_ids():
+    message = TaskMessage(42, Priority.HIGH, "Resize", "image.png")
+    body = encode_task_message(message)
+    assert decode_task_message(body) == message
+    assert decode_task_message(body).complete
+
+    # Старый формат: только id, приоритет берётся из очереди
+    legacy = decode_task_message(b"42", Priority.LOW)
+    assert (legacy.id, legacy.priority, legacy.complete) == (42, Priority.LOW, False)
+
+    # Поля, добавленные в конец более новым публикатором, игнорируются
+    extended = msgpack.packb([1, 7, "LOW", "t", None, "future field"])
+    assert decode_task_message(extended).id == 7
+
+    for body in (b"abc", msgpack.packb([2, 7, "LOW", "t", None]), b"\x93\x01"):
+        with pytest.raises(ValueError):
+            decode_task_message(body)
+
+
+def test_parse_weights():
+    weights = parse_weights("HIGH:70, MEDIUM:25, low:5")
+    assert weights == {Priority.HIGH: 70, Priority.MEDIUM: 25, Priority.LOW: 5}
+    # Вес 0 означал бы голодание класса
+    with pytest.raises(ValueError):
+        parse_weights("HIGH:70,MEDIUM:30")
+
+
+@pytest.mark.asyncio
+async def test_weighted_fair_dispatcher_shares_slots():
+    gate = asyncio.Event()
+    order = []
+
+    async def handler(message):
+        await gate.wait()
+        order.append(message.priority.value[0])
+
+    dispatcher = WeightedFairDispatcher(
+        handler, parse_weights("HIGH:3,MEDIUM:2,LOW:1"), concurrency=1
+    )
+    priorities = [Priority.HIGH] * 12 + [Priority.MEDIUM] * 12 + [Priority.LOW] * 12
+    submitted = [
+        asyncio.create_task(dispatcher.submit(InMemoryMessage(b"1", priority)))
+        for priority in priorities
+    ]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.wait_for(asyncio.gather(*submitted), timeout=1)
+
+    # Пока заняты все классы, слоты делятся 3:2:1 и LOW не голодает
+    assert "".join(order[:12]) == "HHHMMLHHHMML"
+    assert len(order) == len(priorities)
+
+
+@pytest.mark.asyncio
+async def test_admission_rejects_on_db_latency(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.core.metrics.time.monotonic", lambda: now[0])
+    latency = LatencyTracker(alpha=0.5, window=10)
+    controller = AdmissionController(
+        InMemoryBackend(),
+        max_queue_depth=parse_priority_limits("HIGH:0,MEDIUM:0,LOW:0"),
+        max_db_latency_ms=parse_priority_limits("HIGH:0,MEDIUM:500,LOW:200"),
+        latency=latency,
+        retry_after=5,
+    )
+    latency.observe(0.1)
+    latency.observe(0.5)  # EWMA 300 мс
+    assert await controller.check(Priority.LOW) == 8
+    assert await controller.check(Priority.MEDIUM) is None
+    assert await controller.check(Priority.HIGH) is None
+
+    # Без свежих замеров задержка не считается перегрузкой
+    now[0] += 11
+    assert await controller.check(Priority.LOW) is None
+
+
+def test_adaptive_concurrency_aimd():
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=4,
+        min_limit=1,
+        max_limit=5,
+        max_error_rate=0.1,
+        max_pool_wait_ms=0,
+        latency_tolerance=2.0,
+        pool_wait=LatencyTracker(),
+    )
+    # Все слоты заняты, задержка в норме — аддитивный рост до max_limit
+    for expected in (5, 5):
+        limiter.observe(0.1, error=False, saturated=True)
+        assert limiter.adjust() == expected
+
+    # Задержка выше базовой вдвое — мультипликативный спад
+    limiter.observe(0.5, error=False, saturated=True)
+    assert limiter.adjust() == 3
+
+    # Ошибки — тоже спад, но не ниже min_limit
+    for _ in range(3):
+        limiter.observe(0.1, error=True, saturated=False)
+        limiter.adjust()
+    assert limiter.limit == 1
+
+    # Пустое окно предел не меняет
+    assert limiter.adjust() == 1
+
+
+class FakeQueue:
+    def __init__(self) -> None:
+        self.active: set[str] = set()
+        self.subscriptions = 0
+
+    async def consume(self, callback) -> str:
+        self.subscriptions += 1
+        tag = f"ctag-{self.subscriptions}"
+        self.active.add(tag)
+        return tag
+
+    async def cancel(self, tag: str) -> None:
+        # Отмена уступает циклу событий, как сетевой basic.cancel
+        await asyncio.sleep(0)
+        self.active.discard(tag)
+
+
+class FakeChannel:
+    def __init__(self) -> None:
+        self.qos: list[int] = []
+
+    async def set_qos(self, prefetch_count: int, global_: bool) -> None:
+        self.qos.append(prefetch_count)
+
+
+@pytest.mark.asyncio
+async def test_rabbitmq_resize_resubscribes_only_on_prefetch_change():
+    backend = RabbitMQBackend(shards=1, consume_shards=[0])
+    queue = FakeQueue()
+    backend.queues = {(0, Priority.MEDIUM): queue}
+    backend.legacy_queue = FakeQueue()
+    backend.channel = FakeChannel()
+    backend._initialized = True
+
+    async def handler(message) -> None:
+        pass
+
+    await backend.consume(handler)
+    assert queue.subscriptions == 1
+
+    # Меняется только предел — потребители не трогаются
+    await backend.resize(backend.prefetch + 5, backend.prefetch)
+    assert queue.subscriptions == 1 and backend.channel.qos == []
+
+    await backend.resize(4, backend.prefetch * 2)
+    assert queue.subscriptions == 2 and len(queue.active) == 1
+
+    # Остановка во время переподписки: после неё не остаётся потребителей
+    resizing = asyncio.create_task(backend.resize(4, backend.prefetch * 2))
+    await asyncio.sleep(0)
+    await backend.stop_consuming()
+    await resizing
+    assert queue.active == set() and backend.legacy_queue.active == set()
+
+    # После остановки resize ничего не переподписывает
+    subscriptions = queue.subscriptions
+    await backend.resize(4, backend.prefetch * 2)
+    assert queue.subscriptions == subscriptions and queue.active == set()
+
+
+def test_prefetch_for_rounds_to_power_of_two(monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.QUEUE_PREFETCH", 10)
+    monkeypatch.setattr("app.core.config.settings.MAX_CONCURRENCY", 5)
+    assert [prefetch_for(limit) for limit in range(1, 6)] == [2, 4, 8, 8, 16]
+
+
+@pytest.mark.asyncio
+async def test_readiness_retries_unreachable_queue():
+    class FlakyBackend(InMemoryBackend):
+        attempts = 0
+
+        async def initialize(self):
+            self.attempts += 1
+            if self.attempts < 3:
+                # Первые попытки «зависают» дольше таймаута подключения
+                await asyncio.sleep(10)
+
+    backend = FlakyBackend()
+    connected = asyncio.Event()
+
+    async def on_ready():
+        connected.set()
+
+    readiness = Readiness(TaskProcessor(backend), timeout=0.05, max_interval=0.05)
+    readiness.start(on_queue_ready=on_ready)
+    await asyncio.sleep(0)
+    assert not readiness.queue_ready
+
+    await asyncio.wait_for(connected.wait(), timeout=5)
+    assert readiness.queue_ready and readiness.queue_error is None
+    assert backend.attempts == 3
+    await readiness.stop()
+
+
+def test_event_sampler_rate_limits_info_only(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.core.logging.time.monotonic", lambda: now[0])
+    sampler = EventSampler(
+        sample_rates=parse_event_limits("Received task:0"),
+        rate_limits=parse_event_limits("Task processed:2"),
+    )
+
+    def passed(method, event):
+        try:
+            sampler(None, method, {"event": event})
+        except structlog.DropEvent:
+            return False
+        return True
+
+    assert not passed("info", "Received task")
+    # Предупреждения не прореживаются
+    assert passed("warning", "Received task")
+    assert [passed("info", "Task processed") for _ in range(3)] == [True, True, False]
+    assert passed("info", "Other event")
+
+    # Следующая секунда — новое окно
+    now[0] += 1
+    assert passed("info", "Task processed")